@@ -0,0 +1,328 @@
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from queue import Queue
+
+# Render off-screen through SDL's dummy driver so benchmarks run without a display
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+# Keep benchmark games out of the real score history
+os.environ.setdefault('TETRIS_SCORES_DB', ':memory:')
+
+import pygame
+from network import UDPNetwork
+from tetris_game import TetrisGame
+from session import Session, encode_snapshot, apply_peer_snapshot
+from board_codec import board_rows, encode_board_text
+
+DEFAULT_THRESHOLD = 0.10  # flag results more than 10% slower than the baseline
+
+
+# Network stand-in that drops everything; keeps game benchmarks off the socket
+class NullNetwork:
+    last_sync_frame = 0
+
+    def send_message(self, message, target_address):
+        pass
+
+    def send_to_all(self, message, target_addresses):
+        pass
+
+    def send_sync_frame(self, sync_data, target_address, on_done=None):
+        return True
+
+
+# Network stand-in that keeps the last message of each type, stamped as a session would
+class RecordingNetwork(NullNetwork):
+    def __init__(self):
+        self.sent = {}
+        Session(self)
+
+    def send_message(self, message, target_address):
+        self.session.stamp(message)
+        self.sent[message["type"]] = message
+
+    def send_to_all(self, message, target_addresses):
+        self.send_message(message, target_addresses)
+
+    def send_sync_frame(self, sync_data, target_address, on_done=None):
+        self.send_message(sync_data, target_address)
+        return True
+
+
+# Build a game with a deterministic, half-filled board
+def make_game(seed=1234):
+    random.seed(seed)
+    screen = pygame.Surface((320, 240))
+    game = TetrisGame(screen, NullNetwork(), ('127.0.0.1', 0))
+    for row in range(10, game.PLAYER_DATA[1]['ROWS']):
+        for col in range(game.PLAYER_DATA[1]['COLUMNS']):
+            if random.random() < 0.6:
+                game.p1_grid[row][col] = random.choice(game.SHAPE_COLORS)
+                game.p2_grid[row][col] = game.P2_COLOR
+    game.update_grid_bitmap()
+    return game
+
+
+# Time a callable; returns per-call nanoseconds for each repeat
+def time_calls(func, number, repeat):
+    results = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        for _ in range(number):
+            func()
+        results.append((time.perf_counter_ns() - start) / number)
+    return results
+
+
+def bench_valid_position(game):
+    shape = game.SHAPES[2]
+    return lambda: game.valid_position(game.p1_grid, shape, (4, 5), 1)
+
+
+def bench_clear_lines(game):
+    grid = [row[:] for row in game.p1_grid]
+    for col in range(game.PLAYER_DATA[1]['COLUMNS']):
+        grid[19][col] = game.SHAPE_COLORS[0]
+        grid[18][col] = game.SHAPE_COLORS[1]
+    return lambda: game.clear_lines(grid, 1)
+
+
+def bench_rotate_shape(game):
+    shape = game.SHAPES[3]
+    return lambda: game.rotate_shape(shape)
+
+
+def bench_max_fall_distance(game):
+    shape = game.SHAPES[0]
+    return lambda: game.calculate_max_fall_distance(shape, [3, 0])
+
+
+def bench_update_grid_bitmap(game):
+    return game.update_grid_bitmap
+
+
+def bench_update_p2_grid(game):
+    bitmap = list(game.grid_bitmap)
+    return lambda: game.update_p2_grid(bitmap)
+
+
+def bench_draw(game):
+    return game.draw
+
+
+# Mini-boards of a seven-opponent match where one opponent's board changes per frame
+def bench_draw_opponents(game):
+    game = TetrisGame(game.screen, NullNetwork(), [('127.0.0.1', port) for port in range(1, 8)])
+    for opponent in game.opponents:
+        opponent.grid = [row[:] for row in game.opponents[0].grid]
+    changed = iter(range(10 ** 9))
+
+    def draw():
+        game.opponents[next(changed) % len(game.opponents)].version += 1
+        game.draw_opponents()
+    return draw
+
+
+# Color board of a sync frame, as a keyframe
+def bench_board_encode(game):
+    return lambda: encode_board_text(board_rows(game.p1_grid, game.color_index))
+
+
+# Apply an opponent's color board from a sync frame
+def bench_board_apply(game):
+    message = {"frame_number": 1, "board": encode_board_text(board_rows(game.p1_grid, game.color_index))}
+    opponent = game.opponents[0]
+
+    def apply():
+        opponent.grid = game.create_grid(2)
+        game.apply_p2_board(message, opponent)
+    return apply
+
+
+def bench_snapshot_encode(game):
+    return lambda: encode_snapshot(game)
+
+
+def bench_snapshot_apply(game):
+    data = encode_snapshot(game)
+    return lambda: apply_peer_snapshot(game, data)
+
+
+# The game's own game_state or sync_frame message, as it goes on the wire
+def wire_message(game, message_type):
+    network = RecordingNetwork()
+    game.network = network
+    if message_type == 'game_state':
+        off_x, off_y = game.shape_pos
+        game.send_game_state([(x + off_x, y + off_y) for y, row in enumerate(game.p1_current_shape)
+                              for x, cell in enumerate(row) if cell])
+    else:
+        game.send_sync_frame()
+    return network.sent[message_type]
+
+
+# JSON encoding and decoding on their own, apart from the socket in network_roundtrip
+def bench_json_dumps(message_type):
+    def factory(game):
+        message = wire_message(game, message_type)
+        return lambda: json.dumps(message).encode()
+    return factory
+
+
+def bench_json_loads(message_type):
+    def factory(game):
+        data = json.dumps(wire_message(game, message_type)).encode()
+        return lambda: json.loads(data.decode())
+    return factory
+
+
+# Benchmarks that take a prepared game and return the callable to time
+MICRO_BENCHMARKS = {
+    'valid_position': (bench_valid_position, 20000),
+    'clear_lines': (bench_clear_lines, 5000),
+    'rotate_shape': (bench_rotate_shape, 20000),
+    'calculate_max_fall_distance': (bench_max_fall_distance, 5000),
+    'update_grid_bitmap': (bench_update_grid_bitmap, 5000),
+    'update_p2_grid': (bench_update_p2_grid, 5000),
+    'draw': (bench_draw, 200),
+    'draw_opponents': (bench_draw_opponents, 2000),
+    'board_encode': (bench_board_encode, 5000),
+    'board_apply': (bench_board_apply, 5000),
+    'snapshot_encode': (bench_snapshot_encode, 5000),
+    'snapshot_apply': (bench_snapshot_apply, 5000),
+    'json_dumps_game_state': (bench_json_dumps('game_state'), 20000),
+    'json_loads_game_state': (bench_json_loads('game_state'), 20000),
+    'json_dumps_sync_frame': (bench_json_dumps('sync_frame'), 20000),
+    'json_loads_sync_frame': (bench_json_loads('sync_frame'), 20000),
+}
+
+
+# Round-trip a game_state message through UDPNetwork over loopback
+def bench_network_roundtrip(number, repeat):
+    sender = UDPNetwork('127.0.0.1', 0)
+    receiver = UDPNetwork('127.0.0.1', 0)
+    target = receiver.sock.getsockname()
+    message = {
+        "type": "game_state",
+        "frame_number": 42,
+        "piece_coordinates": [(4, 18), (5, 18), (5, 19), (6, 19)],
+        "next_shape": 3
+    }
+
+    def roundtrip():
+        sender.send_message(message, target)
+        receiver.receive_message()
+
+    try:
+        return time_calls(roundtrip, number, repeat)
+    finally:
+        sender.close()
+        receiver.close()
+
+
+# Play scripted headless games to completion and report simulation ticks per second
+def bench_full_game(games=3, seed=99):
+    rates = []
+    for game_index in range(games):
+        game = make_game(seed + game_index)
+        game.p1_grid = game.create_grid(1)
+        rng = random.Random(seed + game_index)
+        actions = ['rotate', 'move_left', 'move_right', 'hard_drop', None, None, None]
+        queue = Queue()
+        ticks = 0
+        start = time.perf_counter_ns()
+        while not game.game_over and ticks < 100000:
+            action = rng.choice(actions)
+            if action:
+                game.button_queue.push(action)
+            game.update(queue)
+            ticks += 1
+        elapsed = time.perf_counter_ns() - start
+        rates.append(elapsed / ticks)
+    return rates
+
+
+# Run every benchmark matching the filter and return a results dict
+def run_benchmarks(repeat=5, name_filter=None):
+    pygame.init()
+    pygame.display.set_mode((320, 240))
+    results = {}
+
+    def record(name, samples, unit='ns/op'):
+        results[name] = {
+            'median': statistics.median(samples),
+            'min': min(samples),
+            'unit': unit,
+        }
+        print(f"{name:<30} {results[name]['median']:>12.0f} {unit}")
+
+    for name, (factory, number) in MICRO_BENCHMARKS.items():
+        if name_filter and name_filter not in name:
+            continue
+        game = make_game()
+        record(name, time_calls(factory(game), number, repeat))
+
+    if not name_filter or name_filter in 'network_roundtrip':
+        record('network_roundtrip', bench_network_roundtrip(2000, repeat))
+    if not name_filter or name_filter in 'full_game':
+        record('full_game', bench_full_game(), unit='ns/tick')
+
+    pygame.quit()
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'pygame': pygame.version.ver,
+            'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+        },
+        'results': results,
+    }
+
+
+# Compare results against a baseline; returns the names that regressed
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    regressions = []
+    for name, current in results['results'].items():
+        previous = baseline['results'].get(name)
+        if not previous:
+            print(f"{name:<30} (new)")
+            continue
+        change = current['median'] / previous['median'] - 1
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f"{name:<30} {previous['median']:>12.0f} -> {current['median']:>12.0f} ({change:+.1%}){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tetris micro and end-to-end benchmarks")
+    parser.add_argument('--output', help="write results as JSON to this file")
+    parser.add_argument('--compare', help="baseline JSON file to compare against")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="relative slowdown that counts as a regression (default 0.10)")
+    parser.add_argument('--repeat', type=int, default=5, help="repeats per benchmark")
+    parser.add_argument('--filter', help="only run benchmarks whose name contains this")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.repeat, args.filter)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        print()
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import base64
+from spectator import ROWS, COLUMNS
+
+# Color mirror of a board for sync frames. Each cell is a 3-bit index: 0 for empty,
+# 1-7 for SHAPE_COLORS. A board is a 3-byte mask of the rows that differ from a
+# reference board (an empty board for a keyframe), followed by each of those rows.
+# A row is either a sequence of run bytes (0ccc llll: color, run length - 1) adding up to
+# COLUMNS cells, or, when that would be longer, 4 raw bytes with the top bit set and the
+# cells packed 3 bits each into the low 30 bits, first column highest. A full board of
+# scattered colors is at most 83 bytes; a typical board with a few busy rows is 10-30.
+MASK_BYTES = 3
+RAW_FLAG = 0x80000000
+RAW_BYTES = 4
+EMPTY_ROW = (0,) * COLUMNS
+EMPTY_BOARD = (EMPTY_ROW,) * ROWS
+
+
+# Board rows as tuples of color indices; colors outside the palette count as the first
+# shape color so occupancy is never lost
+def board_rows(grid, color_index):
+    get = color_index.get
+    return tuple(tuple(get(cell, 1) for cell in row) for row in grid)
+
+
+# Color index of every shape color; black is empty
+def color_indices(game):
+    indices = {color: i + 1 for i, color in enumerate(game.SHAPE_COLORS)}
+    indices[game.BLACK] = 0
+    return indices
+
+
+def encode_row(row):
+    runs = bytearray()
+    start = 0
+    for col in range(1, COLUMNS + 1):
+        if col == COLUMNS or row[col] != row[start]:
+            runs.append(row[start] << 4 | (col - start - 1))
+            start = col
+    if len(runs) <= RAW_BYTES:
+        return bytes(runs)
+    bits = 0
+    for cell in row:
+        bits = bits << 3 | cell
+    return (RAW_FLAG | bits).to_bytes(RAW_BYTES, 'big')
+
+
+# Decode one row at offset; returns the row and the offset after it
+def decode_row(data, offset):
+    if data[offset] & 0x80:
+        bits = int.from_bytes(data[offset:offset + RAW_BYTES], 'big')
+        return tuple(bits >> (3 * (COLUMNS - 1 - col)) & 7 for col in range(COLUMNS)), offset + RAW_BYTES
+    row = []
+    while len(row) < COLUMNS:
+        run = data[offset]
+        row.extend((run >> 4,) * ((run & 0x0F) + 1))
+        offset += 1
+    if len(row) != COLUMNS:
+        raise ValueError("row runs overflow the board width")
+    return tuple(row), offset
+
+
+# Encode rows against a reference board; only the rows that differ are sent
+def encode_board(rows, reference=EMPTY_BOARD):
+    mask = 0
+    parts = []
+    for i, (row, old) in enumerate(zip(rows, reference)):
+        if row != old:
+            mask |= 1 << i
+            parts.append(encode_row(row))
+    return mask.to_bytes(MASK_BYTES, 'little') + b''.join(parts)
+
+
+# Decode a board encoded against reference; returns the rows and the mask of changed rows
+def decode_board(data, reference=EMPTY_BOARD):
+    mask = int.from_bytes(data[:MASK_BYTES], 'little')
+    rows = list(reference)
+    offset = MASK_BYTES
+    for i in range(ROWS):
+        if mask & (1 << i):
+            rows[i], offset = decode_row(data, offset)
+    return tuple(rows), mask
+
+
+# Text form for JSON messages
+def encode_board_text(rows, reference=EMPTY_BOARD):
+    return base64.b64encode(encode_board(rows, reference)).decode('ascii')
+
+
+def decode_board_text(text, reference=EMPTY_BOARD):
+    return decode_board(base64.b64decode(text), reference)
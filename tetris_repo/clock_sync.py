@@ -0,0 +1,111 @@
+import threading
+import time
+from collections import deque
+
+SAMPLE_WINDOW = 64      # ping/pong exchanges kept for the estimate
+BURST_PINGS = 8         # quick pings sent right after connecting
+BURST_INTERVAL = 0.1    # seconds between burst pings
+PING_INTERVAL = 2.0     # seconds between pings once the burst is done
+MIN_DRIFT_SPAN = 10.0   # seconds of samples needed before drift is estimated
+MAX_DRIFT = 500e-6      # clamp the drift estimate to +-500 ppm
+
+
+# NTP-style offset and drift estimator for the peer's clock, measured over the game's
+# UDP channel. Each exchange records four timestamps:
+#   t0 ping sent (local)   t1 ping received (peer)   t2 pong sent (peer)   t3 pong received (local)
+# giving offset = ((t1 - t0) + (t2 - t3)) / 2 and round-trip delay = (t3 - t0) - (t2 - t1).
+# The exchanges with the lowest delay are the least distorted by queueing; the offset
+# comes from those, and once they span long enough a least-squares fit adds the drift.
+#
+# The match clock is the midpoint of the two cabinets' clocks. Both peers arrive at the
+# same value without electing a leader: local + offset / 2 on one side equals
+# peer + (-offset) / 2 on the other. A match of three or more cabinets has no midpoint;
+# they all follow one reference cabinet instead (share 1 of its offset, or 0 on the
+# reference itself, which then pings nobody).
+class ClockSync:
+    def __init__(self, network, time_source=time.monotonic):
+        self.network = network
+        self.time_source = time_source
+        self.samples = deque(maxlen=SAMPLE_WINDOW)  # (t3, offset, delay)
+        self.lock = threading.Lock()
+        self.offset = 0.0
+        self.drift = 0.0
+        self.reference = 0.0
+        self.peer = None
+        self.share = 0.5  # fraction of the peer's offset applied to the match clock
+        self.stopped = threading.Event()
+        self.thread = None
+
+    @property
+    def synced(self):
+        return bool(self.samples)
+
+    # Start pinging the peer from a background thread
+    def start(self, peer, share=0.5):
+        if peer != self.peer:
+            with self.lock:
+                self.samples.clear()
+                self.offset = self.drift = self.reference = 0.0
+        self.peer = peer
+        self.share = share
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def run(self):
+        sent = 0
+        while not self.stopped.is_set():
+            self.ping()
+            sent += 1
+            self.stopped.wait(BURST_INTERVAL if sent < BURST_PINGS else PING_INTERVAL)
+
+    def ping(self):
+        if self.peer is None:
+            return
+        self.network.send_message({"type": "clock_ping", "t0": self.time_source()}, self.peer)
+
+    # Answer a peer's ping; called from the network thread as soon as it arrives
+    def handle_ping(self, message, addr):
+        received = self.time_source()
+        self.network.send_message({"type": "clock_pong", "t0": message["t0"], "t1": received,
+                                   "t2": self.time_source()}, addr)
+
+    # Fold the answer to one of our pings into the estimate
+    def handle_pong(self, message):
+        t3 = self.time_source()
+        t0, t1, t2 = message["t0"], message["t1"], message["t2"]
+        offset = ((t1 - t0) + (t2 - t3)) / 2
+        delay = (t3 - t0) - (t2 - t1)
+        with self.lock:
+            self.samples.append((t3, offset, max(0.0, delay)))
+            self.estimate()
+
+    # Recompute offset and drift from the lowest-delay quarter of the samples
+    def estimate(self):
+        best = sorted(self.samples, key=lambda sample: sample[2])[:max(1, len(self.samples) // 4)]
+        if len(best) < 4 or max(s[0] for s in best) - min(s[0] for s in best) < MIN_DRIFT_SPAN:
+            self.reference, self.offset, _ = best[0]
+            self.drift = 0.0
+            return
+        mean_t = sum(s[0] for s in best) / len(best)
+        mean_offset = sum(s[1] for s in best) / len(best)
+        variance = sum((s[0] - mean_t) ** 2 for s in best)
+        covariance = sum((s[0] - mean_t) * (s[1] - mean_offset) for s in best)
+        self.reference = mean_t
+        self.offset = mean_offset
+        self.drift = max(-MAX_DRIFT, min(MAX_DRIFT, covariance / variance))
+
+    # Estimated (peer clock - local clock) at local time now
+    def peer_offset(self, now=None):
+        if now is None:
+            now = self.time_source()
+        with self.lock:
+            return self.offset + self.drift * (now - self.reference)
+
+    # Current time on the shared match clock, in seconds
+    def match_time(self):
+        now = self.time_source()
+        return now + self.peer_offset(now) * self.share
+
+    def stop(self):
+        self.stopped.set()
@@ -0,0 +1,178 @@
+import base64
+import heapq
+import random
+import struct
+
+# How a new effect combines with an active one of the same type
+STACK_REFRESH = 0      # restart the active effect's duration from the new start time, never shortening it
+STACK_EXTEND = 1       # add the new duration to the active effect's remaining time
+STACK_INDEPENDENT = 2  # run alongside the active effect with its own deadline
+
+# type id, start time on the match clock, duration in seconds, random seed
+EFFECT = struct.Struct('<Bdfl')
+
+
+# One kind of effect. apply(game, effect) runs when it starts; expire(game, effect) runs
+# exactly once when it ends. Effects without a duration are instant and never expire.
+class EffectType:
+    def __init__(self, type_id, name, apply, expire=None, duration=0.0, stacking=STACK_REFRESH):
+        self.type_id = type_id
+        self.name = name
+        self.apply = apply
+        self.expire = expire
+        self.duration = duration
+        self.stacking = stacking
+
+
+# Registry of effect types by id and by name
+EFFECT_TYPES = {}
+EFFECTS_BY_NAME = {}
+
+
+def register_effect(effect_type):
+    EFFECT_TYPES[effect_type.type_id] = effect_type
+    EFFECTS_BY_NAME[effect_type.name] = effect_type
+    return effect_type
+
+
+# An activation of an effect type. The seed drives any randomness so the same effect
+# plays out identically on both cabinets and in replays.
+class Effect:
+    def __init__(self, type_id, started_at, duration, seed):
+        self.type_id = type_id
+        self.started_at = started_at
+        self.duration = duration
+        self.seed = seed
+        self.expires_at = started_at + duration
+        self.active = False
+
+    @classmethod
+    def create(cls, name, started_at, seed=None):
+        effect_type = EFFECTS_BY_NAME[name]
+        if seed is None:
+            seed = random.getrandbits(31)
+        return cls(effect_type.type_id, started_at, effect_type.duration, seed)
+
+    @property
+    def type(self):
+        return EFFECT_TYPES[self.type_id]
+
+    def pack(self):
+        return EFFECT.pack(self.type_id, self.started_at, self.duration, self.seed)
+
+    @classmethod
+    def unpack(cls, data, offset=0):
+        return cls(*EFFECT.unpack_from(data, offset))
+
+    # Text form for JSON messages
+    def encode(self):
+        return base64.b64encode(self.pack()).decode('ascii')
+
+    @classmethod
+    def decode(cls, text):
+        return cls.unpack(base64.b64decode(text))
+
+
+# Pack a list of effects into bytes, e.g. for a replay or a state snapshot
+def pack_effects(effects):
+    return struct.pack('<B', len(effects)) + b''.join(effect.pack() for effect in effects)
+
+
+def unpack_effects(data):
+    count = data[0]
+    return [Effect.unpack(data, 1 + i * EFFECT.size) for i in range(count)]
+
+
+# Active effects on one game, with their deadlines in a heap. update() only looks at
+# the earliest deadline, so a frame with nothing expiring costs one comparison.
+class EffectScheduler:
+    def __init__(self, game):
+        self.game = game
+        self.heap = []  # (expires_at, sequence, effect)
+        self.active = {}  # type id -> list of active effects
+        self.sequence = 0
+
+    # Start an effect, combining it with an active one of the same type per its stacking rule
+    def activate(self, effect):
+        effect_type = effect.type
+        current = self.active.get(effect.type_id)
+        if current and effect_type.stacking != STACK_INDEPENDENT:
+            running = current[0]
+            if effect_type.stacking == STACK_EXTEND:
+                running.expires_at += effect.duration
+            else:
+                running.expires_at = max(running.expires_at, effect.expires_at)
+            self.schedule(running)
+            return running
+
+        effect_type.apply(self.game, effect)
+        if effect.duration > 0 and effect_type.expire:
+            effect.active = True
+            self.active.setdefault(effect.type_id, []).append(effect)
+            self.schedule(effect)
+        return effect
+
+    def schedule(self, effect):
+        self.sequence += 1
+        heapq.heappush(self.heap, (effect.expires_at, self.sequence, effect))
+
+    # Expire every effect whose deadline has passed
+    def update(self, now):
+        heap = self.heap
+        while heap and heap[0][0] <= now:
+            expires_at, _, effect = heapq.heappop(heap)
+            # Entries left behind when an effect was refreshed or extended are skipped
+            if not effect.active or expires_at != effect.expires_at:
+                continue
+            effect.active = False
+            self.active[effect.type_id].remove(effect)
+            if not self.active[effect.type_id]:
+                del self.active[effect.type_id]
+            effect.type.expire(self.game, effect)
+
+    def active_effects(self):
+        return [effect for effects in self.active.values() for effect in effects]
+
+
+# Sabotage effects, indexed by the sabotage number sent over the network
+
+def randomize_piece(game, effect):
+    rng = random.Random(effect.seed)
+    shape = rng.choice(game.SHAPES)
+    color = rng.choice(game.SHAPE_COLORS)
+    # A wider shape may not fit where the piece is; it would lock outside the grid
+    if game.valid_position(game.p1_grid, shape, game.shape_pos, 1):
+        game.p1_current_shape = shape
+        game.p1_current_color = color
+
+
+SPEED_UP_FRAMES = 15  # fewer frames per gravity step while sped up
+
+
+def speed_up(game, effect):
+    game.original_frames_per_move = max(1, game.base_frames_per_move - SPEED_UP_FRAMES)
+    if game.frames_per_move != 1:  # leave a hard drop in progress alone
+        game.frames_per_move = game.original_frames_per_move
+
+
+def restore_speed(game, effect):
+    game.original_frames_per_move = game.base_frames_per_move
+    if game.frames_per_move != 1:
+        game.frames_per_move = game.original_frames_per_move
+
+
+def scramble_controls(game, effect):
+    actions = list(game.control_mapping.values())
+    random.Random(effect.seed).shuffle(actions)
+    game.control_mapping = dict(zip(game.control_mapping.keys(), actions))
+
+
+def unscramble_controls(game, effect):
+    game.reset_control_mapping()
+
+
+register_effect(EffectType(0, 'randomize_piece', randomize_piece))
+register_effect(EffectType(1, 'speed_up', speed_up, restore_speed, duration=10.0))
+register_effect(EffectType(2, 'scramble_controls', scramble_controls, unscramble_controls, duration=40.0))
+
+SABOTAGE_EFFECTS = ('randomize_piece', 'speed_up', 'scramble_controls')
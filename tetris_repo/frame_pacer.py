@@ -0,0 +1,45 @@
+import threading
+import pygame
+
+# Custom event posted to wake the main loop from other threads
+WAKEUP_EVENT = pygame.USEREVENT + 1
+
+# Longest a static screen sleeps without a wakeup before redrawing anyway
+IDLE_TIMEOUT = 1.0
+
+
+# On-demand frame pacing. Animating screens are paced by the render clock as before;
+# static screens block until input, a network message or the idle timeout arrives.
+class FramePacer:
+    def __init__(self, use_pygame_events=True, idle_timeout=IDLE_TIMEOUT):
+        self.use_pygame_events = use_pygame_events
+        self.idle_timeout = idle_timeout
+        self.wakeup = threading.Event()
+        self.idle_waits = 0  # static frames that slept instead of redrawing, read by the metrics
+
+    # Wake the main loop; safe to call from GPIO callbacks and network threads
+    def notify(self):
+        self.wakeup.set()
+        if self.use_pygame_events:
+            try:
+                pygame.event.post(pygame.event.Event(WAKEUP_EVENT))
+            except pygame.error:
+                pass
+
+    # Block until something happens that could change a static screen, or until
+    # timeout seconds pass when the screen has a timer of its own
+    def wait(self, timeout=None):
+        if self.wakeup.is_set():
+            self.wakeup.clear()
+            return
+        self.idle_waits += 1
+        if timeout is None or timeout > self.idle_timeout:
+            timeout = self.idle_timeout
+        if self.use_pygame_events:
+            event = pygame.event.wait(max(1, int(timeout * 1000)))
+            if event.type not in (pygame.NOEVENT, WAKEUP_EVENT):
+                # Leave real events for the main loop to handle
+                pygame.event.post(event)
+        else:
+            self.wakeup.wait(timeout)
+        self.wakeup.clear()
@@ -0,0 +1,66 @@
+import time
+
+SIMULATION_HZ = 60
+
+
+# Fixed-timestep accumulator. Each rendered frame asks how many simulation ticks are
+# due based on monotonic time, so game speed does not depend on the render rate.
+class FixedStepClock:
+    def __init__(self, tick_rate=SIMULATION_HZ, max_ticks_per_frame=5, time_source=time.monotonic):
+        self.tick_rate = tick_rate
+        self.step = 1.0 / tick_rate
+        self.max_ticks_per_frame = max_ticks_per_frame
+        self.time_source = time_source
+        self.accumulator = 0.0
+        self.last_time = None
+        self.total_ticks = 0
+        self.dropped_ticks = 0
+
+    # Forget accumulated time, e.g. after a blocking countdown or a pause
+    def reset(self):
+        self.accumulator = 0.0
+        self.last_time = self.time_source()
+
+    # Return the number of simulation ticks to run for this frame
+    def ticks_due(self):
+        now = self.time_source()
+        if self.last_time is None:
+            self.last_time = now
+            return 1
+        self.accumulator += now - self.last_time
+        self.last_time = now
+
+        ticks = int(self.accumulator / self.step)
+        if ticks > self.max_ticks_per_frame:
+            # Too far behind to catch up without a visible burst; drop the backlog
+            self.dropped_ticks += ticks - self.max_ticks_per_frame
+            ticks = self.max_ticks_per_frame
+            self.accumulator = 0.0
+        else:
+            self.accumulator -= ticks * self.step
+        self.total_ticks += ticks
+        return ticks
+
+
+# Chooses a render rate from a ladder of targets based on how long frames take to
+# produce, so a loaded device degrades to 30 or 20 FPS instead of dropping frames.
+class AdaptiveFrameRate:
+    def __init__(self, rates=(60, 30, 20), smoothing=0.1):
+        self.rates = rates
+        self.level = 0
+        self.smoothing = smoothing
+        self.average_work = 0.0
+
+    @property
+    def fps(self):
+        return self.rates[self.level]
+
+    # Record the time spent producing a frame (excluding the sleep) and adjust the rate
+    def record(self, work_seconds):
+        self.average_work += (work_seconds - self.average_work) * self.smoothing
+        budget = 1.0 / self.fps
+        if self.average_work > budget * 0.8 and self.level < len(self.rates) - 1:
+            self.level += 1
+        elif self.level > 0 and self.average_work < 0.4 / self.rates[self.level - 1]:
+            self.level -= 1
+        return self.fps
@@ -0,0 +1,86 @@
+import time
+
+CELL_SIZE = 10        # pixels per grid cell for drag quantization (player 1 GRID_SIZE)
+TAP_SLOP = 8          # max movement in pixels for a touch to still count as a tap
+TAP_MAX_MS = 300      # max press duration for a tap
+SWIPE_DISTANCE = 40   # vertical travel in pixels that makes a swipe
+SWIPE_MAX_MS = 400    # a swipe must cover SWIPE_DISTANCE within this time
+
+
+# Turns raw touch reports into game actions on the touchscreen reader thread:
+#   tap               -> rotate
+#   horizontal drag   -> move_left / move_right, one per cell travelled
+#   swipe down        -> hard_drop
+#   swipe up          -> sabotage
+# Each decision is made on the report that crosses its threshold and pushed straight
+# to the sink, bypassing the pygame event queue.
+class GestureRecognizer:
+    def __init__(self, sink, affine, cell_size=CELL_SIZE):
+        self.sink = sink  # callable(action, timestamp_ns)
+        self.affine = affine
+        self.cell_size = cell_size
+        self.down = False
+        self.start = (0, 0)
+        self.start_ns = 0
+        self.anchor_x = 0
+        self.dragged = False
+        self.swiped = False
+        self.last = (0, 0)
+
+    # Map raw touchscreen coordinates to screen pixels
+    def to_screen(self, x, y):
+        a, b, c, d, tx, ty = self.affine
+        return a * x + b * y + tx, c * x + d * y + ty
+
+    # Feed one TouchSample (called at every SYN_REPORT)
+    def feed(self, sample):
+        if sample.touch == 0:
+            self.release(sample)
+            return
+        if sample.x is None or sample.y is None:
+            return
+        pos = self.to_screen(sample.x, sample.y)
+        if not self.down:
+            self.down = True
+            self.start = pos
+            self.last = pos
+            self.start_ns = sample.captured
+            self.anchor_x = pos[0]
+            self.dragged = False
+            self.swiped = False
+            return
+        self.last = pos
+        if self.swiped:
+            return
+
+        # Horizontal drag: one move per whole cell travelled since the last move
+        dx = pos[0] - self.anchor_x
+        while dx >= self.cell_size:
+            self.sink('move_right', sample.captured)
+            self.anchor_x += self.cell_size
+            dx -= self.cell_size
+            self.dragged = True
+        while dx <= -self.cell_size:
+            self.sink('move_left', sample.captured)
+            self.anchor_x -= self.cell_size
+            dx += self.cell_size
+            self.dragged = True
+
+        # Vertical swipe, only when it is not part of a horizontal drag
+        dy = pos[1] - self.start[1]
+        elapsed_ms = (sample.captured - self.start_ns) / 1e6
+        if not self.dragged and elapsed_ms <= SWIPE_MAX_MS and abs(dy) >= SWIPE_DISTANCE:
+            self.sink('hard_drop' if dy > 0 else 'sabotage', sample.captured)
+            self.swiped = True
+
+    # End of touch: a short, still press is a tap
+    def release(self, sample):
+        if not self.down:
+            return
+        self.down = False
+        if self.dragged or self.swiped:
+            return
+        moved = max(abs(self.last[0] - self.start[0]), abs(self.last[1] - self.start[1]))
+        duration_ms = ((sample.captured or time.monotonic_ns()) - self.start_ns) / 1e6
+        if moved <= TAP_SLOP and duration_ms <= TAP_MAX_MS:
+            self.sink('rotate', sample.captured)
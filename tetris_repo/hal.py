@@ -0,0 +1,248 @@
+import os
+import threading
+import time
+import pygame
+
+# Buttons every input backend provides, matching the GPIO wiring in main.py
+BUTTONS = ('quit', 'rotate', 'down', 'left', 'right', 'sabotage')
+
+# Keyboard layout for the simulated cabinet
+KEYBOARD_BUTTONS = {
+    pygame.K_ESCAPE: 'quit',
+    pygame.K_UP: 'rotate',
+    pygame.K_DOWN: 'down',
+    pygame.K_LEFT: 'left',
+    pygame.K_RIGHT: 'right',
+    pygame.K_SPACE: 'sabotage',
+    pygame.K_2: 'next_target',
+}
+
+SCREEN_SIZE = (320, 240)
+
+
+# Buttons wired to GPIO pins; RPi.GPIO is only imported when this backend is chosen.
+# With fifo_dir the pins are FIFOs read by the input reactor, so this runs off-device
+# without RPi.GPIO; a FIFO has no level to poll, so held buttons do not auto-repeat.
+class PiInput:
+    def __init__(self, pins, fifo_dir=None):
+        self.pins = pins
+        self.fifo_dir = fifo_dir
+        self.GPIO = None
+        if fifo_dir:
+            return
+        import RPi.GPIO as GPIO
+        self.GPIO = GPIO
+        GPIO.setmode(GPIO.BCM)
+        for pin in pins.values():
+            GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+
+    # Call callback(channel) on each press; uses the input reactor when one is given
+    def register(self, name, callback, bouncetime=0, reactor=None):
+        GPIO = self.GPIO
+        if reactor:
+            reactor.add_gpio(self.pins[name], callback, bouncetime, self.fifo_dir)
+        elif GPIO is None:
+            raise ValueError("GPIO FIFOs are only read by the input reactor (TETRIS_INPUT_REACTOR=on)")
+        elif bouncetime:
+            GPIO.add_event_detect(self.pins[name], GPIO.FALLING, callback=callback, bouncetime=bouncetime)
+        else:
+            GPIO.add_event_detect(self.pins[name], GPIO.FALLING, callback=callback)
+
+    def is_pressed(self, name):
+        return self.GPIO is not None and not self.GPIO.input(self.pins[name])
+
+    def start(self):
+        pass
+
+    # Pygame events are not used for buttons on the cabinet
+    def handle_event(self, event):
+        pass
+
+    def close(self):
+        if self.GPIO is not None:
+            self.GPIO.cleanup()
+
+
+# Keyboard stand-in for the buttons; events arrive through the main loop's event pump
+class KeyboardInput:
+    def __init__(self, keys=KEYBOARD_BUTTONS):
+        self.keys = keys
+        self.callbacks = {}
+
+    def register(self, name, callback, bouncetime=0, reactor=None):
+        self.callbacks[name] = callback
+
+    def start(self):
+        pass
+
+    def is_pressed(self, name):
+        pressed = pygame.key.get_pressed()
+        return any(pressed[key] for key, button in self.keys.items() if button == name)
+
+    def handle_event(self, event):
+        if event.type == pygame.KEYDOWN and event.key in self.keys:
+            callback = self.callbacks.get(self.keys[event.key])
+            if callback:
+                callback(event.key)
+
+    def close(self):
+        pass
+
+
+# Replays a script of button presses from a background thread. Each line of the script
+# is "<seconds since start> <button>", e.g. "1.5 rotate"; blank lines and # comments
+# are ignored.
+class ScriptedInput:
+    def __init__(self, path, time_source=time.monotonic):
+        self.callbacks = {}
+        self.steps = []
+        self.time_source = time_source
+        self.stopped = threading.Event()
+        with open(path) as file:
+            for line in file:
+                line = line.split('#', 1)[0].strip()
+                if line:
+                    at, name = line.split()
+                    self.steps.append((float(at), name))
+        self.steps.sort()
+        self.thread = threading.Thread(target=self.play, daemon=True)
+
+    def register(self, name, callback, bouncetime=0, reactor=None):
+        self.callbacks[name] = callback
+
+    def start(self):
+        self.thread.start()
+
+    def play(self):
+        start = self.time_source()
+        for at, name in self.steps:
+            delay = at - (self.time_source() - start)
+            if delay > 0 and self.stopped.wait(delay):
+                return
+            callback = self.callbacks.get(name)
+            if callback:
+                callback(name)
+
+    def is_pressed(self, name):
+        return False
+
+    def handle_event(self, event):
+        pass
+
+    def close(self):
+        self.stopped.set()
+
+
+# PiTFT framebuffer display with the evdev touchscreen
+class PiDisplay:
+    def __init__(self):
+        # Set up environment variables for Raspberry Pi display
+        os.putenv('SDL_VIDEODRV', 'fbcon')
+        os.putenv('SDL_FBDEV', '/dev/fb0')
+        os.putenv('SDL_MOUSEDRV', 'dummy')
+        os.putenv('SDL_MOUSEDEV', '/dev/null')
+        os.putenv('DISPLAY', '')
+        self.pitft = None
+
+    # Open the display after pygame.init(); returns the screen surface
+    def open(self, reactor=None):
+        import pigame
+        self.pitft = pigame.PiTft(reactor=reactor)
+        screen = pygame.display.set_mode(SCREEN_SIZE)
+        pygame.display.set_caption("Tetris - Multiplayer")
+        return screen
+
+    def add_gesture_recognizer(self, sink):
+        return self.pitft.add_gesture_recognizer(sink)
+
+    # Post this frame's batch of touch events
+    def update(self):
+        self.pitft.update()
+
+
+# Desktop window, or SDL's dummy driver when headless
+class SimDisplay:
+    def __init__(self, headless=True):
+        self.headless = headless
+        if headless:
+            os.environ['SDL_VIDEODRIVER'] = 'dummy'
+
+    def open(self, reactor=None):
+        screen = pygame.display.set_mode(SCREEN_SIZE)
+        pygame.display.set_caption("Tetris - Multiplayer")
+        return screen
+
+    def add_gesture_recognizer(self, sink):
+        return None
+
+    def update(self):
+        pass
+
+
+# Wall-clock frame pacing
+class RealClock:
+    virtual = False
+
+    def __init__(self):
+        self.clock = pygame.time.Clock()
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def tick(self, fps):
+        return self.clock.tick(fps)
+
+
+# Virtual time that advances one frame per tick without sleeping, so headless runs
+# play as fast as the CPU allows while the game still sees a steady frame rate
+class VirtualClock:
+    virtual = True
+
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def tick(self, fps):
+        self.now += 1.0 / fps
+        return int(1000 / fps)
+
+
+class Backends:
+    def __init__(self, name, input_backend, display, clock):
+        self.name = name
+        self.input = input_backend
+        self.display = display
+        self.clock = clock
+
+
+# Build the backends chosen by configuration:
+#   TETRIS_BACKEND  pi (default) or sim
+#   TETRIS_INPUT    gpio, keyboard or script:<path>
+#   TETRIS_DISPLAY  pitft, window or dummy
+#   TETRIS_CLOCK    real or virtual
+def load_backends(pins, fifo_dir=None):
+    name = os.getenv('TETRIS_BACKEND') or 'pi'
+    simulated = name == 'sim'
+    input_name = os.getenv('TETRIS_INPUT') or ('keyboard' if simulated else 'gpio')
+    clock_name = os.getenv('TETRIS_CLOCK') or 'real'
+
+    if input_name == 'gpio':
+        input_backend = PiInput(pins, fifo_dir)
+    elif input_name.startswith('script:'):
+        input_backend = ScriptedInput(input_name[len('script:'):])
+    else:
+        input_backend = KeyboardInput()
+
+    clock = VirtualClock() if clock_name == 'virtual' else RealClock()
+    return Backends(name, input_backend, load_display(), clock)
+
+
+# Build the display backend on its own (the split-mode renderer process only needs this)
+def load_display():
+    default = 'dummy' if os.getenv('TETRIS_BACKEND') == 'sim' else 'pitft'
+    display_name = os.getenv('TETRIS_DISPLAY') or default
+    if display_name == 'pitft':
+        return PiDisplay()
+    return SimDisplay(headless=display_name == 'dummy')
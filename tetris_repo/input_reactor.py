@@ -0,0 +1,134 @@
+import os
+import select
+import threading
+import time
+
+SYSFS_GPIO = '/sys/class/gpio'
+
+
+# Edge source backed by the sysfs GPIO interface; the kernel signals edges with POLLPRI
+class SysfsGpioSource:
+    events = select.EPOLLPRI | select.EPOLLERR
+
+    def __init__(self, pin, edge='falling'):
+        self.pin = pin
+        base = f'{SYSFS_GPIO}/gpio{pin}'
+        if not os.path.exists(base):
+            with open(f'{SYSFS_GPIO}/export', 'w') as file:
+                file.write(str(pin))
+        with open(f'{base}/direction', 'w') as file:
+            file.write('in')
+        with open(f'{base}/edge', 'w') as file:
+            file.write(edge)
+        self.fd = os.open(f'{base}/value', os.O_RDONLY | os.O_NONBLOCK)
+        self.read_edges()  # clear the initial pending state
+
+    # Return the number of edges signalled since the last call
+    def read_edges(self):
+        os.lseek(self.fd, 0, os.SEEK_SET)
+        os.read(self.fd, 8)
+        return 1
+
+    def close(self):
+        os.close(self.fd)
+
+
+# File-based stand-in for a GPIO pin. Every b'0' written to the FIFO is a falling edge,
+# which lets tests and simulations drive the reactor without hardware.
+class FifoGpioSource:
+    events = select.EPOLLIN
+
+    def __init__(self, pin, path):
+        self.pin = pin
+        if not os.path.exists(path):
+            os.mkfifo(path)
+        # Opening read-write keeps a writer attached so the FIFO never reports hang-up
+        self.fd = os.open(path, os.O_RDWR | os.O_NONBLOCK)
+
+    def read_edges(self):
+        try:
+            return os.read(self.fd, 64).count(b'0')
+        except BlockingIOError:
+            return 0
+
+    def close(self):
+        os.close(self.fd)
+
+
+# One epoll thread that multiplexes the touchscreen, GPIO edges and a wakeup pipe.
+# Callbacks run on this thread, which makes it the single producer for the game's
+# input ring.
+class InputReactor(threading.Thread):
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.epoll = select.epoll()
+        self.handlers = {}
+        self.sources = []
+        self.running = False
+        self.wake_read, self.wake_write = os.pipe()
+        os.set_blocking(self.wake_read, False)
+        self.epoll.register(self.wake_read, select.EPOLLIN)
+
+    # Register a GPIO pin; callback(pin) runs on each debounced falling edge
+    def add_gpio(self, pin, callback, bouncetime=0, fifo_dir=None):
+        if fifo_dir:
+            source = FifoGpioSource(pin, os.path.join(fifo_dir, f'gpio{pin}'))
+        else:
+            source = SysfsGpioSource(pin)
+        last_edge = [0]
+
+        def on_ready(mask):
+            edges = source.read_edges()
+            now = time.monotonic()
+            for _ in range(edges):
+                if (now - last_edge[0]) * 1000 >= bouncetime:
+                    last_edge[0] = now
+                    callback(pin)
+
+        self.sources.append(source)
+        self.handlers[source.fd] = on_ready
+        self.epoll.register(source.fd, source.events)
+
+    # Register a pitft_touchscreen; its device is read here instead of on its own thread
+    def add_touchscreen(self, touchscreen):
+        device = touchscreen.open_device()
+
+        def on_ready(mask):
+            try:
+                for input_event in device.read():
+                    touchscreen.handle_input_event(input_event)
+            except BlockingIOError:
+                pass
+
+        self.sources.append(touchscreen)
+        self.handlers[device.fd] = on_ready
+        self.epoll.register(device.fd, select.EPOLLIN)
+
+    def start(self):
+        self.running = True
+        super().start()
+
+    def run(self):
+        while self.running:
+            for fd, mask in self.epoll.poll():
+                if fd == self.wake_read:
+                    try:
+                        os.read(self.wake_read, 64)
+                    except BlockingIOError:
+                        pass
+                    continue
+                handler = self.handlers.get(fd)
+                if handler:
+                    handler(mask)
+        for source in self.sources:
+            source.close()
+        self.epoll.close()
+
+    # Wake the poll loop and shut down cleanly
+    def stop(self, timeout=1.0):
+        self.running = False
+        os.write(self.wake_write, b'x')
+        if self.is_alive():
+            self.join(timeout)
+        os.close(self.wake_read)
+        os.close(self.wake_write)
@@ -0,0 +1,78 @@
+import time
+
+RING_CAPACITY = 32
+
+# Delayed auto shift / auto repeat rate, in simulation ticks (60 Hz)
+DAS_TICKS = 10  # ~167 ms before a held button starts repeating
+ARR_TICKS = 3   # ~50 ms between repeats
+REPEATABLE_ACTIONS = ('move_left', 'move_right')
+
+
+# Single-producer/single-consumer ring of timestamped actions. The producer (the GPIO
+# callback thread) only advances head and the consumer (the game loop) only advances
+# tail, so no lock is needed. A full ring counts the overflow instead of evicting.
+class InputRing:
+    def __init__(self, capacity=RING_CAPACITY):
+        self.capacity = capacity
+        self.actions = [None] * capacity
+        self.stamps = [0] * capacity
+        self.head = 0
+        self.tail = 0
+        self.overflows = 0
+
+    # Producer side: add an action stamped with monotonic time; False if the ring is full
+    def push(self, action, timestamp=None):
+        head = self.head
+        if head - self.tail >= self.capacity:
+            self.overflows += 1
+            return False
+        slot = head % self.capacity
+        self.actions[slot] = action
+        self.stamps[slot] = timestamp if timestamp is not None else time.monotonic_ns()
+        self.head = head + 1  # publish only after the slot is written
+        return True
+
+    # Producer side: the most recent action that has not been consumed yet, if any
+    def last_pending(self):
+        head = self.head
+        if head == self.tail:
+            return None
+        return self.actions[(head - 1) % self.capacity]
+
+    # Consumer side: remove and return every pending (action, timestamp) pair
+    def drain(self):
+        tail = self.tail
+        head = self.head
+        entries = []
+        while tail < head:
+            slot = tail % self.capacity
+            entries.append((self.actions[slot], self.stamps[slot]))
+            tail += 1
+        self.tail = tail
+        return entries
+
+    def __len__(self):
+        return self.head - self.tail
+
+
+# DAS/ARR auto-repeat for held buttons. Each tick it polls the pressed state of each
+# key and yields repeats once a key has been held past the DAS delay.
+class AutoRepeat:
+    def __init__(self, readers, das=DAS_TICKS, arr=ARR_TICKS):
+        self.readers = readers  # key -> callable returning True while held
+        self.das = das
+        self.arr = arr
+        self.held = {key: 0 for key in readers}
+
+    # Return the keys that should repeat on this tick
+    def poll(self):
+        repeats = []
+        for key, is_pressed in self.readers.items():
+            if not is_pressed():
+                self.held[key] = 0
+                continue
+            held = self.held[key] + 1
+            self.held[key] = held
+            if held >= self.das and (held - self.das) % self.arr == 0:
+                repeats.append(key)
+        return repeats
@@ -0,0 +1,80 @@
+import logging
+import os
+import time
+from collections import deque
+from logging.handlers import RotatingFileHandler
+
+WINDOW = 1000  # samples kept per action for percentiles
+LOG_PATH = 'input_latency.log'
+LOG_MAX_BYTES = 1024 * 1024
+LOG_BACKUPS = 3
+
+
+# Disabled tracker; keeps the instrumented code paths free of checks
+class NullLatencyTracker:
+    enabled = False
+
+    def action_performed(self, action, captured_ns):
+        pass
+
+    def frame_presented(self):
+        pass
+
+
+# Input-to-photon latency. Inputs are stamped at capture (GPIO callback or evdev
+# report), carried through the input ring into perform_action, and closed out when
+# the frame that shows their result is flipped.
+class LatencyTracker:
+    enabled = True
+
+    def __init__(self, window=WINDOW, log_path=LOG_PATH):
+        self.window = window
+        self.pending = []
+        self.samples = {}
+        self.logger = logging.getLogger('tetris.latency')
+        self.logger.propagate = False
+        if log_path and not self.logger.handlers:
+            handler = RotatingFileHandler(log_path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self.logger.addHandler(handler)
+            self.logger.setLevel(logging.INFO)
+
+    # An input captured at captured_ns has been applied to the game state
+    def action_performed(self, action, captured_ns):
+        if captured_ns:
+            self.pending.append((action, captured_ns))
+
+    # The frame showing every pending action has been flipped to the display
+    def frame_presented(self):
+        if not self.pending:
+            return
+        now = time.monotonic_ns()
+        for action, captured_ns in self.pending:
+            latency = now - captured_ns
+            if action not in self.samples:
+                self.samples[action] = deque(maxlen=self.window)
+            self.samples[action].append(latency)
+            self.logger.info("%d %s %d", captured_ns, action, latency // 1000)
+        self.pending = []
+
+    # Return p50/p95/p99 latency in milliseconds for an action
+    def percentiles(self, action, points=(50, 95, 99)):
+        values = sorted(self.samples.get(action, ()))
+        if not values:
+            return [0.0 for _ in points]
+        return [values[min(len(values) - 1, len(values) * p // 100)] / 1e6 for p in points]
+
+    # Summary table of per-action latency
+    def report(self):
+        lines = ["action        count    p50    p95    p99 ms"]
+        for action in sorted(self.samples):
+            p50, p95, p99 = self.percentiles(action)
+            lines.append(f"{action:<12} {len(self.samples[action]):>6} {p50:6.1f} {p95:6.1f} {p99:6.1f}")
+        return "\n".join(lines)
+
+
+# Build the tracker selected by TETRIS_LATENCY ('on' enables it)
+def create_latency_tracker():
+    if os.getenv('TETRIS_LATENCY') == 'on':
+        return LatencyTracker()
+    return NullLatencyTracker()
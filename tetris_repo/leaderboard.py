@@ -0,0 +1,120 @@
+import os
+import threading
+import pygame
+from score_store import ScoreStore, DB_PATH, ANONYMOUS
+
+LEGACY_SCORES_PATH = 'highscores.json'  # imported into the score store on first run
+BOARD_SIZE = 5         # Scores shown on the leaderboard
+POLL_INTERVAL = 2.0    # seconds between checks for changes made by another process
+
+PANEL_SIZE = (240, 200)
+PANEL_COLOR = (50, 50, 50)
+TEXT_COLOR = (255, 255, 255)
+
+
+# The leaderboard held in memory, backed by the score store. Finished games are
+# recorded by a background thread so the frame loop never touches the disk. The same
+# thread watches the database for commits from another process, such as the split-mode
+# renderer's counterpart, and reloads the board when one happens.
+class Leaderboard:
+    def __init__(self, path=DB_PATH, size=BOARD_SIZE, poll_interval=POLL_INTERVAL,
+                 legacy_path=LEGACY_SCORES_PATH):
+        self.size = size
+        self.poll_interval = poll_interval
+        self.lock = threading.Condition()
+        # Used here until the thread starts, then only by the thread
+        self.store = ScoreStore(path, check_same_thread=False)
+        if legacy_path and self.store.game_count() == 0:
+            self.store.import_json(legacy_path)
+        self.scores = self.store.top(limit=size)
+        self.data_version = self.store.data_version()
+        self.version = 0  # bumped on every change so the rendered panel can be reused
+        self.pending = []
+        self.running = True
+        self.panel = None
+        self.panel_version = -1
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    # Current scores, best first
+    def top(self):
+        with self.lock:
+            return list(self.scores)
+
+    # Whether a score would make it onto the board
+    def qualifies(self, score):
+        with self.lock:
+            return self.qualifies_locked(score)
+
+    def qualifies_locked(self, score):
+        return len(self.scores) < self.size or score > min(entry["score"] for entry in self.scores)
+
+    # Record a finished game: a dict with initials, score, lines, duration and opponent.
+    # The board updates at once; the store is written in the background.
+    def add(self, entry):
+        with self.lock:
+            self.pending.append(entry)
+            if entry["initials"] != ANONYMOUS and self.qualifies_locked(entry["score"]):
+                self.scores.append(entry)
+                self.scores.sort(key=lambda x: x["score"], reverse=True)
+                del self.scores[self.size:]
+                self.version += 1
+            self.lock.notify()
+
+    def run(self):
+        while True:
+            with self.lock:
+                if not self.pending and self.running:
+                    self.lock.wait(self.poll_interval)
+                pending, self.pending = self.pending, []
+                running = self.running
+            for entry in pending:
+                self.store.record_game(entry["initials"], entry["score"], entry.get("lines", 0),
+                                       entry.get("duration", 0.0), entry.get("opponent"))
+            data_version = self.store.data_version()
+            if pending or data_version != self.data_version:
+                self.data_version = data_version
+                scores = self.store.top(limit=self.size)
+                with self.lock:
+                    if not self.pending:
+                        self.scores = scores
+                        self.version += 1
+            if not running:
+                self.store.close()
+                return
+
+    # Flush pending games and stop the background thread
+    def close(self, timeout=2.0):
+        with self.lock:
+            self.running = False
+            self.lock.notify()
+        self.thread.join(timeout)
+
+    # The leaderboard panel, rendered again only when the scores change
+    def surface(self, title_font, row_font):
+        with self.lock:
+            version = self.version
+            scores = list(self.scores)
+        if self.panel is None or self.panel_version != version:
+            panel = pygame.Surface(PANEL_SIZE)
+            panel.fill(PANEL_COLOR)
+            title_text = title_font.render("Leaderboard", True, TEXT_COLOR)
+            panel.blit(title_text, title_text.get_rect(centerx=PANEL_SIZE[0] // 2, top=10))
+            for i, score in enumerate(scores[:10], 1):
+                score_text = row_font.render(f"{i}. {score['initials']} - {score['score']}", True, TEXT_COLOR)
+                panel.blit(score_text, (20, 40 + i * 30))
+            self.panel = panel
+            self.panel_version = version
+        return self.panel
+
+
+_shared = None
+
+
+# The process-wide leaderboard, created on first use. TETRIS_SCORES_DB overrides the
+# database path (':memory:' keeps benchmarks and tests away from real scores).
+def shared_leaderboard():
+    global _shared
+    if _shared is None:
+        _shared = Leaderboard(os.getenv('TETRIS_SCORES_DB') or DB_PATH)
+    return _shared
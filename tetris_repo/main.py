@@ -1,252 +1,376 @@
-import pygame, pigame
+import time
+START_TIME = time.perf_counter()  # cold start is measured from here to the first frame
+
+import pygame
 import random
 from network import UDPNetwork
 from tetris_game import TetrisGame
+from game_clock import FixedStepClock, AdaptiveFrameRate
+from frame_pacer import FramePacer
+from profiler import create_profiler
+from input_ring import AutoRepeat
+from latency import create_latency_tracker
+from hal import load_backends
+from clock_sync import ClockSync
+from session import Session
+from metrics import create_metrics
+from sync_controller import create_sync_controller
 import os
-import time
 import socket
-import RPi.GPIO as GPIO
 import threading 
-from queue import Queue
-
-# Set up environment variables for Raspberry Pi display
-os.putenv('SDL_VIDEODRV','fbcon')
-os.putenv('SDL_FBDEV', '/dev/fb0')
-os.putenv('SDL_MOUSEDRV','dummy')
-os.putenv('SDL_MOUSEDEV','/dev/null')
-os.putenv('DISPLAY','')
+import screens
+import scenes
+import snapshot
+IMPORTS_DONE = time.perf_counter()
 
 # Configuration constants
-PLAYER2_IP = '10.49.243.13'
+PLAYER2_IP = os.getenv('TETRIS_PEER_IP') or '10.49.243.13'
+LOCAL_PORT = int(os.getenv('TETRIS_PORT') or '5000')
+PEER_PORT = int(os.getenv('TETRIS_PEER_PORT') or '5000')
+# Opponents of a match of three to eight players, as comma-separated host[:port]; unset
+# plays the one opponent at TETRIS_PEER_IP
+PEERS = os.getenv('TETRIS_PEERS')
+# Multicast group every cabinet of the match joins (all cabinets must use the same
+# TETRIS_PORT), so each lock event and sync frame leaves a cabinet once however many
+# opponents there are
+MATCH_GROUP = os.getenv('TETRIS_MATCH_GROUP')
 MATCH_TIMEOUT = 5
-
-# GPIO setup
-GPIO.setmode(GPIO.BCM)
+# Run rendering in a separate process fed through shared memory (for multi-core Pis)
+SPLIT_RENDER = os.getenv('TETRIS_SPLIT_RENDER') == 'on'
+# Render rate in frames per second, or 'auto' to adapt to load; game speed is unaffected
+RENDER_FPS = os.getenv('TETRIS_RENDER_FPS') or '60'
+# Block on input/network events instead of redrawing static screens every frame
+ON_DEMAND_RENDER = os.getenv('TETRIS_ON_DEMAND') != 'off'
+# Length of a cProfile sampling run started with F4 when profiling is enabled
+CPROFILE_SECONDS = int(os.getenv('TETRIS_CPROFILE_SECONDS') or '10')
+TRACE_PATH = 'frame_trace.json'
+# Service GPIO edges and the touchscreen from one epoll thread instead of library threads
+INPUT_REACTOR = os.getenv('TETRIS_INPUT_REACTOR') == 'on'
+# Turn taps, drags and swipes on the touchscreen into gameplay actions
+TOUCH_GESTURES = os.getenv('TETRIS_TOUCH_GESTURES') != 'off'
+# Directory of FIFOs standing in for GPIO pins (gpio<N>), for testing the reactor off-device
+GPIO_FIFO_DIR = os.getenv('TETRIS_GPIO_FIFO_DIR')
+# Broadcast a spectator stream of the match to lobby displays ('on', or host[:port] for a
+# specific broadcast or multicast address)
+SPECTATOR_STREAM = os.getenv('TETRIS_SPECTATOR_STREAM') or 'off'
+# The shared snapshot and the spectator stream carry one opponent board, so a match of
+# three or more players runs without split render mode and the spectator stream
+SINGLE_OPPONENT = not PEERS or len(PEERS.split(',')) == 1
+
+# GPIO pins for each button (BCM numbering)
 GPIO_PINS = {
     'quit': 17,
     'rotate': 5,
     'down': 12,
     'left': 16,
     'right': 6,
-    'sabotage': 4
+    'sabotage': 4,
+    'next_target': 13
 }
-for pin in GPIO_PINS.values():
-    GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-
-# Game state variables
-game_started = False
-countdown_started = False
-connected = False
-partner_address = None
-matchmaking_failed = False
-matchmaking_tried = False
-game_over = False
-running = True
 
 # Game objects and threads
-tetris_game = None
-message_thread = None
+backends = None
+manager = None
+pacer = None
 
-# Network and messaging
+# Network
 network = None
-message_queue = Queue()
-
-# Attempt to establish a connection with another player.
-def start_matchmaking():
-    global connected, partner_address, screen, matchmaking_failed, matchmaking_tried
-
-    matchmaking_tried = True  
-    start_time = time.time()
-    last_request_time = 0
-    request_interval = 1  # Send a request every 1 second
-
-    while time.time() - start_time < MATCH_TIMEOUT:
-        current_time = time.time()
-
-        # Send request periodically
-        if current_time - last_request_time >= request_interval:
-            network.send_message({"type": "request"}, (PLAYER2_IP, 5000))
-            print("request sent")
-            last_request_time = current_time
-
-        # Check for incoming messages
-        try:
-            result = network.receive_message()
-            if result and result[0] is not None:
-                message, addr = result
-                if message["type"] == "request":
-                    # Respond to incoming request
-                    network.send_message({"type": "request_ack"}, addr)
-                elif message["type"] == "request_ack":
-                    # Respond to acknowledgment
-                    network.send_message({"type": "ack_ack"}, addr)
-                    partner_address = addr
-                    connected = True
-                    message_thread.start()
-                    return
-                elif message["type"] == "ack_ack":
-                    # Connection confirmed
-                    partner_address = addr
-                    connected = True
-                    message_thread.start()
-                    return
-        except socket.error:
-            pass
-
-        # Small delay to prevent busy-waiting
-        time.sleep(0.01)
-
-    matchmaking_failed = True 
-    matchmaking_tried = False
+clock_sync = None
+session = None
+
+# Wake the main loop so static screens redraw after input or network activity
+def wake_main_loop():
+    if pacer:
+        pacer.notify()
 
 # Callback for the quit button
 def quit_callback(channel):
-    global running
-    running = False
+    if manager:
+        manager.running = False
+    wake_main_loop()
+
+# Send a button press to the running game, or to the current scene before a game exists
+def press_button(name, key):
+    if not manager:
+        return
+    if manager.game:
+        manager.game.handle_key_event(pygame.event.Event(pygame.KEYDOWN, key=key), time.monotonic_ns())
+    else:
+        manager.press(name)
+    wake_main_loop()
 
 # Callback for the rotate button
 def rotate_callback(channel):
-    global game_started, countdown_started, partner_address, tetris_game
-    if not connected:
-        start_matchmaking()
-    elif not game_started and not countdown_started:
-        countdown_started = True
-        network.send_message({"type": "start_game"}, partner_address)
-    elif tetris_game:
-        tetris_game.handle_key_event(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_UP))
+    press_button('rotate', pygame.K_UP)
 
 # Callback for the down button
 def down_callback(channel):
-    global tetris_game
-    if tetris_game:
-        tetris_game.handle_key_event(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_DOWN))
+    press_button('down', pygame.K_DOWN)
 
 # Callback for the left button
 def left_callback(channel):
-    global tetris_game
-    if tetris_game:
-        tetris_game.handle_key_event(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_LEFT))
+    press_button('left', pygame.K_LEFT)
 
 # Callback for the right button
 def right_callback(channel):
-    global tetris_game
-    if tetris_game:
-        tetris_game.handle_key_event(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_RIGHT))
+    press_button('right', pygame.K_RIGHT)
 
 # Callback for the sabotage button
 def sab_callback(channel):
-    global tetris_game
-    if tetris_game:
-        tetris_game.handle_key_event(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_1))                
-
-# Set up GPIO event detection
-GPIO.add_event_detect(GPIO_PINS['quit'], GPIO.FALLING, callback=quit_callback)
-GPIO.add_event_detect(GPIO_PINS['rotate'], GPIO.FALLING, callback=rotate_callback, bouncetime=100)
-GPIO.add_event_detect(GPIO_PINS['down'], GPIO.FALLING, callback=down_callback, bouncetime=100)
-GPIO.add_event_detect(GPIO_PINS['left'], GPIO.FALLING, callback=left_callback, bouncetime=100)
-GPIO.add_event_detect(GPIO_PINS['right'], GPIO.FALLING, callback=right_callback, bouncetime=100)
-GPIO.add_event_detect(GPIO_PINS['sabotage'], GPIO.FALLING, callback=sab_callback)
-
-# Handle incoming network messages
+    press_button('sabotage', pygame.K_1)
+
+# Callback for the next target button; cycles the sabotage target in matches of three or more
+def next_target_callback(channel):
+    press_button('next_target', pygame.K_2)
+
+# Button callbacks and their debounce times in milliseconds (0 disables debouncing)
+GPIO_CALLBACKS = [
+    ('quit', quit_callback, 0),
+    ('rotate', rotate_callback, 100),
+    ('down', down_callback, 100),
+    ('left', left_callback, 100),
+    ('right', right_callback, 100),
+    ('sabotage', sab_callback, 0),
+    ('next_target', next_target_callback, 100),
+]
+
+# Set up button event detection, on the input reactor if one is given
+def register_buttons(input_backend, reactor=None):
+    for name, callback, bouncetime in GPIO_CALLBACKS:
+        input_backend.register(name, callback, bouncetime, reactor)
+
+# Sink for touch gestures; runs on the touchscreen thread and feeds the game directly
+def gesture_callback(action, timestamp):
+    if manager and manager.game:
+        manager.game.handle_gesture(action, timestamp)
+        wake_main_loop()
+
+# Poll the state of held direction buttons for DAS/ARR auto-repeat
+def create_auto_repeat(input_backend):
+    return AutoRepeat({
+        pygame.K_UP: lambda: input_backend.is_pressed('rotate'),
+        pygame.K_DOWN: lambda: input_backend.is_pressed('down'),
+        pygame.K_LEFT: lambda: input_backend.is_pressed('left'),
+        pygame.K_RIGHT: lambda: input_backend.is_pressed('right'),
+    })
+
+# Opponent addresses from TETRIS_PEERS, resolved so they compare equal to the source
+# address of their datagrams
+def peer_addresses():
+    if not PEERS:
+        return (PLAYER2_IP, PEER_PORT)
+    addresses = []
+    for peer in PEERS.split(','):
+        host, _, port = peer.strip().partition(':')
+        addresses.append((socket.gethostbyname(host), int(port or PEER_PORT)))
+    return addresses if len(addresses) > 1 else addresses[0]
+
+# Handle incoming network messages; matchmaking and start messages go to the scenes
 def message_handler():
-    global network, message_queue, countdown_started
+    message_queue = manager.message_queue
     while True:
         result = network.receive_message()
         if result and result[0] is not None:
             message, addr = result
-            if message["type"] == "start_game":
-                countdown_started = True
+            if message["type"] == "clock_ping":
+                clock_sync.handle_ping(message, addr)
+                continue
+            elif message["type"] == "clock_pong":
+                clock_sync.handle_pong(message)
+                continue
+            elif message["type"] == "heartbeat":
+                continue  # already counted by the session when it was received
+            wake_main_loop()
+            if message["type"] in scenes.CONTROL_MESSAGES:
+                manager.post_control(message, addr)
             elif message["type"] == "game_state":
-                message_queue.put(("game_state", message))
+                message_queue.put(("game_state", message, addr))
             elif message["type"] == "sync_frame":
                 ack_message = {
                     "type": "sync_frame_ack",
                     "frame_number": message["frame_number"]
                 }
                 network.send_message(ack_message, addr)
-                message_queue.put(("sync_frame", message))
-            elif message["type"] == "sabotage":
-                message_queue.put(("sabotage", message))   
+                message_queue.put(("sync_frame", message, addr))
+            elif message["type"] in ("sabotage", "snapshot"):
+                message_queue.put((message["type"], message, addr))
 
 # Main game loop 
 def main():
-    global screen, network, partner_address
+    global screen, network, backends, manager, pacer, clock_sync, session
+
+    split_render = SPLIT_RENDER and SINGLE_OPPONENT
+    spectator_stream = SPECTATOR_STREAM != 'off' and SINGLE_OPPONENT
+    if not SINGLE_OPPONENT and (SPLIT_RENDER or SPECTATOR_STREAM != 'off'):
+        print("Split render mode and the spectator stream show a single opponent; "
+              "both are off for a match of three or more players")
+
+    # Select input, display and clock backends (TETRIS_BACKEND=sim runs off-device)
+    backends = load_backends(GPIO_PINS, GPIO_FIFO_DIR)
+    clock = backends.clock
+    reactor = None
+    if INPUT_REACTOR:
+        from input_reactor import InputReactor
+        reactor = InputReactor()
+    register_buttons(backends.input, reactor)
+
+    if split_render:
+        # The renderer process owns the display; fork it before SDL is initialised here
+        import multiprocessing
+        import render_process
+        shared = snapshot.SharedSnapshot.create()
+        mp = multiprocessing.get_context('fork')
+        render_stop = mp.Event()
+        renderer = mp.Process(target=render_process.run_renderer, args=(shared.name, render_stop))
+        renderer.daemon = True
+        renderer.start()
 
     pygame.init()
-    pitft = pigame.PiTft()
-    screen = pygame.display.set_mode((320, 240))
-    pygame.display.set_caption("Tetris - Multiplayer")
+    if split_render:
+        # Simulate onto an off-screen surface
+        screen = pygame.Surface((320, 240))
+    else:
+        screen = backends.display.open(reactor)
+        if TOUCH_GESTURES:
+            backends.display.add_gesture_recognizer(gesture_callback)
+    if reactor:
+        reactor.start()
+    backends.input.start()
 
     # Initialize UDP network
-    network = UDPNetwork('0.0.0.0', 5000)
+    network = UDPNetwork('0.0.0.0', LOCAL_PORT)
+    if MATCH_GROUP:
+        network.join_group(MATCH_GROUP, LOCAL_PORT)
 
-    # Define fonts
-    font_large = pygame.font.Font(None, 48)  # Large font for titles
-    font_medium = pygame.font.Font(None, 36)  # Medium font for buttons and smaller text
+    # Shared match clock, estimated from ping/pong exchanges once a peer is connected; it
+    # and the scene timers run on the backend clock, so a virtual clock drives them too
+    clock_sync = ClockSync(network, time_source=clock.monotonic)
 
-    global running, game_over, game_started, matchmaking_failed, matchmaking_tried
-    global countdown_started, tetris_game
+    # Heartbeats and the session token that lets a dropped peer rejoin the match
+    session = Session(network, clock_sync)
 
-    # FPS and clock setup
-    FPS = 60
-    clock = pygame.time.Clock()
+    spectators = None
+    if spectator_stream:
+        from spectator import SpectatorBroadcaster, SPECTATOR_ADDRESS, parse_address
+        address = SPECTATOR_ADDRESS if SPECTATOR_STREAM == 'on' else parse_address(SPECTATOR_STREAM)
+        spectators = SpectatorBroadcaster(network, address)
 
-    # Start the message handler thread
-    global message_thread
+    # Define fonts
+    fonts = screens.ScreenFonts()
+
+    # FPS and clock setup; the simulation runs on its own fixed-timestep clock
+    sim_clock = FixedStepClock(time_source=clock.monotonic)
+    frame_rate = AdaptiveFrameRate() if RENDER_FPS == 'auto' else None
+    render_fps = frame_rate.fps if frame_rate else int(RENDER_FPS)
+
+    # Per-phase frame timing (TETRIS_PROFILE=on); F3 toggles the HUD, F4 samples cProfile,
+    # F5 exports a Chrome trace
+    profiler = create_profiler()
+
+    # Input-to-photon latency per action (TETRIS_LATENCY=on); raw samples go to a rotating log
+    latency = create_latency_tracker()
+
+    # Static screens sleep until woken by input, network activity or a scene timer; a
+    # virtual clock only moves when ticked, so its scene timers can't be slept on
+    if ON_DEMAND_RENDER and not clock.virtual:
+        pacer = FramePacer(use_pygame_events=not split_render)
+
+    # Created when the countdown starts so early button presses reach the game
+    def create_game(partner_address):
+        game = TetrisGame(screen, network, partner_address)
+        game.profiler = profiler
+        game.latency = latency
+        game.auto_repeat = create_auto_repeat(backends.input)
+        game.match_time = clock_sync.match_time
+        game.time_source = clock.monotonic
+        # Sync frame cadence adapted to link loss and board churn (TETRIS_SYNC=fixed disables it)
+        game.sync_controller = create_sync_controller()
+        session.start(partner_address)
+        game.session = session
+        return game
+
+    manager = scenes.SceneManager(network, peer_addresses(), fonts, create_game,
+                                  sim_clock, MATCH_TIMEOUT, clock_sync, time_source=clock.monotonic)
+
+    # Start the message handler thread; it runs for the whole session so matchmaking
+    # and the countdown never stop the network
     message_thread = threading.Thread(target=message_handler)
     message_thread.daemon = True
-
-    while running:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
-
-        screen.fill((0, 0, 0))
-
-        if not connected and not game_started:
-            if not matchmaking_failed and not matchmaking_tried:
-                # Landing page with "Find a match" button
-                title_text = font_large.render("Tetris - Multiplayer", True, (255, 255, 255))
-                button_text = font_medium.render("Find a match", True, (255, 255, 255))
-                screen.blit(title_text, (10, 50))
-                screen.blit(button_text, (10, 150))
-            elif matchmaking_tried:
-                # Landing page after the "Find a match" button is pressed
-                font = pygame.font.Font(None, 36)
-                text = font.render("Looking for a partner...", True, (255, 255, 255))
-                screen.blit(text, (10, 100))
-                pygame.display.flip()
-            else:
-                # Display "Could not find a match" and "Try again" button if no connection is established
-                text = font_medium.render("Could not find a match", True, (255, 0, 0))
-                retry_text = font_medium.render("Try again", True, (255, 255, 255))
-                screen.blit(text, (10, 100))
-                screen.blit(retry_text, (10, 150))
-        elif connected and not game_started and not countdown_started:
-            # Match found; display "Start Match" button
-            text = font_medium.render("Start Match", True, (255, 255, 255))
-            screen.blit(text, (10, 150))
-        elif countdown_started and not game_started:
-            # Display countdown to the start of the game 
-            tetris_game = TetrisGame(screen, network, partner_address)
-            game_started = True 
-            font = pygame.font.Font(None, 48)
-            for countdown_time in range(3, 0, -1):  # Countdown from 3 to 1
-                screen.fill((0, 0, 0))  # Clear screen
-                countdown_text = font.render(str(countdown_time), True, (255, 255, 255))
-                text_rect = countdown_text.get_rect(center=(160, 120))
-                screen.blit(countdown_text, text_rect)
-                pygame.display.flip()
-                pygame.time.delay(1000)  # Wait for 1 second   
-        elif connected and game_started:
-            # Game play loop 
-            if not game_over: 
-                game_over = tetris_game.update(message_queue)
-            tetris_game.draw()
-
-        pygame.display.flip()
-        clock.tick(FPS)  # Ensure the loop runs at the specified FPS
-
+    message_thread.start()
+
+    # Prometheus metrics on localhost:9110 (TETRIS_METRICS=off disables them)
+    metrics = create_metrics(network, manager, sim_clock, session, pacer)
+
+    cold_start = None
+    while manager.running:
+        frame_start = time.perf_counter()
+        if split_render:
+            if render_stop.is_set():
+                manager.running = False
+        else:
+            backends.display.update()  # Post this frame's batch of touch events
+            for event in pygame.event.get():
+                backends.input.handle_event(event)
+                if event.type == pygame.QUIT:
+                    manager.running = False
+                elif event.type == pygame.KEYDOWN and profiler.enabled:
+                    if event.key == pygame.K_F3:
+                        profiler.toggle_hud()
+                    elif event.key == pygame.K_F4:
+                        profiler.start_cprofile(CPROFILE_SECONDS)
+                    elif event.key == pygame.K_F5:
+                        profiler.export_chrome_trace(TRACE_PATH)
+
+        manager.update()
+        scene = manager.scene
+        if spectators and manager.game:
+            spectators.publish(manager.game)
+
+        if split_render:
+            scene.publish(shared)
+            # The renderer flips asynchronously; publishing is the closest point we observe
+            latency.frame_presented()
+        else:
+            screen.fill((0, 0, 0))
+            profiler.begin('draw')
+            scene.render(screen)
+            profiler.end('draw')
+            profiler.draw_hud(screen)
+            profiler.begin('flip')
+            pygame.display.flip()
+            profiler.end('flip')
+            latency.frame_presented()
+        profiler.end_frame()
+        frame_time = time.perf_counter() - frame_start
+        metrics.record_frame(frame_time)
+        if cold_start is None:
+            cold_start = time.perf_counter() - START_TIME
+            print(f"Cold start: {cold_start:.3f} s to first frame "
+                  f"(imports {IMPORTS_DONE - START_TIME:.3f} s, {backends.name} backend)")
+        if pacer and not scene.animating:
+            pacer.wait(manager.timeout())
+            continue
+        if frame_rate:
+            render_fps = frame_rate.record(frame_time)
+        clock.tick(render_fps)  # Cap the render rate; simulation ticks catch up via sim_clock
+
+    if profiler.enabled:
+        profiler.export_chrome_trace(TRACE_PATH)
+    if latency.enabled:
+        print(latency.report())
+    if split_render:
+        render_stop.set()
+        renderer.join(timeout=2)
+        shared.close()
+    if reactor:
+        reactor.stop()
+    clock_sync.stop()
+    session.stop()
+    metrics.close()
+    if manager.game:
+        manager.game.abandon_leaderboard_entry()
+        manager.game.leaderboard.close()  # Flush any score still being written
+    backends.input.close()
     network.close()
     pygame.quit()
 
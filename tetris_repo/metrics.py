@@ -0,0 +1,239 @@
+import os
+import sys
+import threading
+import time
+from array import array
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+METRICS_ADDRESS = '127.0.0.1'  # local only; a fleet scraper reaches it through an agent or tunnel
+METRICS_PORT = 9110
+FRAME_WINDOW = 1024            # frames kept for percentiles (a power of two)
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+# Current resident set size of this process in bytes, or None where /proc is missing
+def rss_bytes():
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+# Peak resident set size in bytes; ru_maxrss is in KiB except on macOS
+def peak_rss_bytes():
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def open_fds():
+    try:
+        return len(os.listdir('/proc/self/fd'))
+    except OSError:
+        return -1
+
+
+# Disabled metrics; keeps the main loop free of checks
+class NullMetrics:
+    enabled = False
+
+    def record_frame(self, seconds):
+        pass
+
+    def close(self):
+        pass
+
+
+# Runtime metrics served in the Prometheus text format. The frame loop only writes one
+# slot of a preallocated ring and bumps two numbers; every other value is a counter the
+# owning object already keeps (UDPNetwork, FixedStepClock, the game) and is read when
+# the endpoint is scraped, so collection costs the frame loop nothing. Counters are
+# plain ints bumped without a lock: under the GIL a racing increment can at worst be
+# lost, which is acceptable for monitoring.
+class Metrics:
+    enabled = True
+
+    def __init__(self, network=None, manager=None, sim_clock=None, session=None, pacer=None,
+                 window=FRAME_WINDOW, time_source=time.monotonic):
+        self.network = network
+        self.manager = manager
+        self.sim_clock = sim_clock
+        self.session = session
+        self.pacer = pacer
+        self.time_source = time_source
+        self.frame_times = array('d', bytes(8 * window))
+        self.mask = window - 1
+        self.frames = 0
+        self.frame_seconds = 0.0
+        # Counters of finished games, folded in when the manager starts a new game
+        self.lock = threading.Lock()
+        self.game = None
+        self.games = 0
+        self.totals = {'lines': 0, 'sabotages_sent': 0, 'sabotages_received': 0, 'desyncs': 0,
+                       'button_overflows': 0, 'gesture_overflows': 0}
+        if manager is not None:
+            manager.game_listeners.append(self.game_started)
+        self.last_scrape = None
+        self.server = None
+        self.thread = None
+
+    # Record one frame's work time; called from the main loop only
+    def record_frame(self, seconds):
+        frames = self.frames
+        self.frame_times[frames & self.mask] = seconds
+        self.frames = frames + 1
+        self.frame_seconds += seconds
+
+    # Serve /metrics from a background thread; returns False if the port is taken
+    def serve(self, address=METRICS_ADDRESS, port=METRICS_PORT):
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/metrics', '/'):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # a scrape every few seconds would flood the console
+
+        try:
+            self.server = HTTPServer((address, port), Handler)
+        except OSError as error:
+            print(f"Metrics endpoint unavailable: {error}")
+            return False
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return True
+
+    def close(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def frame_quantiles(self):
+        count = min(self.frames, self.mask + 1)
+        if count == 0:
+            return [(q, 0.0) for q in QUANTILES]
+        times = sorted(self.frame_times[:count])
+        return [(q, times[min(count - 1, int(q * count))]) for q in QUANTILES]
+
+    # A new game was created; the previous one is over, so its counters join the totals.
+    # Called on the main thread, so no game is missed however rarely the endpoint is scraped.
+    def game_started(self, game):
+        with self.lock:
+            if self.game is not None:
+                for name, value in self.read_game(self.game).items():
+                    self.totals[name] += value
+            self.games += 1
+            self.game = game
+
+    # Game counters summed over every game this process has played
+    def game_counters(self):
+        with self.lock:
+            counters = dict(self.totals)
+            if self.game is not None:
+                for name, value in self.read_game(self.game).items():
+                    counters[name] += value
+            return counters
+
+    @staticmethod
+    def read_game(game):
+        sent = sum(1 for player, _ in game.sabotage_log if player == 1)
+        return {'lines': game.lines, 'sabotages_sent': sent,
+                'sabotages_received': len(game.sabotage_log) - sent, 'desyncs': game.desyncs,
+                'button_overflows': game.button_queue.overflows,
+                'gesture_overflows': game.gesture_queue.overflows}
+
+    # The metrics page in the Prometheus text exposition format
+    def render(self):
+        lines = []
+
+        def metric(name, kind, help_text, value, labels=''):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.append(f'{name}{labels} {value}')
+
+        lines.append('# HELP tetris_frame_seconds Main loop work per frame, excluding the wait for the next frame')
+        lines.append('# TYPE tetris_frame_seconds summary')
+        for q, value in self.frame_quantiles():
+            lines.append(f'tetris_frame_seconds{{quantile="{q}"}} {value:.6f}')
+        lines.append(f'tetris_frame_seconds_sum {self.frame_seconds:.6f}')
+        lines.append(f'tetris_frame_seconds_count {self.frames}')
+
+        if self.sim_clock is not None:
+            now = self.time_source()
+            ticks = self.sim_clock.total_ticks
+            rate = 0.0
+            if self.last_scrape is not None and now > self.last_scrape[0]:
+                rate = (ticks - self.last_scrape[1]) / (now - self.last_scrape[0])
+            self.last_scrape = (now, ticks)
+            metric('tetris_simulation_ticks_total', 'counter', 'Simulation ticks run', ticks)
+            metric('tetris_simulation_ticks_per_second', 'gauge', 'Simulation ticks per second since the previous scrape', f'{rate:.2f}')
+            metric('tetris_simulation_dropped_ticks_total', 'counter', 'Ticks dropped after falling too far behind', self.sim_clock.dropped_ticks)
+
+        if self.pacer is not None:
+            metric('tetris_idle_waits_total', 'counter', 'Static screen frames that slept until input, a message or a timer', self.pacer.idle_waits)
+
+        if self.manager is not None:
+            metric('tetris_message_queue_depth', 'gauge', 'Messages waiting for the game loop', self.manager.message_queue.qsize())
+
+        network = self.network
+        if network is not None:
+            metric('tetris_network_packets_sent_total', 'counter', 'Datagrams sent', network.packets_sent)
+            metric('tetris_network_bytes_sent_total', 'counter', 'Bytes sent', network.bytes_sent)
+            metric('tetris_network_packets_received_total', 'counter', 'Datagrams received', network.packets_received)
+            metric('tetris_network_bytes_received_total', 'counter', 'Bytes received', network.bytes_received)
+            metric('tetris_network_bad_datagrams_total', 'counter', 'Datagrams dropped because they could not be decoded', network.bad_datagrams)
+            metric('tetris_sync_ack_failures_total', 'counter', 'Sync frames never acknowledged by the peer', network.sync_ack_failures)
+
+        if self.session is not None:
+            metric('tetris_peer_losses_total', 'counter', 'Times an opponent stopped responding mid-match', self.session.losses)
+            metric('tetris_peer_connected', 'gauge', 'Whether every opponent is reachable', int(not self.session.peer_lost))
+
+        game = self.manager.game if self.manager else None
+        controller = game.sync_controller if game is not None else None
+        if controller is not None and controller.enabled:
+            metric('tetris_sync_interval_seconds', 'gauge', 'Current time between sync frames', f'{controller.current:.3f}')
+            metric('tetris_sync_rtt_seconds', 'gauge', 'Smoothed sync frame ack round trip', f'{controller.rtt or 0.0:.6f}')
+            metric('tetris_sync_loss_ratio', 'gauge', 'Smoothed share of sync frame sends that went unacknowledged', f'{controller.loss:.4f}')
+            metric('tetris_board_churn_per_second', 'gauge', 'Locks and cleared lines per second, averaged', f'{controller.churn_rate(controller.time_source()):.3f}')
+
+        counters = self.game_counters()
+        metric('tetris_games_total', 'counter', 'Games started', self.games)
+        metric('tetris_lines_cleared_total', 'counter', 'Lines cleared', counters['lines'])
+        metric('tetris_sabotages_sent_total', 'counter', 'Sabotages sent to the opponent', counters['sabotages_sent'])
+        metric('tetris_sabotages_received_total', 'counter', 'Sabotages received from the opponent', counters['sabotages_received'])
+        metric('tetris_desyncs_total', 'counter', "Sync frames that disagreed with our copy of the opponent's board", counters['desyncs'])
+        lines.append('# HELP tetris_input_overflows_total Presses dropped because an input ring was full')
+        lines.append('# TYPE tetris_input_overflows_total counter')
+        lines.append(f'tetris_input_overflows_total{{queue="button"}} {counters["button_overflows"]}')
+        lines.append(f'tetris_input_overflows_total{{queue="gesture"}} {counters["gesture_overflows"]}')
+
+        metric('tetris_threads', 'gauge', 'Active Python threads', threading.active_count())
+        rss = rss_bytes()
+        if rss is not None:
+            metric('process_resident_memory_bytes', 'gauge', 'Resident memory size in bytes', rss)
+        else:
+            metric('process_max_resident_memory_bytes', 'gauge', 'Peak resident memory size in bytes', peak_rss_bytes())
+        metric('process_open_fds', 'gauge', 'Open file descriptors', open_fds())
+        return '\n'.join(lines) + '\n'
+
+
+# Build the metrics selected by TETRIS_METRICS ('off' disables them) and start serving;
+# TETRIS_METRICS_PORT and TETRIS_METRICS_ADDRESS move the endpoint
+def create_metrics(network=None, manager=None, sim_clock=None, session=None, pacer=None):
+    if os.getenv('TETRIS_METRICS') == 'off':
+        return NullMetrics()
+    metrics = Metrics(network, manager, sim_clock, session, pacer)
+    port = int(os.getenv('TETRIS_METRICS_PORT') or METRICS_PORT)
+    if not metrics.serve(os.getenv('TETRIS_METRICS_ADDRESS') or METRICS_ADDRESS, port):
+        return NullMetrics()
+    return metrics
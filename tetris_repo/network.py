@@ -1,4 +1,5 @@
 import socket
+import struct
 import json
 import select 
 import threading
@@ -13,46 +14,139 @@ class UDPNetwork:
         self.sock.bind((host, port))
         self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
         self.sock.settimeout(0.2) 
+        # Sync frame numbers keep counting up across games on this socket (see
+        # last_sync_frame), so an ack for a frame also covers every earlier frame
+        self.last_sync_frame = 0
         self.last_sync_frame_ack = 0
+        self.sync_acks = {}  # highest sync frame acknowledged by each peer address
+        self.ack_received = threading.Condition()
+        self.group = None  # multicast group of the match, once joined
+        self.session = None  # Optional Session stamping every message and watching the peer
+        # Traffic counters, read by the metrics endpoint
+        self.packets_sent = 0
+        self.bytes_sent = 0
+        self.packets_received = 0
+        self.bytes_received = 0
+        self.sync_ack_failures = 0
+        self.bad_datagrams = 0  # dropped because they were not a JSON object
 
     def send_message(self, message, target_address):
         # Send a JSON-encoded message to the target address
-        self.sock.sendto(json.dumps(message).encode(), target_address)
+        if self.session is not None:
+            self.session.stamp(message)
+        data = json.dumps(message).encode()
+        self.sock.sendto(data, target_address)
+        self.packets_sent += 1
+        self.bytes_sent += len(data)
+
+    def send_to_all(self, message, target_addresses):
+        # Encode a message once and send it to every target, or once to the match's
+        # multicast group when one was joined
+        if self.session is not None:
+            self.session.stamp(message)
+        data = json.dumps(message).encode()
+        for target_address in ([self.group] if self.group else target_addresses):
+            self.sock.sendto(data, target_address)
+            self.packets_sent += 1
+            self.bytes_sent += len(data)
+
+    def join_group(self, group, port):
+        # Receive the match's multicast traffic and send fan-out messages to it
+        membership = struct.pack('4s4s', socket.inet_aton(group), socket.inet_aton('0.0.0.0'))
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 0)
+        self.group = (group, port)
+
+    def send_bytes(self, data, target_address):
+        # Send a raw binary datagram (e.g. the spectator stream) to the target address
+        self.sock.sendto(data, target_address)
+        self.packets_sent += 1
+        self.bytes_sent += len(data)
 
     def receive_message(self):
         # Receive and decode a JSON message, handling timeouts and blocking errors  
         try:
             data, addr = self.sock.recvfrom(1024)
-            return json.loads(data.decode()), addr
+            self.packets_received += 1
+            self.bytes_received += len(data)
+            message = json.loads(data.decode())
+            if not isinstance(message, dict):
+                raise ValueError("message is not a JSON object")
+            if self.session is not None:
+                self.session.heard(message, addr)
+            if message.get("type") == "sync_frame_ack":
+                # Acks arrive on whichever thread is reading; wake the sync frame sender
+                with self.ack_received:
+                    frame_number = message["frame_number"]
+                    self.last_sync_frame_ack = max(self.last_sync_frame_ack, frame_number)
+                    self.sync_acks[addr] = max(self.sync_acks.get(addr, 0), frame_number)
+                    self.ack_received.notify_all()
+            return message, addr
         except socket.timeout:
             return None, None  # Indicate timeout with None values
         except BlockingIOError:
             return None, None  
+        except ValueError:
+            # Truncated, non-UTF-8 or non-JSON datagram (UnicodeDecodeError and
+            # JSONDecodeError are both ValueErrors); drop it rather than the handler thread
+            self.bad_datagrams += 1
+            return None, None
     
-    def send_sync_frame(self, sync_data, target_address):
-        # Start a new thread to send a sync frame and wait for acknowledgment
-        thread = threading.Thread(target=self._send_sync_frame_thread, args=(sync_data, target_address))
+    def send_sync_frame(self, sync_data, target_address, on_done=None):
+        # Start a new thread to send a sync frame and wait for acknowledgment; target_address
+        # may be a list of peers, each of which must acknowledge. Once they all have, or
+        # the frame is given up on, on_done(frame_number, acked, attempts, sent_bytes) is
+        # called from that thread.
+        if self.session is not None:
+            self.session.stamp(sync_data)
+        self.last_sync_frame = max(self.last_sync_frame, sync_data["frame_number"])
+        thread = threading.Thread(target=self._send_sync_frame_thread, args=(sync_data, target_address, on_done))
         thread.start()
         return True
 
-    def _send_sync_frame_thread(self, sync_data, target_address):
-        # Send sync frame and wait for acknowledgment, with timeout
+    def _send_sync_frame_thread(self, sync_data, target_address, on_done=None):
+        # Send sync frame and wait for acknowledgment, with timeout. The ack is read by the
+        # message handler thread; reading the socket here as well would steal its messages.
+        # Retries only go to the peers that have not acknowledged yet.
         start_time = time.time()
+        frame_number = sync_data["frame_number"]
+        data = json.dumps(sync_data).encode()
+        if not isinstance(target_address, list) or len(target_address) == 1:
+            # One peer: any ack for this frame is its ack, whatever address it came from
+            pending = target_address if isinstance(target_address, list) else [target_address]
+            acked = lambda: self.last_sync_frame_ack >= frame_number
+        else:
+            pending = list(target_address)
+            acked = lambda: all(self.sync_acks.get(address, 0) >= frame_number for address in pending)
+        targets = [self.group] if self.group else pending
+        attempts = 0
+        sent_bytes = 0
         while True:
-            self.sock.sendto(json.dumps(sync_data).encode(), target_address)
+            attempts += 1
             try:
-                ack_data, _ = self.receive_message()
-                if ack_data and ack_data["type"] == "sync_frame_ack" and ack_data["frame_number"] == sync_data["frame_number"]:
-                    self.last_sync_frame_ack = ack_data["frame_number"]
-                    break
-            except:
-                pass
-            
+                for target in targets:
+                    self.sock.sendto(data, target)
+                    self.packets_sent += 1
+                    self.bytes_sent += len(data)
+                    sent_bytes += len(data)
+            except OSError:
+                return  # socket closed while the game shut down
+
+            with self.ack_received:
+                # Wait 200ms before retrying
+                done = self.ack_received.wait_for(acked, 0.2)
+            if done:
+                if on_done is not None:
+                    on_done(frame_number, True, attempts, sent_bytes)
+                break
+            targets = [address for address in pending if self.sync_acks.get(address, 0) < frame_number]
+
             if time.time() - start_time > 5:  # Give up after 5 seconds
                 print("Failed to receive acknowledgment for sync frame")
+                self.sync_ack_failures += 1
+                if on_done is not None:
+                    on_done(frame_number, False, attempts, sent_bytes)
                 break
-            
-            time.sleep(0.2)  # Wait 200ms before retrying
 
     def close(self):
         # Close the UDP socket
@@ -0,0 +1,67 @@
+import random
+import pygame
+
+# Screen region for opponents' mini-boards in a match of three or more players, to the
+# right of the sabotage meter
+MINI_AREA = (240, 4, 80, 236)  # x, y, width, height
+MINI_COLUMNS = 2
+MINI_GAP = 8
+LABEL_HEIGHT = 10
+FRAME_COLOR = (63, 63, 63)
+TARGET_COLOR = (255, 0, 0)
+OUT_COLOR = (160, 160, 160)
+LABEL_COLOR = (0, 0, 0)
+BOARD_HISTORY = 8  # an opponent's recent sync frame boards kept as references for deltas
+
+
+# One opponent as this cabinet sees them: their board rebuilt from lock events and sync
+# frames, score and next piece. version changes with every update so the mini-board
+# surface is only redrawn when something on it changed.
+class Opponent:
+    def __init__(self, game, address):
+        self.address = address
+        self.grid = game.create_grid(2)
+        self.next_shape = random.choice(game.SHAPES)
+        self.score = 0
+        self.game_over = False
+        self.lost_at = None  # when the match was paused waiting for them
+        self.forfeited = False  # given up on after PEER_GIVE_UP; their messages are ignored
+        self.last_received_frame = -1
+        self.boards = {}  # sync frame number -> color board rows
+        self.version = 0
+        self.surface = None
+        self.surface_key = None
+
+    # The mini-board: board, frame and score label, rendered again only on a change
+    def mini_board(self, game, cell, font, targeted):
+        key = (self.version, cell, targeted)
+        if self.surface_key == key:
+            return self.surface
+        columns = game.PLAYER_DATA[2]['COLUMNS']
+        rows = game.PLAYER_DATA[2]['ROWS']
+        width = columns * cell + 2
+        height = rows * cell + 2
+        surface = pygame.Surface((width, height + LABEL_HEIGHT))
+        surface.fill(game.WHITE)
+        pygame.draw.rect(surface, game.BLACK, (1, 1, width - 2, height - 2))
+        for y, row in enumerate(self.grid):
+            for x, value in enumerate(row):
+                if value != game.BLACK:
+                    surface.fill(OUT_COLOR if self.game_over else value, (1 + x * cell, 1 + y * cell, cell, cell))
+        pygame.draw.rect(surface, TARGET_COLOR if targeted else FRAME_COLOR, (0, 0, width, height), 1)
+        label = font.render("OUT" if self.game_over else str(self.score), True, LABEL_COLOR)
+        surface.blit(label, label.get_rect(centerx=width // 2, top=height))
+        self.surface = surface
+        self.surface_key = key
+        return surface
+
+
+# Cell size and top-left corner of each mini-board for a number of opponents
+def mini_board_layout(count):
+    x0, y0, width, height = MINI_AREA
+    cell = 3 if count <= 4 else 2
+    slot_width = 10 * cell + 2 + MINI_GAP
+    slot_height = 20 * cell + 2 + LABEL_HEIGHT + MINI_GAP // 2
+    positions = [(x0 + (i % MINI_COLUMNS) * slot_width, y0 + (i // MINI_COLUMNS) * slot_height)
+                 for i in range(count)]
+    return cell, positions
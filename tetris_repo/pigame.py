@@ -11,7 +11,7 @@ except ImportError:
     support_gpio = False
 from pygame.locals import *
 class PiTft:
-    def __init__(self,rotation:int=-1,v2:bool=False if env['PIGAME_V2']=='off' else True,allow_gpio:bool=True,invertx:bool=True if env['PIGAME_INVERTX']=='on' else False,inverty:bool=True if env['PIGAME_INVERTY']=='on' else False,swapxy:bool=True if env['PIGAME_SWAPXY']=='on' else False,buttons=[False if env['PIGAME_BTN1']=='off' else True,False if env['PIGAME_BTN2']=='off' else True,False if env['PIGAME_BTN3']=='off' else True,False if env['PIGAME_BTN4']=='off' else True]):
+    def __init__(self,rotation:int=-1,v2:bool=False if env['PIGAME_V2']=='off' else True,allow_gpio:bool=True,invertx:bool=True if env['PIGAME_INVERTX']=='on' else False,inverty:bool=True if env['PIGAME_INVERTY']=='on' else False,swapxy:bool=True if env['PIGAME_SWAPXY']=='on' else False,buttons=[False if env['PIGAME_BTN1']=='off' else True,False if env['PIGAME_BTN2']=='off' else True,False if env['PIGAME_BTN3']=='off' else True,False if env['PIGAME_BTN4']=='off' else True],reactor=None):
         self.use_gpio = support_gpio and allow_gpio and not (os.getenv('PIGAME_GPIO') == 'off')
         if not self.use_gpio:
             buttons=[False,False,False,False]
@@ -24,7 +24,8 @@ class PiTft:
         self.invertx = invertx
         self.inverty = inverty
         self.swapxy = swapxy
-        self.cachedpos = [0,0]
+        self.rawpos = (0,0)
+        self.affine = self.__affine()
         self.__b1 = False
         self.__b2 = False
         self.__b3 = False
@@ -49,49 +50,78 @@ class PiTft:
                 self.__pin4 = 21
             GPIO.setup(self.__pin4, GPIO.IN, pull_up_down=GPIO.PUD_UP)
             self.__b4 = True
-        self.pitft.start()
+        if reactor:
+            # Read the touchscreen on the shared input reactor instead of a thread of its own
+            reactor.add_touchscreen(self.pitft)
+        else:
+            self.pitft.start()
+    def __affine(self):
+        """Precompute the affine transform from raw touch coordinates to screen pixels."""
+        # (a,b,c,d,tx,ty): X=a*x+b*y+tx, Y=c*x+d*y+ty. Raw touchscreen axes are swapped.
+        m=(0,1,1,0,0,0)
+        flipx=lambda m:(-m[0],-m[1],m[2],m[3],320-m[4],m[5])
+        flipy=lambda m:(m[0],m[1],-m[2],-m[3],m[4],240-m[5])
+        if self.pitft.pigamerotr==90:
+            m=flipy(m)
+        elif self.pitft.pigamerotr==270:
+            m=flipx(m)
+        else:
+            raise(Exception("PiTft rotation is unsupported"))
+        if self.invertx:
+            m=flipx(m)
+        if self.inverty:
+            m=flipy(m)
+        if self.swapxy:
+            m=(m[2],m[3],m[0],m[1],m[5],m[4])
+        return m
+    def add_gesture_recognizer(self,sink):
+        """Recognize gameplay gestures on the touchscreen thread and send actions to sink."""
+        import gestures
+        recognizer=gestures.GestureRecognizer(sink,self.affine)
+        self.pitft.listener=recognizer.feed
+        return recognizer
     def update(self):
-        """Add Touchscreen Events to PyGame event queue."""
-        while not self.pitft.queue_empty():
-            for r in self.pitft.get_event():
-                e={"y":(r["x"] if r["x"] else self.cachedpos[0]),"x":(r["y"] if r["y"] else self.cachedpos[1])}
-                rel=(e["x"] - self.cachedpos[0],e["y"] - self.cachedpos[1])
-                self.cachedpos=(e["x"],e["y"])
-                if self.pitft.pigamerotr==90:
-                    e={"x":e["x"],"y":240-e["y"]}
-                    rel=(rel[0],240-rel[1])
-                elif self.pitft.pigamerotr==270:
-                    e={"x":320-e["x"],"y":e["y"]}
-                    rel=(320-rel[0],rel[1])
-                else:
-                    raise(Exception("PiTft rotation is unsupported"))
-                d={}
-                t=MOUSEBUTTONUP if r["touch"]==0 else (MOUSEMOTION if self.pitft.button_down else MOUSEBUTTONDOWN)
-                if self.invertx:
-                    e={"x":320-e["x"],"y":e["y"]}
-                    rel=(320-rel[0],rel[1])
-                if self.inverty:
-                    rel=(rel[0],240-rel[1])
-                    e={"y":240-e["y"],"x":e["x"]}
-                if self.swapxy:
-                    rel=(rel[1],rel[0])
-                    e={"x":e["y"],"y":e["x"]}
-                if t==MOUSEBUTTONDOWN:
-                    d["button"]=1
-                    d["pos"]=(e["x"],e["y"])
-                    self.pitft.button_down = True
-                    pygame.mouse.set_pos(e["x"],e["y"])
-                elif t==MOUSEBUTTONUP:
-                    self.pitft.button_down = False
-                    d["button"]=1
-                    d["pos"]=(e["x"],e["y"])
-                else:
-                    d["buttons"]=(True,False,False)
-                    d["rel"]=rel
-                    d["pos"]=(e["x"],e["y"])
-                    pygame.mouse.set_pos(e["x"],e["y"])
-                pe=pygame.event.Event(t,d)
-                pygame.event.post(pe)
+        """Add Touchscreen Events to PyGame event queue, one batch per frame."""
+        samples=self.pitft.drain_events()
+        if not samples:
+            return
+        a,b,c,d,tx,ty=self.affine
+        motion=None
+        moved=False
+        for r in samples:
+            x=r.x if r.x is not None else self.rawpos[0]
+            y=r.y if r.y is not None else self.rawpos[1]
+            if r.touch!=0 and self.pitft.button_down:
+                # Coalesce consecutive motion samples into one event per batch
+                if motion is None:
+                    motion=(self.rawpos,r.captured)
+                self.rawpos=(x,y)
+                continue
+            if motion is not None:
+                self.__post_motion(motion)
+                motion=None
+            self.rawpos=(x,y)
+            pos=(a*x+b*y+tx,c*x+d*y+ty)
+            if r.touch==0:
+                self.pitft.button_down=False
+                pygame.event.post(pygame.event.Event(MOUSEBUTTONUP,{"button":1,"pos":pos,"captured":r.captured}))
+            else:
+                self.pitft.button_down=True
+                moved=True
+                pygame.event.post(pygame.event.Event(MOUSEBUTTONDOWN,{"button":1,"pos":pos,"captured":r.captured}))
+        if motion is not None:
+            self.__post_motion(motion)
+            moved=True
+        if moved:
+            x,y=self.rawpos
+            pygame.mouse.set_pos(a*x+b*y+tx,c*x+d*y+ty)
+    def __post_motion(self,motion):
+        """Post one MOUSEMOTION covering every sample since the run started."""
+        a,b,c,d,tx,ty=self.affine
+        (sx,sy),captured=motion
+        x,y=self.rawpos
+        dx,dy=x-sx,y-sy
+        pygame.event.post(pygame.event.Event(MOUSEMOTION,{"buttons":(True,False,False),"rel":(a*dx+b*dy,c*dx+d*dy),"pos":(a*x+b*y+tx,c*x+d*y+ty),"captured":captured}))
     def __del__(self):
         """Cleaning up Touchscreen events and Threads when the Object destroyed."""
         self.pitft.stop()
@@ -2,6 +2,8 @@
 #  piTFT touchscreen handling using evdev
 
 import os
+import select
+import time
 
 try:
     import evdev
@@ -9,6 +11,7 @@ except ImportError:
     print("Evdev package is not installed.  Run 'pip3 install evdev' or 'pip install evdev' (Python 2.7) to install.")
     raise(ImportError("Evdev package not found."))
 import threading
+from collections import namedtuple
 try:
     # python 3.5+
     import queue
@@ -17,24 +20,32 @@ except ImportError:
     import Queue as queue
 
 
+# One touch report, emitted at each SYN_REPORT
+TouchSample = namedtuple('TouchSample', ['time', 'id', 'x', 'y', 'touch', 'captured'])
+
+
 # Class for handling events from piTFT
 class pitft_touchscreen(threading.Thread):
     def __init__(self, device_path=os.getenv("PIGAME_TS") or "/dev/input/touchscreen", grab=False):
         super(pitft_touchscreen, self).__init__()
         self.device_path = device_path
+        # run thread as a daemon so it gets cleaned up on exit.
+        self.daemon = True
         self.grab = grab
         self.events = queue.Queue()
         self.shutdown = threading.Event()
+        self.device = None
+        # State of the report being assembled
+        self.x = self.y = self.touch = self.tracking_id = None
+        self.dropping = False
+        # Optional callable fed every sample on this thread (e.g. a gesture recognizer)
+        self.listener = None
 
     def run(self):
-        thread_process = threading.Thread(target=self.process_device)
-        # run thread as a daemon so it gets cleaned up on exit.
-        thread_process.daemon = True
-        thread_process.start()
-        self.shutdown.wait()
+        self.process_device()
 
-    # thread function
-    def process_device(self):
+    # Open the evdev device; raises with a descriptive message if it is missing
+    def open_device(self):
         device = None
         # if the path to device is not found, InputDevice raises an OSError
         # exception.  This will handle it and close thread.
@@ -50,59 +61,72 @@ class pitft_touchscreen(threading.Thread):
         finally:
             if device is None:
                 self.shutdown.set()
-        # Loop for getting evdev events
-        event = {'time': None, 'id': None, 'x': None, 'y': None, 'touch': None}
-        dropping = False
+        self.device = device
+        return device
+
+    # thread function
+    def process_device(self):
+        device = self.open_device()
+        # Wait with a timeout instead of read_loop() so stop() can interrupt the thread
         while not self.shutdown.is_set():
-            for input_event in device.read_loop():
-                if input_event.type == evdev.ecodes.EV_ABS:
-                    if input_event.code == evdev.ecodes.ABS_X:
-                        event['x'] = input_event.value
-                    elif input_event.code == evdev.ecodes.ABS_Y:
-                        event['y'] = input_event.value
-                    elif input_event.code == evdev.ecodes.ABS_MT_TRACKING_ID:
-                        event['id'] = input_event.value
-                        if input_event.value == -1:
-                            event['x'] = None
-                            event['y'] = None
-                            event['touch'] = None
-                    elif input_event.code == evdev.ecodes.ABS_MT_POSITION_X:
-                        pass
-                    elif input_event.code == evdev.ecodes.ABS_MT_POSITION_Y:
-                        pass
-                elif input_event.type == evdev.ecodes.EV_KEY:
-                    event['touch'] = input_event.value
-                elif input_event.type == evdev.ecodes.SYN_REPORT:
-                    if dropping:
-                        event['x'] = None
-                        event['y'] = None
-                        event['touch'] = None
-                        dropping = False
-                    else:
-                        event['time'] = input_event.timestamp()
-                        self.events.put(event)
-                        e = event
-                        event = {'x': e['x'], 'y': e['y']}
-                        try:
-                            event['id'] = e['id']
-                        except KeyError:
-                            event['id'] = None
-                        try:
-                            event['touch'] = e['touch']
-                        except KeyError:
-                            event['touch'] = None
-                elif input_event.type == evdev.ecodes.SYN_DROPPED:
-                    dropping = True
-        if self.grab:
-            device.ungrab()
+            readable, _, _ = select.select([device.fd], [], [], 0.2)
+            if readable:
+                for input_event in device.read():
+                    self.handle_input_event(input_event)
+        self.close()
+
+    # Fold one evdev event into the current report; queues a sample at SYN_REPORT
+    def handle_input_event(self, input_event):
+        if input_event.type == evdev.ecodes.EV_ABS:
+            if input_event.code == evdev.ecodes.ABS_X:
+                self.x = input_event.value
+            elif input_event.code == evdev.ecodes.ABS_Y:
+                self.y = input_event.value
+            elif input_event.code == evdev.ecodes.ABS_MT_TRACKING_ID:
+                self.tracking_id = input_event.value
+                if input_event.value == -1:
+                    self.x = self.y = self.touch = None
+        elif input_event.type == evdev.ecodes.EV_KEY:
+            self.touch = input_event.value
+        elif input_event.type == evdev.ecodes.SYN_REPORT:
+            if self.dropping:
+                self.x = self.y = self.touch = None
+                self.dropping = False
+            else:
+                # Monotonic capture stamp for input-to-photon latency tracing
+                sample = TouchSample(input_event.timestamp(), self.tracking_id, self.x, self.y,
+                                     self.touch, time.monotonic_ns())
+                self.events.put(sample)
+                if self.listener:
+                    self.listener(sample)
+        elif input_event.type == evdev.ecodes.SYN_DROPPED:
+            self.dropping = True
+
+    # Release the device
+    def close(self):
+        if self.device is not None:
+            if self.grab:
+                self.device.ungrab()
+            self.device.close()
+            self.device = None
 
     def get_event(self):
         if not self.events.empty():
             event = self.events.get()
-            yield event
+            yield event._asdict()
         else:
             yield None
 
+    # Pull every pending sample in one call
+    def drain_events(self):
+        samples = []
+        try:
+            while True:
+                samples.append(self.events.get_nowait())
+        except queue.Empty:
+            pass
+        return samples
+
     def queue_empty(self):
         return self.events.empty()
 
@@ -0,0 +1,180 @@
+import cProfile
+import json
+import os
+import pstats
+import time
+from collections import deque
+import pygame
+
+# Phases timed each frame, in the order they run
+PHASES = ('process_messages', 'input', 'gravity', 'draw', 'flip')
+
+# Rolling window of frames used for percentiles (10 seconds at 60 FPS)
+WINDOW = 600
+
+# Upper bound on buffered trace events so a long session cannot grow without limit
+TRACE_CAPACITY = 60000
+
+HUD_REFRESH = 0.5  # seconds between HUD re-renders
+
+
+# Disabled profiler; keeps the instrumented code paths free of checks
+class NullProfiler:
+    enabled = False
+
+    def begin(self, phase):
+        pass
+
+    def end(self, phase):
+        pass
+
+    def record_queue_depth(self, name, depth):
+        pass
+
+    def record_overflows(self, name, count):
+        pass
+
+    def end_frame(self):
+        pass
+
+    def draw_hud(self, screen):
+        pass
+
+
+# Times frame phases with perf_counter_ns, keeps rolling percentiles, records queue
+# depths and buffers Chrome-trace events for export
+class FrameProfiler:
+    enabled = True
+
+    def __init__(self, window=WINDOW, trace_capacity=TRACE_CAPACITY):
+        self.samples = {phase: deque(maxlen=window) for phase in PHASES}
+        self.samples['frame'] = deque(maxlen=window)
+        self.queue_depths = {}
+        self.overflows = {}  # queue name -> entries dropped because it was full
+        self.window = window
+        self.trace = deque(maxlen=trace_capacity)
+        self.started = {}
+        self.frame_start = time.perf_counter_ns()
+        self.origin = self.frame_start
+        self.show_hud = False
+        self.hud_surface = None
+        self.hud_updated = 0.0
+        self.hud_font = None
+        self.cprofile = None
+        self.cprofile_until = 0.0
+
+    # Mark the start of a phase
+    def begin(self, phase):
+        self.started[phase] = time.perf_counter_ns()
+
+    # Mark the end of a phase and record its duration
+    def end(self, phase):
+        now = time.perf_counter_ns()
+        start = self.started.pop(phase, now)
+        self.samples[phase].append(now - start)
+        self.trace.append(('X', phase, start, now - start))
+
+    # Sample the depth of a queue once per frame
+    def record_queue_depth(self, name, depth):
+        if name not in self.queue_depths:
+            self.queue_depths[name] = deque(maxlen=self.window)
+        self.queue_depths[name].append(depth)
+        self.trace.append(('C', name, time.perf_counter_ns(), depth))
+
+    # Note how many entries a bounded queue has dropped so far
+    def record_overflows(self, name, count):
+        self.overflows[name] = count
+
+    # Close the current frame; also stops a cProfile run whose time is up
+    def end_frame(self):
+        now = time.perf_counter_ns()
+        self.samples['frame'].append(now - self.frame_start)
+        self.frame_start = now
+        if self.cprofile and time.monotonic() >= self.cprofile_until:
+            self.stop_cprofile()
+
+    # Return the given percentiles (in milliseconds) of a phase over the rolling window
+    def percentiles(self, phase, points=(50, 95, 99)):
+        values = sorted(self.samples[phase])
+        if not values:
+            return [0.0 for _ in points]
+        return [values[min(len(values) - 1, len(values) * p // 100)] / 1e6 for p in points]
+
+    # Return the maximum depth seen for a queue over the rolling window
+    def max_queue_depth(self, name):
+        depths = self.queue_depths.get(name)
+        return max(depths) if depths else 0
+
+    # Toggle the on-screen overlay
+    def toggle_hud(self):
+        self.show_hud = not self.show_hud
+        self.hud_surface = None
+
+    # Draw the overlay with p50/p95/p99 per phase, queue depths and dropped inputs
+    def draw_hud(self, screen):
+        if not self.show_hud:
+            return
+        now = time.monotonic()
+        if self.hud_surface is None or now - self.hud_updated >= HUD_REFRESH:
+            self.hud_surface = self.render_hud()
+            self.hud_updated = now
+        screen.blit(self.hud_surface, (0, 0))
+
+    # Render the overlay text onto a translucent surface
+    def render_hud(self):
+        if self.hud_font is None:
+            self.hud_font = pygame.font.Font(None, 16)
+        lines = ["phase    p50   p95   p99 ms"]
+        for phase in ('frame',) + PHASES:
+            p50, p95, p99 = self.percentiles(phase)
+            lines.append(f"{phase[:8]:<8} {p50:5.2f} {p95:5.2f} {p99:5.2f}")
+        for name in sorted(self.queue_depths):
+            lines.append(f"{name} max {self.max_queue_depth(name)}")
+        for name in sorted(self.overflows):
+            lines.append(f"{name} dropped {self.overflows[name]}")
+        if self.cprofile:
+            lines.append("cProfile running")
+        surface = pygame.Surface((170, 12 * len(lines) + 4))
+        surface.set_alpha(190)
+        surface.fill((0, 0, 0))
+        for i, line in enumerate(lines):
+            surface.blit(self.hud_font.render(line, True, (0, 255, 0)), (2, 2 + i * 12))
+        return surface
+
+    # Write the buffered events as a Chrome trace (load in chrome://tracing or Perfetto)
+    def export_chrome_trace(self, path):
+        events = []
+        pid = os.getpid()
+        for kind, name, start, value in self.trace:
+            ts = (start - self.origin) / 1000.0
+            if kind == 'C':
+                events.append({"name": name, "ph": "C", "ts": ts, "pid": pid, "tid": 0,
+                               "args": {"depth": value}})
+            else:
+                events.append({"name": name, "ph": "X", "ts": ts, "dur": value / 1000.0,
+                               "pid": pid, "tid": 0})
+        with open(path, "w") as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+        print(f"Wrote {len(events)} trace events to {path}")
+
+    # Run cProfile over the main thread for the given number of seconds
+    def start_cprofile(self, seconds):
+        if self.cprofile:
+            return
+        self.cprofile = cProfile.Profile()
+        self.cprofile_until = time.monotonic() + seconds
+        self.cprofile.enable()
+
+    # Stop the running cProfile session and save its stats
+    def stop_cprofile(self, path="frame_profile.prof"):
+        self.cprofile.disable()
+        self.cprofile.dump_stats(path)
+        pstats.Stats(self.cprofile).sort_stats("cumulative").print_stats(15)
+        self.cprofile = None
+
+
+# Build the profiler selected by TETRIS_PROFILE ('on' enables it)
+def create_profiler():
+    if os.getenv('TETRIS_PROFILE') == 'on':
+        return FrameProfiler()
+    return NullProfiler()
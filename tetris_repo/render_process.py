@@ -0,0 +1,60 @@
+import pygame
+import screens
+from hal import load_display
+import snapshot
+from tetris_game import TetrisGame
+
+RENDER_FPS = 60
+# Polling rate while the latest snapshot shows a static screen
+IDLE_POLL_FPS = 15
+
+
+# Render loop for split mode. Runs in its own process, owns the display and draws
+# whatever the simulation process last published to shared memory.
+def run_renderer(shm_name, stop_event, fps=RENDER_FPS):
+    display = load_display()
+    pygame.init()
+    screen = display.open()
+    fonts = screens.ScreenFonts()
+    clock = pygame.time.Clock()
+
+    # Drawing-only game instance; its state is overwritten from each snapshot
+    view = TetrisGame(screen, None, None)
+    shared = snapshot.SharedSnapshot.attach(shm_name)
+    last_seq = 0
+
+    try:
+        while not stop_event.is_set():
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    stop_event.set()
+            display.update()
+
+            snap = shared.read()
+            idle = (snap is None or not snapshot.SCENE_ANIMATING[snap.scene]
+                    or snap.flags & snapshot.FLAG_GAME_OVER)
+            if snap is None or snap.seq == last_seq:
+                clock.tick(IDLE_POLL_FPS if idle else fps)
+                continue
+            last_seq = snap.seq
+
+            screen.fill((0, 0, 0))
+            if snap.scene == snapshot.SCENE_MENU:
+                screens.draw_landing(screen, fonts)
+            elif snap.scene == snapshot.SCENE_MATCHMAKING:
+                screens.draw_matchmaking(screen, fonts)
+            elif snap.scene == snapshot.SCENE_NO_MATCH:
+                screens.draw_no_match(screen, fonts)
+            elif snap.scene == snapshot.SCENE_START_MATCH:
+                screens.draw_start_match(screen, fonts)
+            elif snap.scene == snapshot.SCENE_COUNTDOWN:
+                screens.draw_countdown(screen, fonts, snap.countdown)
+            else:
+                snapshot.apply_snapshot(view, snap)
+                view.draw()
+
+            pygame.display.flip()
+            clock.tick(IDLE_POLL_FPS if idle else fps)
+    finally:
+        shared.close()
+        pygame.quit()
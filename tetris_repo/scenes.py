@@ -0,0 +1,336 @@
+import math
+import time
+from queue import Queue
+import screens
+import snapshot
+
+REQUEST_INTERVAL = 1.0  # Send a matchmaking request every second
+COUNTDOWN_SECONDS = 3
+START_LEAD = 0.25  # Start the countdown slightly in the future so the peer hears about it in time
+
+# Messages that drive scene transitions rather than gameplay
+CONTROL_MESSAGES = ('request', 'request_ack', 'ack_ack', 'start_game')
+
+
+# One screen of the application. The scheduler calls update() every frame and the
+# handle_* hooks as buttons and control messages arrive; each of them returns the next
+# scene, or None to stay. Nothing here blocks, so input and network keep flowing.
+class Scene:
+    scene_id = None
+    animating = False  # Redraw every frame instead of waiting for events
+
+    def __init__(self, manager):
+        self.manager = manager
+
+    # Called once when the scene becomes current
+    def enter(self, now):
+        pass
+
+    def update(self, now):
+        return None
+
+    def handle_button(self, name, now):
+        return None
+
+    def handle_control(self, message, addr, now):
+        return None
+
+    def render(self, screen):
+        pass
+
+    # Hand the scene to the split-mode renderer
+    def publish(self, shared):
+        shared.publish_scene(self.scene_id)
+
+    # Time at which a timer needs the scene updated even if nothing else happens
+    def deadline(self):
+        return None
+
+
+# Landing page; rotate looks for a match
+class MenuScene(Scene):
+    scene_id = snapshot.SCENE_MENU
+
+    def handle_button(self, name, now):
+        if name == 'rotate':
+            return MatchmakingScene(self.manager)
+
+    def render(self, screen):
+        screens.draw_landing(screen, self.manager.fonts)
+
+
+# Attempt to establish a connection with the other players. With more than one
+# opponent the handshake runs with each of them and the match starts once all are in.
+class MatchmakingScene(Scene):
+    scene_id = snapshot.SCENE_MATCHMAKING
+
+    def enter(self, now):
+        self.started = now
+        self.last_request = 0
+        self.connected = {}  # address -> session token of each opponent connected so far
+
+    def update(self, now):
+        if now - self.started >= self.manager.match_timeout:
+            return NoMatchScene(self.manager)
+        # Send request periodically
+        if now - self.last_request >= REQUEST_INTERVAL:
+            pending = [addr for addr in self.manager.peer_addresses if addr not in self.connected]
+            self.manager.network.send_to_all({"type": "request"}, pending)
+            print("request sent")
+            self.last_request = now
+
+    def handle_control(self, message, addr, now):
+        network = self.manager.network
+        if message["type"] == "request":
+            # Respond to incoming request
+            network.send_message({"type": "request_ack"}, addr)
+        elif message["type"] == "request_ack":
+            # Respond to acknowledgment
+            network.send_message({"type": "ack_ack"}, addr)
+            return self.connect(addr, message)
+        elif message["type"] == "ack_ack":
+            # Connection confirmed
+            return self.connect(addr, message)
+
+    def connect(self, addr, message):
+        peers = self.manager.peer_addresses
+        if len(peers) == 1:
+            return self.manager.connected(addr)
+        if addr not in peers:
+            return None  # not one of this match's cabinets
+        self.connected[addr] = message.get("session")
+        if len(self.connected) == len(peers):
+            return self.manager.connected(peers, [self.connected[peer] for peer in peers])
+
+    def render(self, screen):
+        screens.draw_matchmaking(screen, self.manager.fonts)
+
+    def deadline(self):
+        return min(self.last_request + REQUEST_INTERVAL, self.started + self.manager.match_timeout)
+
+
+# Matchmaking timed out; rotate tries again
+class NoMatchScene(Scene):
+    scene_id = snapshot.SCENE_NO_MATCH
+
+    def handle_button(self, name, now):
+        if name == 'rotate':
+            return MatchmakingScene(self.manager)
+
+    def render(self, screen):
+        screens.draw_no_match(screen, self.manager.fonts)
+
+
+# Connected; whichever player presses rotate first starts the countdown on both sides
+class StartMatchScene(Scene):
+    scene_id = snapshot.SCENE_START_MATCH
+
+    def handle_button(self, name, now):
+        if name == 'rotate':
+            return CountdownScene(self.manager, self.manager.match_time() + START_LEAD, announce=True)
+
+    def handle_control(self, message, addr, now):
+        # Keep answering the handshake for a player whose last message to us was lost
+        if message["type"] == "request":
+            self.manager.network.send_message({"type": "request_ack"}, addr)
+        elif message["type"] == "request_ack":
+            self.manager.network.send_message({"type": "ack_ack"}, addr)
+        elif message["type"] == "start_game":
+            return CountdownScene(self.manager, message.get("start_at", self.manager.match_time()))
+
+    def render(self, screen):
+        screens.draw_start_match(screen, self.manager.fonts)
+
+
+# Counts down on the match clock from a shared start time so both peers begin play
+# together however late the start message arrives. The player who started the match
+# repeats the announcement every second in case a packet is lost.
+class CountdownScene(Scene):
+    scene_id = snapshot.SCENE_COUNTDOWN
+
+    def __init__(self, manager, start_at, announce=False):
+        super().__init__(manager)
+        self.start_at = start_at
+        self.announce = announce
+
+    def enter(self, now):
+        match_now = self.manager.match_time()
+        # A peer clock this far off cannot be trusted; count from our own clock instead
+        if abs(self.start_at - match_now) > COUNTDOWN_SECONDS:
+            self.start_at = match_now
+        self.play_at = self.start_at + self.manager.countdown
+        self.remaining = self.seconds_left(match_now)
+        self.manager.start_game()
+        self.send_start()
+
+    def send_start(self):
+        if self.announce:
+            self.manager.network.send_to_all({"type": "start_game", "start_at": self.start_at},
+                                             self.manager.partner_addresses)
+
+    def seconds_left(self, match_now):
+        return max(1, min(self.manager.countdown, math.ceil(self.play_at - match_now)))
+
+    def update(self, now):
+        match_now = self.manager.match_time()
+        if match_now >= self.play_at:
+            self.manager.sim_clock.reset()
+            return PlayScene(self.manager)
+        remaining = self.seconds_left(match_now)
+        if remaining != self.remaining:
+            self.remaining = remaining
+            self.send_start()
+
+    def render(self, screen):
+        screens.draw_countdown(screen, self.manager.fonts, self.remaining)
+
+    def publish(self, shared):
+        shared.publish_scene(self.scene_id, self.remaining)
+
+    # Wake on each whole second of the countdown
+    def deadline(self):
+        target = self.play_at - (self.remaining - 1)
+        return self.manager.time_source() + target - self.manager.match_time()
+
+
+# Base for the scenes that show a game board
+class GameScene(Scene):
+    def render(self, screen):
+        self.manager.game.draw()
+
+    def publish(self, shared):
+        shared.publish_game(self.manager.game, self.scene_id)
+
+    # Pick the scene matching the game's flags, or None if it is the current one
+    def follow_game(self):
+        game = self.manager.game
+        if game.entering_initials:
+            scene = InitialsScene
+        elif game.show_leaderboard:
+            scene = LeaderboardScene
+        else:
+            scene = GameOverScene
+        if type(self) is not scene:
+            return scene(self.manager)
+
+
+class PlayScene(GameScene):
+    scene_id = snapshot.SCENE_PLAY
+    animating = True
+
+    def update(self, now):
+        if self.manager.game.update(self.manager.message_queue, self.manager.sim_clock):
+            return self.follow_game()
+
+
+# Game over screen with the leaderboard button; the game handles its own menu input
+class GameOverScene(GameScene):
+    scene_id = snapshot.SCENE_GAME_OVER
+
+    def update(self, now):
+        self.manager.game.update(self.manager.message_queue)
+        return self.follow_game()
+
+
+class InitialsScene(GameOverScene):
+    scene_id = snapshot.SCENE_INITIALS
+
+    def render(self, screen):
+        self.manager.game.draw_initials_input()
+
+
+class LeaderboardScene(GameOverScene):
+    scene_id = snapshot.SCENE_LEADERBOARD
+
+
+# Runs the current scene. Buttons and control messages arrive on queues from the
+# GPIO and network threads and are dispatched on the main thread.
+class SceneManager:
+    def __init__(self, network, peer_address, fonts, game_factory, sim_clock, match_timeout,
+                 clock_sync=None, time_source=time.time, countdown=COUNTDOWN_SECONDS):
+        self.network = network
+        # The opponents to match with: one address, or a list for three or more players
+        self.peer_addresses = peer_address if isinstance(peer_address, list) else [peer_address]
+        self.peer_address = self.peer_addresses[0]
+        self.fonts = fonts
+        self.game_factory = game_factory  # callable(partner_address or list) -> TetrisGame
+        self.sim_clock = sim_clock
+        self.match_timeout = match_timeout
+        self.countdown = countdown  # seconds from the start of the match to play
+        self.time_source = time_source
+        # Shared match clock for anything both peers must agree on
+        self.clock_sync = clock_sync
+        self.match_time = clock_sync.match_time if clock_sync else time_source
+        self.partner_address = None
+        self.partner_addresses = []
+        self.game = None
+        self.game_listeners = []  # called with each new game, e.g. by the metrics
+        self.running = True
+        self.buttons = Queue()  # Button names pressed while no game is running
+        self.control_queue = Queue()  # (message, addr) for CONTROL_MESSAGES
+        self.message_queue = Queue()  # Gameplay messages for TetrisGame
+        self.scene = None
+        self.switch(MenuScene(self), self.time_source())
+
+    # Queue a button press; safe to call from input threads
+    def press(self, name):
+        self.buttons.put(name)
+
+    # Queue a control message; safe to call from the network thread
+    def post_control(self, message, addr):
+        self.control_queue.put((message, addr))
+
+    # Every opponent is connected; addr is the one address of a two-player match, or the
+    # list of addresses with their session tokens for more players
+    def connected(self, addr, tokens=None):
+        self.partner_addresses = addr if isinstance(addr, list) else [addr]
+        self.partner_address = self.partner_addresses[0]
+        if self.clock_sync:
+            if len(self.partner_addresses) == 1:
+                self.clock_sync.start(self.partner_address)
+            else:
+                self.start_reference_clock(tokens)
+        return StartMatchScene(self)
+
+    # The match clock of three or more cabinets is the clock of the one with the lowest
+    # session token, which every cabinet works out the same way
+    def start_reference_clock(self, tokens):
+        session = self.network.session
+        own = session.token if session is not None else ''
+        reference = min((token or '', addr) for token, addr in zip(tokens, self.partner_addresses))
+        if own <= reference[0]:
+            self.clock_sync.start(None, share=0.0)
+        else:
+            self.clock_sync.start(reference[1], share=1.0)
+
+    def start_game(self):
+        if self.game is not None:
+            self.game.abandon_leaderboard_entry()
+        if len(self.partner_addresses) > 1:
+            self.game = self.game_factory(list(self.partner_addresses))
+        else:
+            self.game = self.game_factory(self.partner_address)
+        for listener in self.game_listeners:
+            listener(self.game)
+
+    def switch(self, scene, now):
+        if scene is not None:
+            self.scene = scene
+            scene.enter(now)
+
+    # Dispatch queued buttons and control messages, then run the current scene's timers
+    def update(self):
+        now = self.time_source()
+        while not self.buttons.empty():
+            self.switch(self.scene.handle_button(self.buttons.get(), now), now)
+        while not self.control_queue.empty():
+            message, addr = self.control_queue.get()
+            self.switch(self.scene.handle_control(message, addr, now), now)
+        self.switch(self.scene.update(now), now)
+
+    # Seconds until the current scene's next timer, or None if it only reacts to events
+    def timeout(self):
+        deadline = self.scene.deadline()
+        if deadline is None:
+            return None
+        return max(0.0, deadline - self.time_source())
@@ -0,0 +1,204 @@
+import json
+import sqlite3
+import time
+from datetime import datetime
+
+DB_PATH = 'scores.db'
+TOP_K = 10  # entries kept on each persistent board
+
+BOARD_ALL = 'all'
+BOARD_DAILY = 'daily'
+BOARD_WEEKLY = 'weekly'
+BOARDS = (BOARD_ALL, BOARD_DAILY, BOARD_WEEKLY)
+
+ANONYMOUS = '---'  # initials of a game kept in the history but off the boards and player totals
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    played_at INTEGER NOT NULL,
+    initials TEXT NOT NULL,
+    score INTEGER NOT NULL,
+    lines INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    opponent TEXT
+);
+CREATE INDEX IF NOT EXISTS games_played_at ON games (played_at);
+CREATE INDEX IF NOT EXISTS games_initials ON games (initials, played_at);
+
+CREATE TABLE IF NOT EXISTS top_scores (
+    board TEXT NOT NULL,
+    period TEXT NOT NULL,
+    score INTEGER NOT NULL,
+    game_id INTEGER NOT NULL REFERENCES games (id),
+    PRIMARY KEY (board, period, game_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS top_scores_rank ON top_scores (board, period, score DESC, game_id);
+
+CREATE TABLE IF NOT EXISTS players (
+    initials TEXT PRIMARY KEY,
+    games INTEGER NOT NULL,
+    best_score INTEGER NOT NULL,
+    best_game_id INTEGER NOT NULL,
+    total_score INTEGER NOT NULL,
+    total_lines INTEGER NOT NULL
+);
+"""
+
+
+# Period key of a board for a unix timestamp (local time)
+def board_period(board, played_at):
+    moment = datetime.fromtimestamp(played_at)
+    if board == BOARD_DAILY:
+        return moment.strftime('%Y-%m-%d')
+    if board == BOARD_WEEKLY:
+        year, week, _ = moment.isocalendar()
+        return f'{year}-W{week:02d}'
+    return ''
+
+
+# Every finished game in an append-only SQLite table. Alongside it the store keeps,
+# in the same transaction as each insert, the top K games of every board and period
+# and per-initials totals, so leaderboard and best-score queries read at most K rows
+# however long the history grows.
+class ScoreStore:
+    def __init__(self, path=DB_PATH, top_k=TOP_K, check_same_thread=True):
+        self.path = path
+        self.top_k = top_k
+        self.db = sqlite3.connect(path, check_same_thread=check_same_thread)
+        self.db.row_factory = sqlite3.Row
+        if path != ':memory:':
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute('PRAGMA synchronous=FULL')  # a finished game survives a power cut
+        self.db.executescript(SCHEMA)
+        self.drop_anonymous()
+
+    # Databases written by earlier versions ranked anonymous games; take them off the
+    # boards and rebuild the boards so the games they pushed out come back
+    def drop_anonymous(self):
+        with self.db:
+            self.db.execute('DELETE FROM players WHERE initials = ?', (ANONYMOUS,))
+            ranked = self.db.execute(
+                'DELETE FROM top_scores WHERE game_id IN (SELECT id FROM games WHERE initials = ?)',
+                (ANONYMOUS,)).rowcount
+            if not ranked:
+                return
+            self.db.execute('DELETE FROM top_scores')
+            games = self.db.execute('SELECT id, played_at, score FROM games WHERE initials != ?',
+                                    (ANONYMOUS,)).fetchall()
+            for game in games:
+                for board in BOARDS:
+                    self.add_to_board(board, board_period(board, game['played_at']), game['score'], game['id'])
+
+    # Append a finished game and update the boards and player totals (unless it is
+    # anonymous); returns its id
+    def record_game(self, initials, score, lines=0, duration=0.0, opponent=None, played_at=None):
+        if played_at is None:
+            played_at = int(time.time())
+        with self.db:
+            game_id = self.db.execute(
+                'INSERT INTO games (played_at, initials, score, lines, duration, opponent) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (played_at, initials, score, lines, duration, opponent)).lastrowid
+            if initials == ANONYMOUS:
+                return game_id
+            for board in BOARDS:
+                self.add_to_board(board, board_period(board, played_at), score, game_id)
+            self.db.execute(
+                'INSERT INTO players (initials, games, best_score, best_game_id, total_score, total_lines) '
+                'VALUES (?, 1, ?, ?, ?, ?) '
+                'ON CONFLICT (initials) DO UPDATE SET '
+                'games = games + 1, '
+                'best_game_id = CASE WHEN excluded.best_score > best_score THEN excluded.best_game_id ELSE best_game_id END, '
+                'best_score = MAX(best_score, excluded.best_score), '
+                'total_score = total_score + excluded.total_score, '
+                'total_lines = total_lines + excluded.total_lines',
+                (initials, score, game_id, score, lines))
+        return game_id
+
+    # Insert into one board's top K, dropping whatever falls off the end
+    def add_to_board(self, board, period, score, game_id):
+        rows = self.db.execute(
+            'SELECT score FROM top_scores WHERE board = ? AND period = ? '
+            'ORDER BY score DESC, game_id LIMIT 1 OFFSET ?',
+            (board, period, self.top_k - 1)).fetchone()
+        if rows is not None and score <= rows['score']:
+            return
+        self.db.execute('INSERT INTO top_scores (board, period, score, game_id) VALUES (?, ?, ?, ?)',
+                        (board, period, score, game_id))
+        self.db.execute(
+            'DELETE FROM top_scores WHERE board = ? AND period = ? AND game_id NOT IN '
+            '(SELECT game_id FROM top_scores WHERE board = ? AND period = ? '
+            'ORDER BY score DESC, game_id LIMIT ?)',
+            (board, period, board, period, self.top_k))
+
+    # Best games on a board, best first; when is a unix time inside the wanted period
+    def top(self, board=BOARD_ALL, when=None, limit=None):
+        period = board_period(board, time.time() if when is None else when)
+        rows = self.db.execute(
+            'SELECT g.* FROM top_scores t JOIN games g ON g.id = t.game_id '
+            'WHERE t.board = ? AND t.period = ? ORDER BY t.score DESC, t.game_id LIMIT ?',
+            (board, period, limit or self.top_k)).fetchall()
+        return [as_entry(row) for row in rows]
+
+    # Totals for one set of initials, or None if they have never played
+    def player_stats(self, initials):
+        row = self.db.execute('SELECT * FROM players WHERE initials = ?', (initials,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "initials": row["initials"],
+            "games": row["games"],
+            "best_score": row["best_score"],
+            "best_game_id": row["best_game_id"],
+            "average_score": row["total_score"] / row["games"],
+            "total_lines": row["total_lines"],
+        }
+
+    # Most recent games, optionally for one set of initials
+    def history(self, initials=None, limit=50):
+        if initials is None:
+            rows = self.db.execute('SELECT * FROM games ORDER BY played_at DESC, id DESC LIMIT ?', (limit,))
+        else:
+            rows = self.db.execute('SELECT * FROM games WHERE initials = ? '
+                                   'ORDER BY played_at DESC, id DESC LIMIT ?', (initials, limit))
+        return [as_entry(row) for row in rows]
+
+    def game_count(self):
+        return self.db.execute('SELECT COUNT(*) FROM games').fetchone()[0]
+
+    # Changes whenever another connection commits, so caches can tell when to reload
+    def data_version(self):
+        return self.db.execute('PRAGMA data_version').fetchone()[0]
+
+    # Import a highscores.json file written by earlier versions
+    def import_json(self, path):
+        try:
+            with open(path) as file:
+                entries = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return 0
+        for entry in entries:
+            try:
+                played_at = int(datetime.strptime(entry["date"], "%Y-%m-%d %H:%M").timestamp())
+            except (KeyError, ValueError):
+                played_at = int(time.time())
+            self.record_game(entry["initials"], entry["score"], played_at=played_at)
+        return len(entries)
+
+    def close(self):
+        self.db.close()
+
+
+# Convert a games row to the dict the leaderboard draws from
+def as_entry(row):
+    return {
+        "id": row["id"],
+        "date": datetime.fromtimestamp(row["played_at"]).strftime("%Y-%m-%d %H:%M"),
+        "played_at": row["played_at"],
+        "initials": row["initials"],
+        "score": row["score"],
+        "lines": row["lines"],
+        "duration": row["duration"],
+        "opponent": row["opponent"],
+    }
@@ -0,0 +1,47 @@
+import pygame
+
+WHITE = (255, 255, 255)
+RED = (255, 0, 0)
+
+
+# Fonts shared by the menu screens
+class ScreenFonts:
+    def __init__(self):
+        self.large = pygame.font.Font(None, 48)  # Large font for titles
+        self.medium = pygame.font.Font(None, 36)  # Medium font for buttons and smaller text
+
+
+# Landing page with "Find a match" button
+def draw_landing(screen, fonts):
+    title_text = fonts.large.render("Tetris - Multiplayer", True, WHITE)
+    button_text = fonts.medium.render("Find a match", True, WHITE)
+    screen.blit(title_text, (10, 50))
+    screen.blit(button_text, (10, 150))
+
+
+# Landing page after the "Find a match" button is pressed
+def draw_matchmaking(screen, fonts):
+    text = fonts.medium.render("Looking for a partner...", True, WHITE)
+    screen.blit(text, (10, 100))
+
+
+# Display "Could not find a match" and "Try again" button if no connection is established
+def draw_no_match(screen, fonts):
+    text = fonts.medium.render("Could not find a match", True, RED)
+    retry_text = fonts.medium.render("Try again", True, WHITE)
+    screen.blit(text, (10, 100))
+    screen.blit(retry_text, (10, 150))
+
+
+# Match found; display "Start Match" button
+def draw_start_match(screen, fonts):
+    text = fonts.medium.render("Start Match", True, WHITE)
+    screen.blit(text, (10, 150))
+
+
+# Display one step of the countdown to the start of the game
+def draw_countdown(screen, fonts, countdown_time):
+    screen.fill((0, 0, 0))
+    countdown_text = fonts.large.render(str(countdown_time), True, WHITE)
+    text_rect = countdown_text.get_rect(center=(160, 120))
+    screen.blit(countdown_text, text_rect)
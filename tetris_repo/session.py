@@ -0,0 +1,178 @@
+import base64
+import secrets
+import struct
+import threading
+import time
+import snapshot
+from effects import pack_effects, unpack_effects
+from spectator import ROWS, COLUMNS
+
+HEARTBEAT_INTERVAL = 0.5  # send a heartbeat when nothing else has gone to the peer for this long
+PEER_TIMEOUT = 2.0        # the peer is lost after this long without a datagram from it
+SNAPSHOT_RETRY = 0.5      # seconds between snapshot requests while waiting to resume
+PEER_GIVE_UP = 20.0       # a lost opponent forfeits after this long and the others play on
+
+SNAPSHOT_VERSION = 1
+FLAG_GAME_OVER = 1
+
+# version, flags, shape mask, shape x, shape y, current color, next shape, next color,
+# gravity frame, frames per move, score, lines, ticks, sabotage meter, sync frame number
+STATE = struct.Struct('<BBHbbBBBBBiIIHI')
+BOARD_BYTES = ROWS * COLUMNS // 2  # two 4-bit cells per byte, as in the spectator stream
+
+
+# One opponent as the session sees it: where they are, their token once bound, and
+# when they were last heard from
+class Link:
+    def __init__(self, address, now):
+        self.address = address
+        self.token = None
+        self.last_heard = now
+        self.lost = False
+
+
+# Liveness and identity of the peers for one match. Every datagram we send carries our
+# session token, so ordinary game traffic doubles as a heartbeat; an explicit heartbeat
+# only goes out when nothing else has for HEARTBEAT_INTERVAL. A datagram from a peer's
+# token is proof of life even from a new address, which is how a cabinet that rejoined
+# the Wi-Fi with a new lease is followed. A match of three or more players has one link
+# per opponent and pauses while any of them is lost.
+class Session:
+    def __init__(self, network, clock_sync=None, time_source=time.monotonic, token=None):
+        self.network = network
+        self.clock_sync = clock_sync
+        self.time_source = time_source
+        self.token = token or secrets.token_hex(8)
+        self.links = []
+        self.last_sent = 0.0
+        self.losses = 0
+        self.stopped = threading.Event()
+        self.thread = None
+        network.session = self
+
+    # Begin watching a new match's peers (one address or a list); starts the heartbeat
+    # thread on first use
+    def start(self, peers):
+        now = self.time_source()
+        self.links = [Link(peer, now) for peer in (peers if isinstance(peers, list) else [peers])]
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    # The first opponent's address, as in a two-player match
+    @property
+    def peer(self):
+        return self.links[0].address if self.links else None
+
+    @property
+    def addresses(self):
+        return [link.address for link in self.links]
+
+    @property
+    def peer_lost(self):
+        return any(link.lost for link in self.links)
+
+    # Add our token to an outgoing message; called by the network for every send
+    def stamp(self, message):
+        message["session"] = self.token
+        self.last_sent = self.time_source()
+
+    # Note a datagram from the network thread. The first token seen from a peer's
+    # address is bound to that link; after that the token alone identifies the peer.
+    def heard(self, message, addr):
+        token = message.get("session")
+        if token is None:
+            return
+        for link in self.links:
+            if link.token == token:
+                break
+        else:
+            for link in self.links:
+                if link.token is None and link.address == addr:
+                    link.token = token
+                    break
+            else:
+                return  # a different process, e.g. a peer restarted
+        link.last_heard = self.time_source()
+        if addr != link.address:
+            if self.clock_sync and self.clock_sync.peer == link.address:
+                self.clock_sync.peer = addr
+            link.address = addr
+        link.lost = False
+
+    def run(self):
+        while not self.stopped.wait(HEARTBEAT_INTERVAL / 2):
+            now = self.time_source()
+            links = self.links
+            if not links:
+                continue
+            if now - self.last_sent >= HEARTBEAT_INTERVAL:
+                try:
+                    self.network.send_to_all({"type": "heartbeat"}, [link.address for link in links])
+                except OSError:
+                    pass  # no route while the Wi-Fi is down; keep trying
+            for link in links:
+                if not link.lost and now - link.last_heard > PEER_TIMEOUT:
+                    link.lost = True
+                    self.losses += 1
+
+    def stop(self):
+        self.stopped.set()
+
+
+# Compact binary snapshot of one player's game: board colors as 4-bit cells, the active
+# and next piece, score, sabotage meter and active effects. It fits in one datagram and
+# takes microseconds to build or apply, so opponents trade one whenever play resumes.
+def encode_snapshot(game):
+    color_index = {color: i + 1 for i, color in enumerate(game.SHAPE_COLORS)}
+    color_index[game.P2_COLOR] = snapshot.CELL_P2
+    get = color_index.get
+    cells = [get(cell, 0) for row in game.p1_grid for cell in row]
+    return b''.join((STATE.pack(
+        SNAPSHOT_VERSION, FLAG_GAME_OVER if game.game_over else 0,
+        snapshot.pack_shape(game.p1_current_shape), game.shape_pos[0], game.shape_pos[1],
+        color_index.get(game.p1_current_color, 0), game.SHAPES.index(game.p1_next_shape),
+        color_index.get(game.p1_next_color, 0), game.curr_frame, game.frames_per_move,
+        game.score, game.lines, game.ticks, int(game.sabotage_meter), game.sync_frame_number),
+        bytes([high << 4 | low for high, low in zip(cells[0::2], cells[1::2])]),
+        pack_effects(game.effects.active_effects())))
+
+
+def decode_snapshot(data):
+    state = STATE.unpack_from(data)
+    if state[0] != SNAPSHOT_VERSION:
+        raise ValueError(f"unsupported snapshot version {state[0]}")
+    board = data[STATE.size:STATE.size + BOARD_BYTES]
+    effects = unpack_effects(data[STATE.size + BOARD_BYTES:])
+    return state, board, effects
+
+
+# Rows of colors from a packed board
+def unpack_board(board, palette):
+    cells = []
+    for byte in board:
+        cells.append(palette[byte >> 4])
+        cells.append(palette[byte & 0x0F])
+    return [cells[i:i + COLUMNS] for i in range(0, ROWS * COLUMNS, COLUMNS)]
+
+
+# Show an opponent's board, score and next piece (by default Player 2's) from the
+# snapshot they sent
+def apply_peer_snapshot(game, data, opponent=None):
+    state, board, _ = decode_snapshot(data)
+    opponent = opponent or game.opponents[0]
+    opponent.grid = unpack_board(board, [game.BLACK] + list(game.SHAPE_COLORS) + [game.P2_COLOR])
+    opponent.score = state[10]
+    opponent.next_shape = game.SHAPES[state[6]]
+    opponent.game_over = bool(state[1] & FLAG_GAME_OVER)
+    opponent.version += 1
+    return state
+
+
+# Text form for JSON messages
+def encode_snapshot_text(game):
+    return base64.b64encode(encode_snapshot(game)).decode('ascii')
+
+
+def decode_snapshot_text(text):
+    return base64.b64decode(text)
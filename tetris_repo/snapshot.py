@@ -0,0 +1,207 @@
+import struct
+from multiprocessing import shared_memory
+
+# Scenes the renderer knows how to draw
+SCENE_MENU = 0
+SCENE_MATCHMAKING = 1
+SCENE_NO_MATCH = 2
+SCENE_START_MATCH = 3
+SCENE_COUNTDOWN = 4
+SCENE_PLAY = 5
+SCENE_GAME_OVER = 6
+SCENE_INITIALS = 7
+SCENE_LEADERBOARD = 8
+
+# Whether each scene animates on its own or only changes in response to input/network events
+SCENE_ANIMATING = {
+    SCENE_MENU: False,
+    SCENE_MATCHMAKING: False,
+    SCENE_NO_MATCH: False,
+    SCENE_START_MATCH: False,
+    SCENE_COUNTDOWN: False,
+    SCENE_PLAY: True,
+    SCENE_GAME_OVER: False,
+    SCENE_INITIALS: False,
+    SCENE_LEADERBOARD: False,
+}
+
+# Flag bits packed into a single byte
+FLAG_GAME_OVER = 1
+FLAG_ENTERING_INITIALS = 2
+FLAG_SHOW_LEADERBOARD = 4
+FLAG_WAITING_FOR_PEER = 8
+
+# Cell encoding: 0 is empty, 1-7 index SHAPE_COLORS, 8 is the opponent color
+CELL_EMPTY = 0
+CELL_P2 = 8
+
+ROWS = 20
+COLUMNS = 10
+GRID_BYTES = ROWS * COLUMNS
+
+# scene, countdown, shape mask, shape x, shape y, current color, next shape,
+# next color, p2 next shape, score, p2 score, sabotage meter, available sabotages,
+# flags, initials, initials index, p1 grid, p2 grid
+PAYLOAD = struct.Struct('<BBHbbBBBBiiHBB3sB%ds%ds' % (GRID_BYTES, GRID_BYTES))
+
+# Each slot is framed by a sequence number at both ends so torn reads can be detected;
+# the writer stores the leading one first and the trailing one last
+SEQ = struct.Struct('<Q')
+SLOT_SIZE = SEQ.size + PAYLOAD.size + SEQ.size
+HEADER_SIZE = 8
+SHM_SIZE = HEADER_SIZE + 2 * SLOT_SIZE
+
+
+class Snapshot:
+    def __init__(self, seq, fields):
+        self.seq = seq
+        (self.scene, self.countdown, self.shape_mask, self.shape_x, self.shape_y,
+         self.current_color, self.next_shape, self.next_color, self.p2_next_shape,
+         self.score, self.p2_score, self.sabotage_meter, self.available_sabotages,
+         self.flags, initials, self.initials_index, self.p1_cells, self.p2_cells) = fields
+        self.initials = list(initials.decode('ascii'))
+
+
+# Double-buffered game snapshot in shared memory. A single writer publishes into the
+# inactive slot and then flips the active index; readers never take a lock.
+class SharedSnapshot:
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        self.buf = shm.buf
+        self.seq = 0
+        self.last = None
+
+    # Create a new shared block (simulation side)
+    @classmethod
+    def create(cls):
+        shm = shared_memory.SharedMemory(create=True, size=SHM_SIZE)
+        shm.buf[:SHM_SIZE] = bytes(SHM_SIZE)
+        return cls(shm, True)
+
+    # Attach to an existing shared block by name (render side)
+    @classmethod
+    def attach(cls, name):
+        return cls(shared_memory.SharedMemory(name=name), False)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    # Write a packed payload into the inactive slot and make it the active one
+    def publish_payload(self, payload):
+        self.seq += 1
+        slot = 1 - self.buf[0]
+        base = HEADER_SIZE + slot * SLOT_SIZE
+        SEQ.pack_into(self.buf, base, self.seq)
+        self.buf[base + SEQ.size:base + SEQ.size + PAYLOAD.size] = payload
+        SEQ.pack_into(self.buf, base + SEQ.size + PAYLOAD.size, self.seq)
+        self.buf[0] = slot
+
+    # Publish a menu or countdown scene that has no board to show
+    def publish_scene(self, scene, countdown=0):
+        empty = bytes(GRID_BYTES)
+        self.publish_payload(PAYLOAD.pack(scene, countdown, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
+                                          b'AAA', 0, empty, empty))
+
+    # Publish the full state of a running game
+    def publish_game(self, game, scene=SCENE_PLAY):
+        flags = 0
+        if game.game_over:
+            flags |= FLAG_GAME_OVER
+        if game.entering_initials:
+            flags |= FLAG_ENTERING_INITIALS
+        if game.show_leaderboard:
+            flags |= FLAG_SHOW_LEADERBOARD
+        if game.waiting_for_peer:
+            flags |= FLAG_WAITING_FOR_PEER
+        available = 0
+        for index in game.available_sabotages:
+            available |= 1 << index
+        color_index = {color: i + 1 for i, color in enumerate(game.SHAPE_COLORS)}
+        color_index[game.P2_COLOR] = CELL_P2
+        self.publish_payload(PAYLOAD.pack(
+            scene, 0,
+            pack_shape(game.p1_current_shape), game.shape_pos[0], game.shape_pos[1],
+            color_index.get(game.p1_current_color, CELL_EMPTY),
+            game.SHAPES.index(game.p1_next_shape),
+            color_index.get(game.p1_next_color, CELL_EMPTY),
+            game.SHAPES.index(game.p2_next_shape),
+            game.score, game.p2_score, int(game.sabotage_meter), available, flags,
+            "".join(game.initials).encode('ascii'), game.initials_index,
+            pack_grid(game.p1_grid, color_index), pack_grid(game.p2_grid, color_index)))
+
+    # Return the latest consistent snapshot, or the previous one if the writer raced us.
+    # The sequence numbers are read in the opposite order to the writer's: a write that
+    # starts while we read the payload changes seq_start, which we read last.
+    def read(self):
+        for _ in range(3):
+            slot = self.buf[0]
+            base = HEADER_SIZE + slot * SLOT_SIZE
+            seq_end = SEQ.unpack_from(self.buf, base + SEQ.size + PAYLOAD.size)[0]
+            fields = PAYLOAD.unpack_from(self.buf, base + SEQ.size)
+            seq_start = SEQ.unpack_from(self.buf, base)[0]
+            if seq_start == seq_end and self.buf[0] == slot:
+                if seq_start and (self.last is None or self.last.seq != seq_start):
+                    self.last = Snapshot(seq_start, fields)
+                return self.last
+        return self.last
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+# Pack a shape of up to 4x4 cells into a 16-bit mask
+def pack_shape(shape):
+    mask = 0
+    for y, row in enumerate(shape):
+        for x, cell in enumerate(row):
+            if cell:
+                mask |= 1 << (y * 4 + x)
+    return mask
+
+
+# Unpack a 16-bit mask back into a trimmed shape matrix
+def unpack_shape(mask):
+    cells = [[1 if mask & (1 << (y * 4 + x)) else 0 for x in range(4)] for y in range(4)]
+    cells = [row for row in cells if any(row)]
+    if not cells:
+        return [[0]]
+    width = max(x for row in cells for x, cell in enumerate(row) if cell) + 1
+    return [row[:width] for row in cells]
+
+
+# Encode a grid of colors as one byte per cell
+def pack_grid(grid, color_index):
+    return bytes(color_index.get(cell, CELL_EMPTY) for row in grid for cell in row)
+
+
+# Decode one byte per cell back into a grid of colors
+def unpack_grid(cells, palette):
+    return [[palette[cells[row * COLUMNS + col]] for col in range(COLUMNS)] for row in range(ROWS)]
+
+
+# Load a snapshot into a TetrisGame instance that is only used for drawing
+def apply_snapshot(game, snap):
+    palette = [game.BLACK] + list(game.SHAPE_COLORS) + [game.P2_COLOR]
+    game.p1_grid = unpack_grid(snap.p1_cells, palette)
+    game.p2_grid = unpack_grid(snap.p2_cells, palette)
+    game.p1_current_shape = unpack_shape(snap.shape_mask)
+    game.shape_pos = [snap.shape_x, snap.shape_y]
+    game.p1_current_color = palette[snap.current_color]
+    game.p1_next_shape = game.SHAPES[snap.next_shape]
+    game.p1_next_color = palette[snap.next_color]
+    game.p2_next_shape = game.SHAPES[snap.p2_next_shape]
+    game.score = snap.score
+    game.p2_score = snap.p2_score
+    game.sabotage_meter = snap.sabotage_meter
+    game.available_sabotages = [i for i in range(8) if snap.available_sabotages & (1 << i)]
+    game.game_over = bool(snap.flags & FLAG_GAME_OVER)
+    game.entering_initials = bool(snap.flags & FLAG_ENTERING_INITIALS)
+    game.show_leaderboard = bool(snap.flags & FLAG_SHOW_LEADERBOARD)
+    game.waiting_for_peer = bool(snap.flags & FLAG_WAITING_FOR_PEER)
+    game.initials = snap.initials
+    game.initials_index = snap.initials_index
@@ -0,0 +1,271 @@
+import argparse
+import gc
+import json
+import os
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Headless games: SDL's dummy driver and an in-memory score history
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('TETRIS_SCORES_DB', ':memory:')
+
+import pygame
+import scenes
+from clock_sync import ClockSync
+from game_clock import FixedStepClock
+from metrics import rss_bytes, peak_rss_bytes, open_fds
+from network import UDPNetwork
+from session import Session
+from sync_controller import create_sync_controller
+from tetris_game import TetrisGame
+
+TICK_RATE = 600          # simulation ticks per second, 10x real time
+SYNC_INTERVAL = 1.0      # longest time between sync frames (10 in a real match)
+MATCH_TIMEOUT = 5
+MAX_TICKS = 100000       # give up on a game that will not end
+SETTLE_TIME = 0.3        # let the last sync frames of a match land before the rematch
+BOT_ACTIONS = ['rotate', 'move_left', 'move_right', 'move_left', 'move_right', 'hard_drop', 'sabotage', 'next_target']
+BOT_ACTION_CHANCE = 0.1  # chance a bot presses something on a given tick
+
+
+# One cabinet of a match: its own socket, clock sync and scene manager, with a network
+# thread routing messages the same way main.message_handler does
+class Peer:
+    def __init__(self, name, screen, tick_rate):
+        self.name = name
+        self.screen = screen
+        self.tick_rate = tick_rate
+        self.network = UDPNetwork('127.0.0.1', 0)
+        self.address = self.network.sock.getsockname()
+        self.clock_sync = ClockSync(self.network)
+        self.session = Session(self.network, self.clock_sync)
+        self.manager = None
+        self.received = 0
+        self.bot_tick = -1
+        self.stopped = False
+        self.thread = threading.Thread(target=self.receive, daemon=True)
+
+    def start(self, peer_address, countdown):
+        self.peer_address = peer_address
+        self.countdown = countdown
+        self.new_match()
+        self.thread.start()
+
+    def create_game(self, partner_address):
+        game = TetrisGame(self.screen, self.network, partner_address)
+        game.sync_interval = SYNC_INTERVAL
+        game.sync_controller = create_sync_controller(max_interval=SYNC_INTERVAL)
+        game.match_time = self.clock_sync.match_time
+        self.session.start(partner_address)
+        game.session = self.session
+        return game
+
+    def new_match(self):
+        self.manager = scenes.SceneManager(
+            self.network, self.peer_address, None, self.create_game,
+            FixedStepClock(tick_rate=self.tick_rate, max_ticks_per_frame=self.tick_rate // 10), MATCH_TIMEOUT, self.clock_sync,
+            countdown=self.countdown)
+
+    def receive(self):
+        while not self.stopped:
+            try:
+                message, addr = self.network.receive_message()
+            except (OSError, ValueError):
+                return
+            if message is None:
+                continue
+            self.received += 1
+            manager = self.manager
+            if message["type"] == "clock_ping":
+                self.clock_sync.handle_ping(message, addr)
+            elif message["type"] == "clock_pong":
+                self.clock_sync.handle_pong(message)
+            elif message["type"] in scenes.CONTROL_MESSAGES:
+                manager.post_control(message, addr)
+            elif message["type"] == "sync_frame":
+                self.network.send_message({"type": "sync_frame_ack",
+                                           "frame_number": message["frame_number"]}, addr)
+                manager.message_queue.put(("sync_frame", message, addr))
+            elif message["type"] in ("game_state", "sabotage", "snapshot"):
+                manager.message_queue.put((message["type"], message, addr))
+
+    def close(self):
+        self.stopped = True
+        self.clock_sync.stop()
+        self.session.stop()
+        self.network.close()
+        self.thread.join(1.0)
+
+
+# Play matches of players cabinets over loopback for duration seconds; returns stats
+def run_pair(task, duration, tick_rate=TICK_RATE, countdown=0, seed=None, players=2):
+    rng = random.Random(seed if seed is not None else os.getpid() ^ task)
+    pygame.init()
+    screen = pygame.Surface((320, 240))
+    peers = [Peer(chr(ord('a') + i), screen, tick_rate) for i in range(players)]
+    for peer in peers:
+        others = [other.address for other in peers if other is not peer]
+        peer.start(others if len(others) > 1 else others[0], countdown)
+
+    stats = {
+        'pid': os.getpid(), 'task': task, 'matches': 0, 'no_match': 0, 'games': 0,
+        'ticks': 0, 'desyncs': 0, 'sabotages': 0, 'stuck': 0, 'peer_losses': 0,
+        'threads_max': threading.active_count(),
+    }
+    start = time.monotonic()
+    match_started = start
+
+    def begin_match():
+        for peer in peers:
+            peer.manager.press('rotate')
+
+    begin_match()
+    while time.monotonic() - start < duration:
+        for peer in peers:
+            manager = peer.manager
+            game = manager.game
+            if isinstance(manager.scene, scenes.PlayScene) and game.ticks != peer.bot_tick:
+                peer.bot_tick = game.ticks
+                if rng.random() < BOT_ACTION_CHANCE:
+                    game.button_queue.push(rng.choice(BOT_ACTIONS))
+            elif isinstance(manager.scene, scenes.StartMatchScene) and peer is peers[0]:
+                manager.press('rotate')
+            manager.update()
+        stats['threads_max'] = max(stats['threads_max'], threading.active_count())
+
+        states = [type(peer.manager.scene) for peer in peers]
+        if scenes.NoMatchScene in states:
+            stats['no_match'] += 1
+        finished = all(peer.manager.game and peer.manager.game.game_over for peer in peers)
+        stuck = any(peer.manager.game and peer.manager.game.ticks > MAX_TICKS for peer in peers)
+        if finished or stuck or scenes.NoMatchScene in states or time.monotonic() - match_started > 600:
+            if stuck:
+                stats['stuck'] += 1
+            # Messages carry no match id, so a frame still in flight would land in the next game
+            time.sleep(SETTLE_TIME)
+            for peer in peers:
+                game = peer.manager.game
+                if game:
+                    stats['games'] += 1
+                    stats['ticks'] += game.ticks
+                    stats['desyncs'] += game.desyncs
+                    stats['sabotages'] += sum(1 for player, _ in game.sabotage_log if player == 1)
+                peer.new_match()
+            stats['matches'] += 1
+            match_started = time.monotonic()
+            begin_match()
+        time.sleep(0.0005)
+
+    delays = [delay for peer in peers for _, _, delay in peer.clock_sync.samples]
+    stats['elapsed'] = time.monotonic() - start
+    stats['messages'] = sum(peer.received for peer in peers)
+    stats['peer_losses'] = sum(peer.session.losses for peer in peers)
+    stats['bytes_sent'] = sum(peer.network.bytes_sent for peer in peers)
+    stats['cabinet_seconds'] = len(peers) * stats['elapsed']
+    stats['latency_ms'] = [d * 1000 for d in delays]
+    for peer in peers:
+        peer.close()
+    # Finished games sit in reference cycles holding font files until the collector
+    # runs; collect first so the counts below only grow on a real leak
+    gc.collect()
+    stats['rss_end'] = rss_bytes() or peak_rss_bytes()  # peak where /proc is missing; still grows on a leak
+    stats['fds_end'] = open_fds()
+    stats['threads_end'] = threading.active_count()
+    return stats
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, len(values) * p // 100)]
+
+
+# Run rounds of pair tasks until the total duration has passed. Worker processes are
+# reused between rounds, so per-process memory, descriptor and thread counts show growth.
+def soak(pairs, duration, round_seconds, tick_rate, countdown, output=None, players=2):
+    processes = {}
+    totals = {'matches': 0, 'no_match': 0, 'games': 0, 'ticks': 0, 'desyncs': 0,
+              'sabotages': 0, 'stuck': 0, 'peer_losses': 0, 'messages': 0,
+              'bytes_sent': 0, 'cabinet_seconds': 0.0}
+    latencies = []
+    start = time.monotonic()
+    rounds = 0
+    with ProcessPoolExecutor(max_workers=pairs) as pool:
+        while time.monotonic() - start < duration:
+            rounds += 1
+            length = min(round_seconds, max(1.0, duration - (time.monotonic() - start)))
+            futures = [pool.submit(run_pair, rounds * pairs + i, length, tick_rate, countdown, None, players)
+                       for i in range(pairs)]
+            round_ticks = 0
+            round_elapsed = 0.0
+            for future in as_completed(futures):
+                result = future.result()
+                for key in totals:
+                    totals[key] += result[key]
+                latencies.extend(result['latency_ms'])
+                round_ticks += result['ticks']
+                round_elapsed = max(round_elapsed, result['elapsed'])
+                # Growth is measured from the end of a process's first task, after warmup
+                process = processes.setdefault(result['pid'], {
+                    'rss_first': result['rss_end'], 'fds_first': result['fds_end'],
+                    'threads_first': result['threads_end']})
+                process.update(rss_last=result['rss_end'], fds_last=result['fds_end'],
+                               threads_last=result['threads_end'],
+                               threads_max=max(process.get('threads_max', 0), result['threads_max']))
+            growth = max((p['rss_last'] - p['rss_first'] for p in processes.values()), default=0)
+            print(f"round {rounds:>4}  {time.monotonic() - start:8.0f} s  "
+                  f"{round_ticks / max(round_elapsed, 1e-9):9.0f} ticks/s  games {totals['games']:>6}  "
+                  f"desyncs {totals['desyncs']:>4}  max rss growth {growth / 1024:8.0f} KiB", flush=True)
+
+    report = {
+        'pairs': pairs,
+        'players': players,
+        'duration': time.monotonic() - start,
+        'rounds': rounds,
+        'totals': totals,
+        'ticks_per_second': totals['ticks'] / max(time.monotonic() - start, 1e-9),
+        'bytes_sent_per_cabinet_second': totals['bytes_sent'] / max(totals['cabinet_seconds'], 1e-9),
+        'message_latency_ms': {
+            'p50': percentile(latencies, 50), 'p95': percentile(latencies, 95), 'p99': percentile(latencies, 99),
+            'mean': statistics.mean(latencies) if latencies else 0.0,
+        },
+        'processes': processes,
+    }
+    print()
+    print(f"games {totals['games']}  matches {totals['matches']}  no match {totals['no_match']}  "
+          f"stuck {totals['stuck']}  sabotages {totals['sabotages']}  messages {totals['messages']}")
+    print(f"desyncs {totals['desyncs']}  peer losses {totals['peer_losses']}  throughput {report['ticks_per_second']:.0f} ticks/s  "
+          f"sent {report['bytes_sent_per_cabinet_second']:.0f} B/s per cabinet")
+    latency = report['message_latency_ms']
+    print(f"round trip ms  p50 {latency['p50']:.2f}  p95 {latency['p95']:.2f}  p99 {latency['p99']:.2f}")
+    print("pid      rss growth KiB  fds first->last  threads first->last (max)")
+    for pid, process in sorted(processes.items()):
+        print(f"{pid:<8} {(process['rss_last'] - process['rss_first']) / 1024:14.0f}  "
+              f"{process['fds_first']:>5} -> {process['fds_last']:<5}  "
+              f"{process['threads_first']:>3} -> {process['threads_last']:<3} ({process['threads_max']})")
+    if output:
+        with open(output, 'w') as file:
+            json.dump(report, file, indent=2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run bot-driven Tetris pairs over loopback UDP")
+    parser.add_argument('--pairs', type=int, default=os.cpu_count() or 2, help="pairs run in parallel (one process each)")
+    parser.add_argument('--players', type=int, default=2, help="cabinets in each match (2 to 8)")
+    parser.add_argument('--duration', type=float, default=60.0, help="total seconds to run")
+    parser.add_argument('--round', type=float, default=30.0, help="seconds per round between reports")
+    parser.add_argument('--tick-rate', type=int, default=TICK_RATE, help="simulation ticks per second")
+    parser.add_argument('--countdown', type=int, default=0, help="countdown seconds before each match")
+    parser.add_argument('--output', help="write the report as JSON to this file")
+    args = parser.parse_args()
+    soak(args.pairs, args.duration, args.round, args.tick_rate, args.countdown, args.output, args.players)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+import argparse
+import os
+import random
+import socket
+import struct
+import time
+from collections import deque
+import snapshot
+
+SPECTATOR_PORT = 5100
+SPECTATOR_ADDRESS = ('255.255.255.255', SPECTATOR_PORT)
+STREAM_HZ = 10           # frames published per second
+KEYFRAME_INTERVAL = 2.0  # seconds between full frames, for watchers that join late
+STREAM_TIMEOUT = 3.0     # a stream with no packets for this long is no longer live
+LOBBY_CYCLE = 10.0       # seconds each live match is shown before the next one
+FRAME_EVENTS = 16        # most sabotage events in one frame; a backlog waits for the next
+KEYFRAME_EVENTS = 8      # recent sabotage events repeated in every keyframe
+WATCH_FPS = 30
+
+MAGIC = b'TS'
+VERSION = 2
+KIND_KEYFRAME = 1
+KIND_DELTA = 2
+
+FLAG_GAME_OVER = 1
+
+ROWS = 20
+COLUMNS = 10
+ROW_BYTES = COLUMNS // 2   # two 4-bit cells per byte
+
+# magic, version, kind, stream id, sequence number
+HEADER = struct.Struct('<2sBBII')
+# score, p2 score, shape mask, shape x, shape y, current color, next shape,
+# next color, p2 next shape, flags
+STATE = struct.Struct('<iiHbbBBBBB')
+# changed-row masks for the two grids in a delta frame
+ROW_MASKS = struct.Struct('<II')
+EVENT = struct.Struct('<IBB')  # position in the sabotage log, sending player, sabotage index
+
+
+# Pack one row of cell indices (0-8, see snapshot.py) into 4-bit pairs
+def pack_row(cells):
+    return bytes((cells[i] << 4) | cells[i + 1] for i in range(0, COLUMNS, 2))
+
+
+def unpack_row(data):
+    cells = []
+    for byte in data:
+        cells.append(byte >> 4)
+        cells.append(byte & 0x0F)
+    return cells
+
+
+# Publishes a compact, rate-limited stream of a game to any number of watchers. Every
+# frame is a single broadcast or multicast datagram, so the cost is the same for one
+# watcher or fifty. Frames carry only the rows that changed since the previous frame,
+# with a full keyframe every KEYFRAME_INTERVAL for watchers that join late or lose a
+# packet. Sabotage events go out once in the next frame, and keyframes repeat the last
+# KEYFRAME_EVENTS of them; each carries its position in the log so watchers skip repeats.
+class SpectatorBroadcaster:
+    def __init__(self, network, address=SPECTATOR_ADDRESS, rate=STREAM_HZ,
+                 keyframe_interval=KEYFRAME_INTERVAL, time_source=time.monotonic):
+        self.network = network
+        self.address = address
+        self.interval = 1.0 / rate
+        self.keyframe_interval = keyframe_interval
+        self.time_source = time_source
+        self.game = None
+        self.stream_id = 0
+        self.seq = 0
+        self.next_frame = 0.0
+        self.next_keyframe = 0.0
+        self.sent_rows = None
+        self.events_sent = 0
+        self.packets = 0
+        self.bytes_sent = 0
+        self.failed = False
+        if is_multicast(address[0]):
+            network.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+
+    # Called every frame; sends a frame only when one is due
+    def publish(self, game):
+        now = self.time_source()
+        if now < self.next_frame and game is self.game:
+            return
+        if game is not self.game:
+            # A new match gets a new stream id so watchers drop the old boards
+            self.game = game
+            self.stream_id = random.getrandbits(32)
+            self.next_keyframe = now
+            self.events_sent = 0
+        self.next_frame = now + self.interval
+        keyframe = now >= self.next_keyframe
+        if keyframe:
+            self.next_keyframe = now + self.keyframe_interval
+        self.send(self.encode(game, keyframe))
+
+    def encode(self, game, keyframe):
+        color_index = {color: i + 1 for i, color in enumerate(game.SHAPE_COLORS)}
+        color_index[game.P2_COLOR] = snapshot.CELL_P2
+        rows = [pack_row([color_index.get(cell, 0) for cell in row]) for row in game.p1_grid]
+        rows += [pack_row([color_index.get(cell, 0) for cell in row]) for row in game.p2_grid]
+
+        self.seq += 1
+        parts = [HEADER.pack(MAGIC, VERSION, KIND_KEYFRAME if keyframe else KIND_DELTA,
+                             self.stream_id, self.seq)]
+        parts.append(STATE.pack(
+            game.score, game.p2_score, snapshot.pack_shape(game.p1_current_shape),
+            game.shape_pos[0], game.shape_pos[1], color_index.get(game.p1_current_color, 0),
+            game.SHAPES.index(game.p1_next_shape), color_index.get(game.p1_next_color, 0),
+            game.SHAPES.index(game.p2_next_shape), FLAG_GAME_OVER if game.game_over else 0))
+        if keyframe or self.sent_rows is None:
+            parts.extend(rows)
+        else:
+            changed = [i for i in range(2 * ROWS) if rows[i] != self.sent_rows[i]]
+            p1_mask = sum(1 << i for i in changed if i < ROWS)
+            p2_mask = sum(1 << (i - ROWS) for i in changed if i >= ROWS)
+            parts.append(ROW_MASKS.pack(p1_mask, p2_mask))
+            parts.extend(rows[i] for i in changed)
+        self.sent_rows = rows
+
+        log = game.sabotage_log
+        start = self.events_sent
+        if keyframe:
+            start = min(start, max(0, len(log) - KEYFRAME_EVENTS))
+        end = min(len(log), start + FRAME_EVENTS)
+        self.events_sent = max(self.events_sent, end)
+        parts.append(bytes([end - start]))
+        parts.extend(EVENT.pack(number, *log[number]) for number in range(start, end))
+        return b''.join(parts)
+
+    def send(self, packet):
+        try:
+            self.network.send_bytes(packet, self.address)
+        except OSError as error:
+            if not self.failed:
+                print(f"Spectator stream unavailable: {error}")
+                self.failed = True
+            return
+        self.packets += 1
+        self.bytes_sent += len(packet)
+
+
+# One game as last seen by a watcher
+class StreamView:
+    def __init__(self, source, stream_id):
+        self.source = source
+        self.stream_id = stream_id
+        self.seq = 0
+        self.valid = False  # False until a keyframe arrives, and again after a lost packet
+        self.rows = [[0] * COLUMNS for _ in range(2 * ROWS)]
+        self.state = None
+        self.last_seen = 0.0
+        self.events = deque(maxlen=8)  # (time received, player, sabotage index)
+        self.next_event = 0  # log position of the next sabotage event not yet seen
+
+
+# Receives spectator streams from any number of cabinets
+class SpectatorReceiver:
+    def __init__(self, port=SPECTATOR_PORT, group=None, time_source=time.monotonic):
+        self.time_source = time_source
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('', port))
+        if group:
+            membership = struct.pack('4s4s', socket.inet_aton(group), socket.inet_aton('0.0.0.0'))
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+        self.sock.setblocking(False)
+        self.streams = {}
+        self.dropped = 0
+
+    # Read every datagram waiting on the socket
+    def poll(self):
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            try:
+                self.handle(data, addr)
+            except (struct.error, IndexError, ValueError):
+                self.dropped += 1
+
+    def handle(self, data, addr):
+        magic, version, kind, stream_id, seq = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            self.dropped += 1
+            return
+        key = (addr, stream_id)
+        stream = self.streams.get(key)
+        if stream is None:
+            # A cabinet starting a new match replaces its previous stream
+            for old in [k for k in self.streams if k[0] == addr]:
+                del self.streams[old]
+            stream = self.streams[key] = StreamView(addr, stream_id)
+        now = self.time_source()
+        stream.last_seen = now
+
+        offset = HEADER.size
+        state = STATE.unpack_from(data, offset)
+        offset += STATE.size
+        if kind == KIND_KEYFRAME:
+            for i in range(2 * ROWS):
+                stream.rows[i] = unpack_row(data[offset:offset + ROW_BYTES])
+                offset += ROW_BYTES
+            stream.valid = True
+        else:
+            p1_mask, p2_mask = ROW_MASKS.unpack_from(data, offset)
+            offset += ROW_MASKS.size
+            mask = p1_mask | (p2_mask << ROWS)
+            # Deltas only apply on top of the frame right before them
+            if seq != stream.seq + 1:
+                stream.valid = False
+            for i in range(2 * ROWS):
+                if mask & (1 << i):
+                    stream.rows[i] = unpack_row(data[offset:offset + ROW_BYTES])
+                    offset += ROW_BYTES
+        stream.seq = seq
+        stream.state = state
+
+        count = data[offset]
+        offset += 1
+        for _ in range(count):
+            number, player, index = EVENT.unpack_from(data, offset)
+            offset += EVENT.size
+            if number >= stream.next_event:  # keyframes repeat events already seen
+                stream.events.append((now, player, index))
+                stream.next_event = number + 1
+
+    # Streams with a complete board that are still sending, oldest first
+    def live_streams(self):
+        now = self.time_source()
+        for key in [k for k, s in self.streams.items() if now - s.last_seen > STREAM_TIMEOUT]:
+            del self.streams[key]
+        return sorted((s for s in self.streams.values() if s.valid), key=lambda s: s.source)
+
+    def close(self):
+        self.sock.close()
+
+
+def is_multicast(host):
+    try:
+        return 224 <= int(host.split('.')[0]) <= 239
+    except ValueError:
+        return False
+
+
+# Parse "host:port" (port optional) into an address tuple
+def parse_address(text):
+    host, _, port = text.partition(':')
+    return host, int(port or SPECTATOR_PORT)
+
+
+# Load a stream into a TetrisGame instance that is only used for drawing
+def apply_stream(game, stream):
+    palette = [game.BLACK] + list(game.SHAPE_COLORS) + [game.P2_COLOR]
+    game.p1_grid = [[palette[cell] for cell in row] for row in stream.rows[:ROWS]]
+    game.p2_grid = [[palette[cell] for cell in row] for row in stream.rows[ROWS:]]
+    (game.score, game.p2_score, shape_mask, shape_x, shape_y, current_color, next_shape,
+     next_color, p2_next_shape, flags) = stream.state
+    game.p1_current_shape = snapshot.unpack_shape(shape_mask)
+    game.shape_pos = [shape_x, shape_y]
+    game.p1_current_color = palette[current_color]
+    game.p1_next_shape = game.SHAPES[next_shape]
+    game.p1_next_color = palette[next_color]
+    game.p2_next_shape = game.SHAPES[p2_next_shape]
+    game.game_over = bool(flags & FLAG_GAME_OVER)
+
+
+# Lobby display: shows each live match in turn, using the game's own board layout
+def watch(port=SPECTATOR_PORT, group=None):
+    import pygame
+    import screens
+    from hal import load_display
+    from tetris_game import TetrisGame
+
+    display = load_display()
+    pygame.init()
+    screen = display.open()
+    pygame.display.set_caption("Tetris - Live matches")
+    fonts = screens.ScreenFonts()
+    font = pygame.font.Font(None, 24)
+    clock = pygame.time.Clock()
+    view = TetrisGame(screen, None, None)  # drawing only
+    receiver = SpectatorReceiver(port, group)
+    shown = 0
+    switched_at = time.monotonic()
+
+    try:
+        running = True
+        while running:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                    running = False
+            display.update()
+            receiver.poll()
+            streams = receiver.live_streams()
+
+            screen.fill((0, 0, 0))
+            if not streams:
+                text = fonts.medium.render("Waiting for live matches...", True, screens.WHITE)
+                screen.blit(text, (10, 100))
+            else:
+                if time.monotonic() - switched_at >= LOBBY_CYCLE:
+                    shown += 1
+                    switched_at = time.monotonic()
+                stream = streams[shown % len(streams)]
+                apply_stream(view, stream)
+                view.draw_board()
+                score_text = font.render(f"Score: {view.score}", True, view.BLACK)
+                screen.blit(score_text, (view.PLAYER_DATA[1]['GRID_X'] + 50, 5))
+                label = font.render(f"{stream.source[0]}  ({shown % len(streams) + 1}/{len(streams)})",
+                                    True, view.GRAY)
+                screen.blit(label, (130, 220))
+                recent = [e for e in stream.events if time.monotonic() - e[0] < 2.0]
+                if recent:
+                    _, player, index = recent[-1]
+                    banner = font.render(f"P{player} sabotage {index + 1}!", True, screens.RED)
+                    screen.blit(banner, (130, 110))
+                if view.game_over:
+                    over = fonts.medium.render("GAME OVER", True, screens.RED)
+                    screen.blit(over, over.get_rect(center=(160, 120)))
+
+            pygame.display.flip()
+            clock.tick(WATCH_FPS)
+    finally:
+        receiver.close()
+        view.leaderboard.close()
+        pygame.quit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch live Tetris matches")
+    parser.add_argument('--port', type=int, default=int(os.getenv('TETRIS_SPECTATOR_PORT') or SPECTATOR_PORT),
+                        help="UDP port the cabinets broadcast to (default 5100)")
+    parser.add_argument('--group', default=os.getenv('TETRIS_SPECTATOR_GROUP'),
+                        help="multicast group to join, if the cabinets use multicast")
+    args = parser.parse_args()
+    watch(args.port, args.group)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import math
+import os
+import threading
+import time
+
+MIN_INTERVAL = 0.5     # seconds; the fastest sync frames are sent
+MAX_INTERVAL = 10.0    # seconds; a quiet board on a clean link is synced this often
+BYTE_BUDGET = 1000     # bytes per second of sync frames, all opponents and retries included
+TARGET_MISSED = 0.5    # lock events we accept losing, on average, between two sync frames
+LOSS_FLOOR = 0.01      # loss assumed on a clean link; a lost lock event is never acked, so unseen
+CHURN_WINDOW = 10.0    # seconds over which locks and line clears are averaged
+RTT_MULTIPLE = 2       # sync frames are never closer together than this many round trips
+RTT_GAIN = 0.125       # smoothing of the round trip estimate, as TCP's SRTT
+LOSS_GAIN = 0.1        # smoothing of the loss estimate, once it has 1 / LOSS_GAIN samples
+BYTES_GAIN = 0.25      # smoothing of the bytes a sync frame costs
+
+
+# Fixed sync cadence; leaves the game's sync_interval alone
+class NullSyncController:
+    enabled = False
+
+    def frame_sent(self, frame_number):
+        pass
+
+    def frame_done(self, frame_number, acked, attempts, sent_bytes):
+        pass
+
+    def board_changed(self, lines):
+        pass
+
+    def interval(self, current):
+        return current
+
+
+# Picks the time between sync frames. Sync frames correct an opponent's view that has
+# drifted because lock events (sent once, unacknowledged) were lost, so the view goes
+# stale at roughly churn x loss lock events per second; the interval is chosen so that
+# about TARGET_MISSED of them are missed between corrections. A quiet board or a clean
+# link backs off to max_interval, a busy board on a lossy link tightens towards
+# min_interval, and the byte budget and round trip time set hard lower bounds.
+#
+# Loss and round trip come from the sync frames' own acks: each frame reports how many
+# times it was sent, and only frames acked on the first try give an RTT sample (Karn's
+# algorithm), since a retried frame's ack could answer any of its copies. frame_done
+# runs on the network's sync thread; the estimates are plain floats updated under a
+# lock and read by the game loop.
+class SyncController:
+    enabled = True
+
+    def __init__(self, min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL, budget=BYTE_BUDGET,
+                 time_source=time.monotonic):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.budget = budget
+        self.time_source = time_source
+        self.lock = threading.Lock()
+        self.sent_at = {}  # sync frame number -> time sent
+        self.rtt = None
+        self.loss = 0.0
+        self.frame_bytes = None
+        self.frames = 0
+        self.lost_frames = 0
+        self.newest_acked = 0  # highest sync frame acknowledged so far
+        self.churn = 0.0  # locks and cleared lines per second, decayed over CHURN_WINDOW
+        self.churn_at = time_source()
+        self.current = max_interval
+
+    def frame_sent(self, frame_number):
+        self.sent_at[frame_number] = self.time_source()
+
+    # A sync frame was acknowledged by every opponent, or given up on
+    def frame_done(self, frame_number, acked, attempts, sent_bytes):
+        now = self.time_source()
+        sent_at = self.sent_at.pop(frame_number, None)
+        with self.lock:
+            if acked:
+                sample = (attempts - 1) / attempts
+                self.newest_acked = max(self.newest_acked, frame_number)
+            elif frame_number < self.newest_acked:
+                return  # superseded by a newer frame that did get through; not a loss
+            else:
+                sample = 1.0
+                self.lost_frames += 1
+            self.frames += 1
+            # A plain mean of the first samples, so a few rare sync frames already count
+            self.loss += max(LOSS_GAIN, 1 / self.frames) * (sample - self.loss)
+            if self.frame_bytes is None:
+                self.frame_bytes = float(sent_bytes)
+            else:
+                self.frame_bytes += BYTES_GAIN * (sent_bytes - self.frame_bytes)
+            if acked and attempts == 1 and sent_at is not None:
+                if self.rtt is None:
+                    self.rtt = now - sent_at
+                else:
+                    self.rtt += RTT_GAIN * (now - sent_at - self.rtt)
+
+    # A piece locked, clearing lines; a clear moves every row above it, so it counts extra
+    def board_changed(self, lines):
+        now = self.time_source()
+        self.churn = self.churn_rate(now) + (1 + lines) / CHURN_WINDOW
+        self.churn_at = now
+
+    def churn_rate(self, now):
+        return self.churn * math.exp(-(now - self.churn_at) / CHURN_WINDOW)
+
+    # Seconds until the next sync frame should go out
+    def interval(self, current=None):
+        churn = self.churn_rate(self.time_source())
+        with self.lock:
+            loss = max(self.loss, LOSS_FLOOR)
+            rtt = self.rtt or 0.0
+            frame_bytes = self.frame_bytes or 0.0
+        interval = TARGET_MISSED / (churn * loss) if churn > 0 else self.max_interval
+        interval = min(self.max_interval, max(self.min_interval, RTT_MULTIPLE * rtt, interval))
+        # The budget wins over max_interval: a cabinet with many opponents syncs less often
+        self.current = max(interval, frame_bytes / self.budget)
+        return self.current
+
+
+# Build the controller selected by TETRIS_SYNC ('fixed' keeps the fixed 10 second
+# cadence); TETRIS_SYNC_MIN, TETRIS_SYNC_MAX and TETRIS_SYNC_BUDGET (bytes/s) set its bounds
+def create_sync_controller(min_interval=None, max_interval=None, budget=None):
+    if os.getenv('TETRIS_SYNC') == 'fixed':
+        return NullSyncController()
+    return SyncController(
+        min_interval or float(os.getenv('TETRIS_SYNC_MIN') or MIN_INTERVAL),
+        max_interval or float(os.getenv('TETRIS_SYNC_MAX') or MAX_INTERVAL),
+        budget or float(os.getenv('TETRIS_SYNC_BUDGET') or BYTE_BUDGET))
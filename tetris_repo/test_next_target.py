@@ -0,0 +1,58 @@
+import os
+import tempfile
+import unittest
+from queue import Queue
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('TETRIS_SCORES_DB', ':memory:')
+
+import pygame
+import main
+from benchmark import NullNetwork
+from hal import KeyboardInput, ScriptedInput
+from tetris_game import TetrisGame
+
+OPPONENTS = [('10.0.0.2', 5000), ('10.0.0.3', 5000)]
+
+
+# Stands in for the SceneManager: press_button only needs the running game
+class GameManager:
+    def __init__(self, game):
+        self.game = game
+
+
+# The next target button cycles the sabotage target when pressed on an input backend
+class NextTargetTest(unittest.TestCase):
+    def setUp(self):
+        pygame.init()
+        self.game = TetrisGame(pygame.Surface((320, 240)), NullNetwork(), list(OPPONENTS))
+        self.game.opponents[0].score = 100  # the leader is the default target
+        main.manager = GameManager(self.game)
+
+    def tearDown(self):
+        main.manager = None
+        pygame.quit()
+
+    def test_keyboard(self):
+        backend = KeyboardInput()
+        main.register_buttons(backend)
+        self.assertIs(self.game.sabotage_target(), self.game.opponents[0])
+        backend.handle_event(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_2))
+        self.game.update(Queue())
+        self.assertIs(self.game.sabotage_target(), self.game.opponents[1])
+
+    def test_script(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as script:
+            script.write("0 next_target\n0 next_target\n")
+        self.addCleanup(os.unlink, script.name)
+        backend = ScriptedInput(script.name)
+        main.register_buttons(backend)
+        backend.start()
+        backend.thread.join(timeout=2)
+        self.game.update(Queue())
+        self.assertIs(self.game.sabotage_target(), self.game.opponents[0])
+        self.assertEqual(len(self.game.button_queue), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
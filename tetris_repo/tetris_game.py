@@ -2,15 +2,26 @@ import pygame
 import random
 from network import UDPNetwork
 import time
-import json
 from datetime import datetime
-from collections import deque
+from profiler import NullProfiler
+from input_ring import InputRing, REPEATABLE_ACTIONS
+from latency import NullLatencyTracker
+from sync_controller import NullSyncController
+from effects import Effect, EffectScheduler, SABOTAGE_EFFECTS
+from leaderboard import shared_leaderboard
+from score_store import ANONYMOUS
+from game_clock import SIMULATION_HZ
+from session import SNAPSHOT_RETRY, PEER_GIVE_UP, encode_snapshot_text, decode_snapshot_text, apply_peer_snapshot
+from opponents import Opponent, mini_board_layout, BOARD_HISTORY
+from board_codec import EMPTY_BOARD, board_rows, color_indices, encode_board_text, decode_board_text
 
 class TetrisGame:
     def __init__(self, screen, network, partner_address):
         self.screen = screen
         self.network = network
-        self.partner_address = partner_address
+        # One address per opponent; a two-player match may pass just the one address
+        self.partner_addresses = partner_address if isinstance(partner_address, list) else [partner_address]
+        self.partner_address = self.partner_addresses[0]
         
         # Constants
         self.PLAYER_DATA = {
@@ -62,24 +73,37 @@ class TetrisGame:
         
         # Game variables
         self.p1_grid = self.create_grid(1)
-        self.p2_grid = self.create_grid(2)
+        # Opponents' boards; the first is the large board of a two-player match (p2_*)
+        self.opponents = [Opponent(self, address) for address in self.partner_addresses]
+        self.opponent_by_address = {opponent.address: opponent for opponent in self.opponents}
+        self.target = None  # opponent picked for sabotage, or None for the leader
+        self.mini_font = None
         self.p1_current_shape = random.choice(self.SHAPES)
         self.p1_current_color = random.choice(self.SHAPE_COLORS)
         self.p1_next_shape = random.choice(self.SHAPES)
         self.p1_next_color = random.choice(self.SHAPE_COLORS)
-        self.p2_next_shape = random.choice(self.SHAPES)
         self.shape_pos = [self.PLAYER_DATA[1]['COLUMNS'] // 2 - len(self.p1_current_shape[0]) // 2, 0]
         self.frames_per_move = 30
         self.curr_frame = 0
         self.score = 0
-        self.p2_score = 0
+        self.lines = 0  # Lines cleared this game
+        self.ticks = 0  # Simulation ticks played, for the game's duration
         self.frame_number = 0
-        self.last_received_frame = -1
+        self.desyncs = 0  # sync frames that disagreed with our copy of the opponent's board
 
         self.last_sync_time = time.time()
-        self.sync_interval = 10  # 10 seconds
-        self.sync_frame_number = 0
+        self.sync_interval = 10  # 10 seconds, unless a sync controller adapts it
+        self.sync_controller = NullSyncController()
+        # Continue the socket's numbering so acks left over from the last game never match
+        self.sync_frame_number = network.last_sync_frame if network is not None else 0
         self.grid_bitmap = self.create_grid_bitmap()
+        # Color mirror for sync frames: the last BOARD_HISTORY boards sent but not yet
+        # acknowledged by every opponent, and the latest acknowledged one that the next
+        # board is encoded against
+        self.color_index = color_indices(self)
+        self.board_palette = [self.BLACK] + list(self.SHAPE_COLORS)
+        self.sent_boards = {}
+        self.board_base = None  # (sync frame number, rows)
 
         self.game_over = False 
         self.message_queue = None 
@@ -90,8 +114,13 @@ class TetrisGame:
         self.sabotage_increase_rate = 1  # Increase by 1 point per frame
         self.available_sabotages = []
 
-        self.sabotage_timer = 0
-        self.sabotage_duration = 10 * 60  # 10 seconds * 60 frames per second
+        # Sabotage effects run on the match clock shared with the opponent, so an effect
+        # expires at the same moment on both cabinets
+        self.match_time = time.monotonic
+        self.time_source = time.monotonic  # local clock for pauses; main uses the backend clock
+        self.effects = EffectScheduler(self)
+        self.sabotage_log = []  # (sending player, sabotage index) in order, for spectators
+        self.base_frames_per_move = self.frames_per_move
         self.original_frames_per_move = self.frames_per_move
         self.control_mapping = {
             pygame.K_UP: 'rotate',
@@ -99,8 +128,8 @@ class TetrisGame:
             pygame.K_LEFT: 'move_left',
             pygame.K_RIGHT: 'move_right'
         }
-        self.scramble_duration = 40 * 60  # 10 seconds * 60 frames per second
-        self.scramble_timer = 0
+        # The key behind each action, so gestures go through control_mapping like buttons
+        self.action_keys = {action: key for key, action in self.control_mapping.items()}
 
         self.show_leaderboard = False
         self.font_large = pygame.font.Font(None, 48)
@@ -111,8 +140,17 @@ class TetrisGame:
         self.initials = ["A", "A", "A"]  # Default initials
         self.initials_index = 0  # Current letter index being modified
         self.alphabet = [chr(i) for i in range(ord('A'), ord('Z') + 1)]
+        self.leaderboard = shared_leaderboard()  # Scores cached in memory, written in the background
 
-        self.button_queue = deque(maxlen=5)  # Limit queue size to prevent overflow
+        self.button_queue = InputRing()  # Written by the GPIO thread, drained once per tick
+        self.gesture_queue = InputRing()  # Written by the touchscreen thread
+        self.auto_repeat = None  # Optional AutoRepeat polling held buttons
+        self.session = None  # Optional Session watching the opponent's connection
+        self.waiting_for_peer = False  # paused until the opponent is back and has sent its snapshot
+        self.snapshot_requested_at = None
+
+        self.profiler = NullProfiler()
+        self.latency = NullLatencyTracker()
 
     # Create an empty grid for the specified player
     def create_grid(self, player):
@@ -215,46 +253,127 @@ class TetrisGame:
             "type": "game_state",
             "frame_number": self.frame_number,
             "piece_coordinates": piece_coordinates,
-            "next_shape": self.SHAPES.index(self.p1_next_shape)
+            "next_shape": self.SHAPES.index(self.p1_next_shape),
+            "color": self.color_index.get(self.p1_current_color, 1)
         }
-        self.network.send_message(game_state, self.partner_address)
-
-    # Apply the specified sabotage effect
-    def apply_sabotage(self, sabotage_index):
-        if sabotage_index == 0:  # First sabotage
-            self.p1_current_shape = random.choice(self.SHAPES)
-            self.p1_current_color = random.choice(self.SHAPE_COLORS)
-        elif sabotage_index == 1:  # Second sabotage
-            self.original_frames_per_move = self.frames_per_move
-            self.frames_per_move = max(1, self.frames_per_move - 15)
-            self.sabotage_timer = self.sabotage_duration    
-        elif sabotage_index == 2:  # Third sabotage
-            actions = list(self.control_mapping.values())
-            random.shuffle(actions)
-            self.control_mapping = dict(zip(self.control_mapping.keys(), actions))
-            self.scramble_timer = self.scramble_duration
+        # Encoded once and sent to every opponent
+        self.network.send_to_all(game_state, self.partner_addresses)
+
+    # Apply a sabotage received from the opponent. Older peers only send the index and
+    # send time, so the effect is rebuilt from those when it is missing.
+    def apply_sabotage(self, sabotage_index, started_at=None, effect=None):
+        if effect is None:
+            if started_at is None:
+                started_at = self.match_time()
+            effect = Effect.create(SABOTAGE_EFFECTS[sabotage_index], started_at)
+        self.effects.activate(effect)
+        self.sabotage_log.append((2, sabotage_index))
     
-    # Update Player 2's grid based on the received bitmap
-    def update_p2_grid(self, grid_bitmap):
+    # The first opponent's board, score and next piece, as drawn in a two-player match
+    @property
+    def p2_grid(self):
+        return self.opponents[0].grid
+
+    @p2_grid.setter
+    def p2_grid(self, grid):
+        self.opponents[0].grid = grid
+
+    @property
+    def p2_score(self):
+        return self.opponents[0].score
+
+    @p2_score.setter
+    def p2_score(self, score):
+        self.opponents[0].score = score
+
+    @property
+    def p2_next_shape(self):
+        return self.opponents[0].next_shape
+
+    @p2_next_shape.setter
+    def p2_next_shape(self, shape):
+        self.opponents[0].next_shape = shape
+
+    # The opponent a message came from. In a two-player match everything is from the one
+    # opponent, wherever it came from.
+    def opponent_at(self, addr):
+        if len(self.opponents) == 1:
+            return self.opponents[0]
+        return self.opponent_by_address.get(addr)
+
+    # Follow opponents to new addresses after a reconnect
+    def set_partner_addresses(self, addresses):
+        for opponent, address in zip(self.opponents, addresses):
+            opponent.address = address
+        self.partner_addresses = list(addresses)
+        self.partner_address = self.partner_addresses[0]
+        self.opponent_by_address = {opponent.address: opponent for opponent in self.opponents}
+
+    # Update an opponent's grid (by default Player 2's) based on the received bitmap
+    def update_p2_grid(self, grid_bitmap, opponent=None):
+        opponent = opponent or self.opponents[0]
+        grid = opponent.grid
         for row in range(self.PLAYER_DATA[2]['ROWS']):
             for col in range(self.PLAYER_DATA[2]['COLUMNS']):
                 if grid_bitmap[row] & (1 << (self.PLAYER_DATA[2]['COLUMNS'] - 1 - col)):
-                    self.p2_grid[row][col] = self.P2_COLOR
+                    if grid[row][col] == self.BLACK:
+                        grid[row][col] = self.P2_COLOR  # occupied, color unknown
                 else:
-                    self.p2_grid[row][col] = self.BLACK
+                    grid[row][col] = self.BLACK
+        opponent.version += 1
+
+    # Show the color board from an opponent's sync frame, rewriting only the rows that
+    # differ from what we show. Returns False when the frame has no board we can decode:
+    # an older peer's, or a delta against a board that never reached us.
+    def apply_p2_board(self, message, opponent):
+        base = message.get("board_base")
+        reference = EMPTY_BOARD if base is None else opponent.boards.get(base)
+        if "board" not in message or reference is None:
+            return False
+        try:
+            rows, _ = decode_board_text(message["board"], reference)
+        except (ValueError, IndexError):
+            return False
+        opponent.boards[message["frame_number"]] = rows
+        if len(opponent.boards) > BOARD_HISTORY:
+            del opponent.boards[min(opponent.boards)]
+        palette = self.board_palette
+        changed = False
+        for y, row in enumerate(rows):
+            colors = [palette[cell] for cell in row]
+            if opponent.grid[y] != colors:
+                opponent.grid[y] = colors
+                changed = True
+        if changed:
+            opponent.version += 1
+        return True
 
-    # Update Player 2's grid with the new piece and next shape
-    def update_p2_grid_piece(self, piece_coordinates, next_shape_index):
-        piece_color = self.P2_COLOR  
+    # Update an opponent's grid with their new piece and next shape
+    def update_p2_grid_piece(self, piece_coordinates, next_shape_index, opponent=None, color=None):
+        opponent = opponent or self.opponents[0]
+        piece_color = self.SHAPE_COLORS[color - 1] if color else self.P2_COLOR
         for x, y in piece_coordinates:
             if 0 <= y < self.PLAYER_DATA[2]['ROWS'] and 0 <= x < self.PLAYER_DATA[2]['COLUMNS']:
-                self.p2_grid[y][x] = piece_color
+                opponent.grid[y][x] = piece_color
         
         # Clear lines if necessary
-        self.p2_grid, cleared_lines = self.clear_lines(self.p2_grid, 2)
+        opponent.grid, cleared_lines = self.clear_lines(opponent.grid, 2)
         
-        # Update the next shape for Player 2
-        self.p2_next_shape = self.SHAPES[next_shape_index]
+        # Update the opponent's next shape
+        opponent.next_shape = self.SHAPES[next_shape_index]
+        opponent.version += 1
+
+    # Occupancy bitmap of an opponent's grid (by default Player 2's) as we currently show it
+    def p2_grid_bitmap(self, opponent=None):
+        columns = self.PLAYER_DATA[2]['COLUMNS']
+        bitmap = []
+        for row in (opponent or self.opponents[0]).grid:
+            bitmap_row = 0
+            for col, cell in enumerate(row):
+                if cell != self.BLACK:
+                    bitmap_row |= (1 << (columns - 1 - col))
+            bitmap.append(bitmap_row)
+        return bitmap
 
     # Create an empty grid bitmap
     def create_grid_bitmap(self):
@@ -276,21 +395,120 @@ class TetrisGame:
             "type": "sync_frame",
             "frame_number": self.sync_frame_number,
             "grid_bitmap": self.grid_bitmap,
-            "score": self.score  
+            "score": self.score,
+            "game_over": self.game_over
         }
-        self.network.send_sync_frame(sync_data, self.partner_address)
+        rows = board_rows(self.p1_grid, self.color_index)
+        base = self.board_base
+        # Opponents only keep the last BOARD_HISTORY boards they received, so a base from
+        # before those (acks lost, or a peer gone quiet) is replaced by a keyframe
+        if base is None or self.sync_frame_number - base[0] > BOARD_HISTORY:
+            sync_data["board"] = encode_board_text(rows)
+        else:
+            sync_data["board"] = encode_board_text(rows, base[1])
+            sync_data["board_base"] = base[0]
+        self.sent_boards[self.sync_frame_number] = rows
+        # Frames are numbered in send order; an ack for an evicted one is ignored
+        for frame in list(self.sent_boards)[:-BOARD_HISTORY]:
+            self.sent_boards.pop(frame, None)
+        self.sync_controller.frame_sent(self.sync_frame_number)
+        self.network.send_sync_frame(sync_data, self.partner_addresses, self.sync_done)
+
+    # A sync frame was acknowledged by every opponent or given up on; runs on the sync
+    # frame's sender thread
+    def sync_done(self, frame_number, acked, attempts, sent_bytes):
+        if acked:
+            self.board_acked(frame_number)
+        self.sync_controller.frame_done(frame_number, acked, attempts, sent_bytes)
+
+    # Every opponent has this sync frame's board; encode the next ones against it
+    def board_acked(self, frame_number):
+        rows = self.sent_boards.get(frame_number)
+        if rows is None or (self.board_base is not None and self.board_base[0] >= frame_number):
+            return
+        self.board_base = (frame_number, rows)
+        for frame in list(self.sent_boards):
+            if frame < frame_number:
+                self.sent_boards.pop(frame, None)
 
     # Process received messages from the message queue
     def process_messages(self):
         while not self.message_queue.empty():
-            message_type, message = self.message_queue.get()
+            message_type, message, addr = self.message_queue.get()
+            if message_type == "sabotage":
+                effect = Effect.decode(message["effect"]) if "effect" in message else None
+                self.apply_sabotage(message["index"], message.get("at"), effect)
+                continue
+            opponent = self.opponent_at(addr)
+            if opponent is None or opponent.forfeited:
+                continue  # not a player in this match, or no longer
             if message_type == "game_state":
-                self.update_p2_grid_piece(message["piece_coordinates"], message["next_shape"])
+                self.update_p2_grid_piece(message["piece_coordinates"], message["next_shape"], opponent,
+                                          message.get("color"))
             elif message_type == "sync_frame":
-                self.update_p2_grid(message["grid_bitmap"]) 
-                self.p2_score = message["score"]
-            elif message_type == "sabotage":
-                self.apply_sabotage(message["index"])    
+                if message["frame_number"] <= opponent.last_received_frame:
+                    continue  # a retransmission of a frame already applied
+                opponent.last_received_frame = message["frame_number"]
+                if message["grid_bitmap"] != self.p2_grid_bitmap(opponent):
+                    self.desyncs += 1  # the incremental updates had drifted from the opponent's board
+                if not self.apply_p2_board(message, opponent):
+                    self.update_p2_grid(message["grid_bitmap"], opponent)
+                opponent.score = message["score"]
+                opponent.game_over = message.get("game_over", False)
+            elif message_type == "snapshot":
+                apply_peer_snapshot(self, decode_snapshot_text(message["data"]), opponent)
+                if message.get("reply"):
+                    self.send_snapshot(addr)
+                self.waiting_for_peer = False
+
+    # Send our state in one datagram to one opponent, or to all of them asking for theirs in return
+    def send_snapshot(self, addr=None, reply=False):
+        message = {"type": "snapshot", "data": encode_snapshot_text(self)}
+        if reply:
+            message["reply"] = True
+        self.network.send_to_all(message, [addr] if addr else self.partner_addresses)
+
+    # Hold the match while an opponent who is still playing is unreachable. Once they are
+    # heard from again, possibly at a new address, trade snapshots; play resumes when theirs
+    # arrives, one round trip later. An opponent unreachable for PEER_GIVE_UP seconds
+    # forfeits and the others play on. Returns True while paused.
+    def check_peer(self):
+        session = self.session
+        now = self.time_source()
+        lost = forfeited = False
+        for link, opponent in zip(session.links, self.opponents):
+            if opponent.game_over or not link.lost:
+                opponent.lost_at = None
+            elif opponent.lost_at is None:
+                opponent.lost_at = now
+                lost = True
+            elif now - opponent.lost_at >= PEER_GIVE_UP:
+                self.forfeit(opponent)
+                forfeited = True
+            else:
+                lost = True
+        if lost:
+            self.waiting_for_peer = True
+            self.snapshot_requested_at = None
+            return True
+        if not self.waiting_for_peer:
+            return False
+        if forfeited:
+            # Only the forfeited opponent was missing; nobody else's board moved meanwhile
+            self.waiting_for_peer = False
+            return False
+        if self.snapshot_requested_at is None or now - self.snapshot_requested_at >= SNAPSHOT_RETRY:
+            self.set_partner_addresses(session.addresses)
+            self.send_snapshot(reply=True)
+            self.snapshot_requested_at = now
+        return True
+
+    # Give up on an unreachable opponent: their game ends where it stood
+    def forfeit(self, opponent):
+        opponent.forfeited = True
+        opponent.game_over = True
+        opponent.lost_at = None
+        opponent.version += 1
 
     # Calculate the score based on the number of lines cleared
     def calculate_score(self, lines_cleared):
@@ -305,14 +523,32 @@ class TetrisGame:
             return base_score * 4 * 10
         return 0
 
-    # Send a sabotage action to the other player
+    # The opponent the sabotage button hits: the one picked with next_target if they
+    # are still playing, otherwise the leader
+    def sabotage_target(self):
+        playing = [opponent for opponent in self.opponents if not opponent.game_over] or self.opponents
+        if self.target in playing:
+            return self.target
+        return max(playing, key=lambda opponent: opponent.score)
+
+    # Pick the next opponent still playing as the sabotage target
+    def next_target(self):
+        playing = [opponent for opponent in self.opponents if not opponent.game_over] or self.opponents
+        current = self.sabotage_target()
+        self.target = playing[(playing.index(current) + 1) % len(playing)]
+
+    # Send a sabotage action to the targeted opponent
     def send_sabotage(self, sabotage_index):
         if sabotage_index in self.available_sabotages:
+            effect = Effect.create(SABOTAGE_EFFECTS[sabotage_index], self.match_time())
             sabotage_message = {
                 "type": "sabotage",
-                "index": sabotage_index
+                "index": sabotage_index,
+                "at": effect.started_at,
+                "effect": effect.encode()
             }
-            self.network.send_message(sabotage_message, self.partner_address)
+            self.network.send_message(sabotage_message, self.sabotage_target().address)
+            self.sabotage_log.append((1, sabotage_index))
             self.sabotage_meter = 0  # Reset the meter after sending a sabotage
             self.available_sabotages = []
 
@@ -329,8 +565,9 @@ class TetrisGame:
             pygame.K_RIGHT: 'move_right'
         }    
 
-    # Perform the specified action (move, rotate, or sabotage)
-    def perform_action(self, action):
+    # Perform the specified action (move, rotate, or sabotage); timestamp is its capture time
+    def perform_action(self, action, timestamp=None):
+        self.latency.action_performed(action, timestamp)
         if action == 'rotate':
             if not self.game_over:
                 rotated_shape = self.rotate_shape(self.p1_current_shape)
@@ -362,84 +599,146 @@ class TetrisGame:
                 self.send_sabotage(1)
             elif self.sabotage_meter > self.sabotage_thresholds[0]:
                 self.send_sabotage(0)
+        elif action == 'next_target':
+            self.next_target()
 
     # Check if the current score qualifies for the leaderboard
     def check_leaderboard_entry(self):
-        scores = self.load_scores()
-        if self.score > min(score["score"] for score in scores):
-            return True
-        return False
+        return self.leaderboard.qualifies(self.score)
     
-    # Finalize the leaderboard entry and save it to the file
+    # Finalize the leaderboard entry; the game is saved to the score history in the background
     def finalize_leaderboard_entry(self):
         self.entering_initials = False
-        scores = self.load_scores()
 
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M")
-        score_entry = {
-            "date": timestamp,
-            "score": self.score,
-            "initials": "".join(self.initials)
-        }
+        self.leaderboard.add(self.score_entry("".join(self.initials)))
 
-        scores.append(score_entry)
-        scores.sort(key=lambda x: x["score"], reverse=True)
-        scores = scores[:5]  # Keep only the top 5 scores
+    # Record the game anonymously if its initials were never confirmed, e.g. the cabinet
+    # quit or a new match started on the initials screen
+    def abandon_leaderboard_entry(self):
+        if self.entering_initials:
+            self.entering_initials = False
+            self.leaderboard.add(self.score_entry(ANONYMOUS))
 
-        with open("highscores.json", "w") as file:
-            json.dump(scores, file, indent=2)
+    # Describe this game for the score history
+    def score_entry(self, initials):
+        return {
+            "date": datetime.now().strftime("%Y-%m-%d %H:%M"),
+            "score": self.score,
+            "initials": initials,
+            "lines": self.lines,
+            "duration": self.ticks / SIMULATION_HZ,
+            "opponent": ", ".join(address[0] for address in self.partner_addresses if address) or None
+        }
 
-    # Load the high scores from the JSON file
+    # Return the high scores, best first
     def load_scores(self):
-        try:
-            with open("highscores.json", "r") as file:
-                return json.load(file)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return []
+        return self.leaderboard.top()
     
-    # Handle key events for game controls
-    def handle_key_event(self, event):
+    # Handle key events for game controls; timestamp is the monotonic capture time in ns
+    def handle_key_event(self, event, timestamp=None):
         if event.type == pygame.KEYDOWN:
             if event.key in self.control_mapping:
                 action = self.control_mapping[event.key]
-                if self.game_over:
-                    self.button_queue.append(action)
-                elif not self.button_queue or self.button_queue[-1] != action:
-                    self.button_queue.append(action)
+                if self.game_over or self.button_queue.last_pending() != action:
+                    self.button_queue.push(action, timestamp)
             elif event.key == pygame.K_1:
-                self.button_queue.append("sabotage")
+                self.button_queue.push("sabotage", timestamp)
+            elif event.key == pygame.K_2 and len(self.opponents) > 1:
+                self.button_queue.push("next_target", timestamp)
+
+    # Queue an action recognized from a touch gesture; timestamp is its capture time in ns.
+    # The action goes through control_mapping like its button, so a scramble hits touch too.
+    def handle_gesture(self, action, timestamp=None):
+        key = self.action_keys.get(action)
+        if key is not None:
+            action = self.control_mapping.get(key, action)
+        self.gesture_queue.push(action, timestamp)
+
+    # Take every pending input from the button and gesture rings
+    def drain_inputs(self):
+        entries = self.button_queue.drain()
+        if len(self.gesture_queue):
+            entries.extend(self.gesture_queue.drain())
+        return entries
+
+    # Handle button presses on the game over, initials and leaderboard screens
+    def handle_menu_input(self):
+        for action, timestamp in self.drain_inputs():
+            if action == 'rotate':
+                self.perform_action(action, timestamp)
+            elif self.entering_initials and action in ('move_left', 'move_right'):
+                self.perform_action(action, timestamp)
 
 
-    # Update the game state, process messages, and handle game logic
-    def update(self, message_queue):
+    # Update the game state, process messages, and run the simulation ticks due this frame
+    def update(self, message_queue, clock=None):
         if self.game_over:
+            self.handle_menu_input()
             return False 
 
         # Check for received messages and perform corresponding actions
         self.message_queue = message_queue
+        self.profiler.record_queue_depth('message_queue', message_queue.qsize())
+        self.profiler.record_queue_depth('button_queue', len(self.button_queue))
+        self.profiler.record_overflows('button_queue', self.button_queue.overflows)
+        self.profiler.record_overflows('gesture_queue', self.gesture_queue.overflows)
+        self.profiler.begin('process_messages')
         self.process_messages()
+        self.profiler.end('process_messages')
 
-        # Handle sabotage timer
-        if self.sabotage_timer > 0:
-            self.sabotage_timer -= 1
-            if self.sabotage_timer == 0:
-                self.frames_per_move = self.original_frames_per_move
+        if self.session is not None and self.check_peer():
+            if clock is not None:
+                clock.reset()  # the paused time is not played back as a burst of ticks
+            return False
 
-        # Handle scramble timer
-        if self.scramble_timer > 0:
-            self.scramble_timer -= 1
-        if self.scramble_timer == 0:
-            self.reset_control_mapping()        
+        # Without a clock every rendered frame is one simulation tick
+        ticks = 1 if clock is None else clock.ticks_due()
+        for _ in range(ticks):
+            if self.tick():
+                return True
+
+        # Check if it's time to send a sync frame
+        current_time = time.time()
+        self.sync_interval = self.sync_controller.interval(self.sync_interval)
+        if current_time - self.last_sync_time >= self.sync_interval:
+            self.send_sync_frame()
+            self.last_sync_time = current_time
+
+        return False 
+
+    # Advance the game logic by one fixed simulation tick; returns True on game over
+    def tick(self):
+        # Expire sabotage effects once the match clock passes their deadline
+        if self.effects.heap:
+            self.effects.update(self.match_time())
 
         # Increase sabotage meter
         self.sabotage_meter = min(self.sabotage_meter + self.sabotage_increase_rate, self.max_sabotage_meter)
         self.update_available_sabotages()
 
-        # Process button queue
-        while self.button_queue:
-            action = self.button_queue.popleft()
-            self.perform_action(action)
+        # Process the inputs captured since the last tick, then auto-repeat held buttons
+        self.profiler.begin('input')
+        for action, timestamp in self.drain_inputs():
+            self.perform_action(action, timestamp)
+        if self.auto_repeat:
+            for key in self.auto_repeat.poll():
+                action = self.control_mapping.get(key)
+                if action in REPEATABLE_ACTIONS:
+                    self.perform_action(action)
+        self.profiler.end('input')
+
+        self.profiler.begin('gravity')
+        game_over = self.apply_gravity()
+        self.profiler.end('gravity')
+        if game_over:
+            return True
+
+        self.curr_frame = (self.curr_frame + 1) % 60
+        self.ticks += 1
+        return False
 
+    # Move the current piece down or lock it; returns True on game over
+    def apply_gravity(self):
         if self.curr_frame % self.frames_per_move == 0:
             max_fall_distance = self.calculate_max_fall_distance(self.p1_current_shape, self.shape_pos)    
 
@@ -455,9 +754,11 @@ class TetrisGame:
                 # Lock the piece in place
                 piece_coordinates = self.add_shape_to_grid(self.p1_grid, self.p1_current_shape, self.shape_pos, self.p1_current_color)
                 self.send_game_state(piece_coordinates)
-                self.update_grid_bitmap()
                 self.p1_grid, cleared = self.clear_lines(self.p1_grid, 1)
+                self.update_grid_bitmap()  # after clearing, so sync frames match the board the opponent rebuilds
+                self.sync_controller.board_changed(cleared)
                 self.score += self.calculate_score(cleared)
+                self.lines += cleared
                 self.p1_current_shape = self.p1_next_shape
                 self.p1_current_color = self.p1_next_color
                 self.p1_next_shape = random.choice(self.SHAPES)
@@ -469,18 +770,11 @@ class TetrisGame:
                     self.game_over = True
                     if self.check_leaderboard_entry():
                         self.entering_initials = True
+                    else:
+                        self.leaderboard.add(self.score_entry(ANONYMOUS))
                     self.send_sync_frame()
                     return True
-
-        self.curr_frame = (self.curr_frame + 1) % 60
-
-        # Check if it's time to send a sync frame
-        current_time = time.time()
-        if current_time - self.last_sync_time >= self.sync_interval:
-            self.send_sync_frame()
-            self.last_sync_time = current_time
-
-        return False 
+        return False
 
     # Draw the score for Player 2
     def draw_p2_score(self):
@@ -490,6 +784,22 @@ class TetrisGame:
         score_rect.topleft = (self.PLAYER_DATA[2]['GRID_X'] + 20, self.PLAYER_DATA[2]['NEXT_BLOCK_Y'])
         self.screen.blit(score_text, score_rect)
 
+    # Draw every opponent's mini-board; each is a cached surface redrawn only when it changed
+    def draw_opponents(self):
+        if self.mini_font is None:
+            self.mini_font = pygame.font.Font(None, 14)
+        target = self.sabotage_target()
+        cell, positions = mini_board_layout(len(self.opponents))
+        for opponent, position in zip(self.opponents, positions):
+            self.screen.blit(opponent.mini_board(self, cell, self.mini_font, opponent is target), position)
+
+    # Draw the notice shown while the match is paused for a lost opponent
+    def draw_waiting_for_peer(self):
+        text = self.font_small.render("Waiting for opponent...", True, (255, 255, 255))
+        text_rect = text.get_rect(center=(160, 120))
+        pygame.draw.rect(self.screen, (50, 50, 50), text_rect.inflate(20, 20))
+        self.screen.blit(text, text_rect)
+
     # Draw the game over screen
     def draw_game_over(self):
         # Create a semi-transparent overlay
@@ -521,12 +831,6 @@ class TetrisGame:
         text_rect = button_text.get_rect(center=button_rect.center)
         self.screen.blit(button_text, text_rect)
 
-        # Check for rotate button being pressed to go to the next screen
-        while self.button_queue:
-            action = self.button_queue.popleft()
-            if action == 'rotate':
-                self.perform_action(action)
-
     # Draw the initials input screen for high scores
     def draw_initials_input(self):
         self.screen.fill(self.BLACK)
@@ -543,16 +847,6 @@ class TetrisGame:
         underline_x = 50 + self.initials_index * 15
         pygame.draw.line(self.screen, self.WHITE, (underline_x, 130), (underline_x + 20, 130), 2)
 
-        # Loop to scroll and select letters
-        while self.button_queue:
-            action = self.button_queue.popleft()
-            if action == 'rotate':
-                self.perform_action(action)
-            elif action == 'move_left':
-                self.perform_action(action)
-            elif action == 'move_right':
-                self.perform_action(action)            
-
     # Draw the leaderboard screen
     def draw_leaderboard(self):
         # Create a semi-transparent overlay
@@ -561,29 +855,42 @@ class TetrisGame:
         overlay.fill((0, 0, 0))
         self.screen.blit(overlay, (0, 0))
 
-        # Draw leaderboard background
-        leaderboard_rect = pygame.Rect(40, 20, 240, 200)
-        pygame.draw.rect(self.screen, (50, 50, 50), leaderboard_rect)
-
-        # Draw leaderboard title
-        title_text = self.font_medium.render("Leaderboard", True, (255, 255, 255))
-        title_rect = title_text.get_rect(centerx=160, top=30)
-        self.screen.blit(title_text, title_rect)
-
-        # Draw high scores from the JSON file
-        scores = self.load_scores()
-        for i, score in enumerate(scores[:10], 1):
-            score_text = self.font_small.render(f"{i}. {score['initials']} - {score['score']}", True, (255, 255, 255))
-            self.screen.blit(score_text, (60, 60 + i * 30))
+        # Draw the pre-rendered leaderboard panel
+        self.screen.blit(self.leaderboard.surface(self.font_medium, self.font_small), (40, 20))
 
     # Main drawing function to render the game state
     def draw(self):
+        self.draw_board()
+
+        if self.entering_initials:
+            # Draw initials entry screen if the player is entering initials
+            self.draw_initials_input()
+            return  
+
+        # Draw game over screen
+        if self.game_over:
+            self.draw_game_over()
+            self.draw_check_leaderboard_button()
+
+            if self.show_leaderboard:
+                self.draw_leaderboard()
+
+        else:
+            self.draw_status()
+            if self.waiting_for_peer:
+                self.draw_waiting_for_peer()
+
+    # Draw both grids, the next blocks, the opponent's score and the falling piece
+    def draw_board(self):
         self.screen.fill(self.WHITE)
         self.draw_grid(self.p1_grid, 1)
-        self.draw_grid(self.p2_grid, 2)
         self.draw_next_block(self.p1_next_shape, self.p1_next_color, 1)
-        self.draw_next_block(self.p2_next_shape, self.GRAY, 2) 
-        self.draw_p2_score()
+        if len(self.opponents) == 1:
+            self.draw_grid(self.p2_grid, 2)
+            self.draw_next_block(self.p2_next_shape, self.GRAY, 2) 
+            self.draw_p2_score()
+        else:
+            self.draw_opponents()
         
         for y, row in enumerate(self.p1_current_shape):
             for x, cell in enumerate(row):
@@ -597,54 +904,42 @@ class TetrisGame:
                          self.PLAYER_DATA[1]['GRID_Y'] + (self.shape_pos[1] + y) * self.PLAYER_DATA[1]['GRID_SIZE'], 
                          self.PLAYER_DATA[1]['GRID_SIZE'], self.PLAYER_DATA[1]['GRID_SIZE']), 1)
 
-        if self.entering_initials:
-            # Draw initials entry screen if the player is entering initials
-            self.draw_initials_input()
-            return  
-
-        # Draw game over screen
-        if self.game_over:
-            self.draw_game_over()
-            self.draw_check_leaderboard_button()
-
-            if self.show_leaderboard:
-                self.draw_leaderboard()
-
-        else:
-            # Draw score
-            font = pygame.font.Font(None, 24)
-            score_text = font.render(f"Score: {self.score}", True, self.BLACK)
-            score_rect = score_text.get_rect()
-            score_rect.topleft = (self.PLAYER_DATA[1]['GRID_X'] + 50, 5)
-            self.screen.blit(score_text, score_rect)    
-
-            # Draw vertical sabotage meter
-            meter_width = 20
-            meter_height = 150
-            meter_x = self.PLAYER_DATA[1]['GRID_X'] + self.PLAYER_DATA[1]['COLUMNS'] * self.PLAYER_DATA[1]['GRID_SIZE'] + 20
-            meter_y = self.PLAYER_DATA[1]['GRID_Y'] + 50
-
-            # Draw meter outline
-            pygame.draw.rect(self.screen, self.GRAY, (meter_x, meter_y, meter_width, meter_height), 1)
-
-            # Calculate fill height based on sabotage meter value
-            fill_height = int(self.sabotage_meter / self.max_sabotage_meter * meter_height)
-
-            # Draw meter fill
-            pygame.draw.rect(self.screen, (255, 0, 0), (meter_x, meter_y + meter_height - fill_height, meter_width, fill_height))
-
-            # Draw threshold indicators
-            threshold_color = (0, 255, 255)  # Cyan color for threshold lines
-            threshold_thickness = 2
-            for threshold in self.sabotage_thresholds:
-                threshold_y = meter_y + meter_height - int(threshold / self.max_sabotage_meter * meter_height)
-                pygame.draw.line(self.screen, threshold_color, 
-                                (meter_x, threshold_y), 
-                                (meter_x + meter_width, threshold_y), 
-                                threshold_thickness)
-
-            # Draw available sabotages
-            font = pygame.font.Font(None, 24)
-            for i, sabotage in enumerate(self.available_sabotages):
-                text = font.render(f"Sabotage {sabotage + 1}", True, (255, 0, 0))
-                self.screen.blit(text, (meter_x + meter_width + 5, meter_y + i * 25))    
\ No newline at end of file
+    # Draw the score, sabotage meter and available sabotages during play
+    def draw_status(self):
+        # Draw score
+        font = pygame.font.Font(None, 24)
+        score_text = font.render(f"Score: {self.score}", True, self.BLACK)
+        score_rect = score_text.get_rect()
+        score_rect.topleft = (self.PLAYER_DATA[1]['GRID_X'] + 50, 5)
+        self.screen.blit(score_text, score_rect)    
+
+        # Draw vertical sabotage meter
+        meter_width = 20
+        meter_height = 150
+        meter_x = self.PLAYER_DATA[1]['GRID_X'] + self.PLAYER_DATA[1]['COLUMNS'] * self.PLAYER_DATA[1]['GRID_SIZE'] + 20
+        meter_y = self.PLAYER_DATA[1]['GRID_Y'] + 50
+
+        # Draw meter outline
+        pygame.draw.rect(self.screen, self.GRAY, (meter_x, meter_y, meter_width, meter_height), 1)
+
+        # Calculate fill height based on sabotage meter value
+        fill_height = int(self.sabotage_meter / self.max_sabotage_meter * meter_height)
+
+        # Draw meter fill
+        pygame.draw.rect(self.screen, (255, 0, 0), (meter_x, meter_y + meter_height - fill_height, meter_width, fill_height))
+
+        # Draw threshold indicators
+        threshold_color = (0, 255, 255)  # Cyan color for threshold lines
+        threshold_thickness = 2
+        for threshold in self.sabotage_thresholds:
+            threshold_y = meter_y + meter_height - int(threshold / self.max_sabotage_meter * meter_height)
+            pygame.draw.line(self.screen, threshold_color, 
+                            (meter_x, threshold_y), 
+                            (meter_x + meter_width, threshold_y), 
+                            threshold_thickness)
+
+        # Draw available sabotages
+        font = pygame.font.Font(None, 24)
+        for i, sabotage in enumerate(self.available_sabotages):
+            text = font.render(f"Sabotage {sabotage + 1}", True, (255, 0, 0))
+            self.screen.blit(text, (meter_x + meter_width + 5, meter_y + i * 25))    
\ No newline at end of file